@@ -53,7 +53,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.ShardRoutingMiddleware',
+    'core.middleware.PathRoutedMiddleware',
+]
+
+# The rest of the chain depends on the path (core.middleware). The API
+# authenticates with tokens and skips sessions, CSRF, auth and messages.
+LEAN_MIDDLEWARE_PATHS = ['/api/']
+LEAN_MIDDLEWARE = [
+    'core.middleware.RequestSamplingMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+FULL_MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,6 +78,51 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# API responses gzipped when the client accepts it (core.middleware)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_CONTENT_TYPES = ['application/json', 'text/']
+
+# A sample of the API requests written to rotating JSONL files for the
+# replay_traffic command (core.recording), 0 records none. Outside of
+# MEDIA_ROOT and STATIC_ROOT, the proxy must not serve them.
+REQUEST_SAMPLE_RATE = float(os.environ.get('REQUEST_SAMPLE_RATE', 0))
+REQUEST_SAMPLE_DIR = os.environ.get('REQUEST_SAMPLE_DIR', '/tmp/requests')
+REQUEST_SAMPLE_MAX_BYTES = 64 * 2 ** 20
+REQUEST_SAMPLE_MAX_FILES = 50
+REQUEST_SAMPLE_QUEUE_SIZE = 10000
+REQUEST_SAMPLE_MAX_BODY = 64 * 2 ** 10
+
+# the admin looks for its middleware in MIDDLEWARE only, core.checks looks
+# in FULL_MIDDLEWARE, where PathRoutedMiddleware runs them
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
+# Admin of the large tables (core.admin): tables above this many rows
+# are counted from the planner statistics, actions delete in batches
+ADMIN_EXACT_COUNT_LIMIT = 10000
+ADMIN_ACTION_BATCH_SIZE = 1000
+
+# Tag and ingredient autocomplete (recipe.autocomplete): names of up to
+# AUTOCOMPLETE_CACHE_USERS users, kept in each worker while unchanged
+AUTOCOMPLETE_CACHE_USERS = 1000
+AUTOCOMPLETE_CACHE_MAX_NAMES = 5000
+AUTOCOMPLETE_CACHE_SECONDS = 300
+AUTOCOMPLETE_VERSION_CACHE = 'node'
+
+# recipes repointed per transaction when tags or ingredients are merged
+MERGE_BATCH_SIZE = 1000
+
+# users deleted from the admin are disabled at once, their rows deleted
+# by process_user_deletions in batches (core.deletion)
+USER_DELETION_BATCH_SIZE = 500
+USER_DELETION_LEASE_SECONDS = 300
+
+# Background jobs (core.jobs), run by the run_worker command
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', 4))
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF_SECONDS = 10
+JOB_RETRY_BACKOFF_MAX = 3600
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -82,20 +143,140 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+# threads per ASGI worker process running the sync views, each keeps
+# its own persistent database connection (APP_SERVER=asgi, run.sh)
+ASGI_SYNC_THREADS = int(os.environ.get('ASGI_SYNC_THREADS', 8))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# core.db.postgresql adds health checks on top of Django's persistent
+# connections (CONN_MAX_AGE) and bounds the connections in use at once by
+# the threads of a process (DB_POOL_MAX_CONNECTIONS, core.db.pool).
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))
+        ),
+        'POOL_MAX_CONNECTIONS': int(
+            os.environ.get('DB_POOL_MAX_CONNECTIONS', 0)
+        ) or None,
+        'POOL_TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            # detect peers that vanished during a failover
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 3,
+        },
     }
 }
 
+# Read replicas, one alias per host in DB_REPLICA_HOSTS. Locally
+# DB_REPLICA_HOSTS=db gives a second alias standing in for a replica.
+REPLICA_DATABASES = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+    start=1,
+):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+# Shards for user owned rows, DB_SHARDS is a comma separated list of
+# host/name (or just name, on DB_HOST). default is always the first
+# shard and keeps the users created before sharding was enabled.
+SHARD_DATABASES = []
+for index, shard in enumerate(
+    filter(None, os.environ.get('DB_SHARDS', '').split(',')),
+    start=1,
+):
+    host, _, name = shard.rpartition('/')
+    alias = f'shard_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'NAME': name,
+    }
+    SHARD_DATABASES.append(alias)
+if SHARD_DATABASES:
+    SHARD_DATABASES.insert(0, 'default')
+
+# aliases of the test settings (app.test_settings) that only the test
+# cases listing them use, core.db.used_databases leaves them out
+TEST_DATABASES = []
+
+DATABASE_ROUTERS = [
+    'core.db.routers.ShardRouter',
+    'core.db.routers.ReplicaRouter',
+]
+
+# how long a client reads from the primary after writing
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 2))
+# must be shared by all workers, see CACHES
+REPLICA_PIN_CACHE = 'node'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# 'node' is shared by every worker process on the host
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'node': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('NODE_CACHE_DIR', '/tmp/django-node-cache'),
+    },
+}
+
+# Health probes, answered by core.middleware.HealthCheckMiddleware
+HEALTH_LIVE_PATH = '/health/live'
+HEALTH_READY_PATH = '/health/ready'
+# readiness runs the dependency checks at most once per interval
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', 2))
+READINESS_TIMEOUT = float(os.environ.get('READINESS_TIMEOUT', 2))
+
+# Slow query log, disabled unless SLOW_QUERY_THRESHOLD_MS is set.
+# EXPLAIN ANALYZE runs the SELECT a second time, so it's opt-in.
+SLOW_QUERY_THRESHOLD_MS = (
+    float(os.environ['SLOW_QUERY_THRESHOLD_MS'])
+    if os.environ.get('SLOW_QUERY_THRESHOLD_MS') else None
+)
+SLOW_QUERY_EXPLAIN_ANALYZE = bool(
+    int(os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', 0))
+)
+SLOW_QUERY_LOG_MAX_ROWS = int(os.environ.get('SLOW_QUERY_LOG_MAX_ROWS', 1000))
+
+
+# The first hasher makes the new hashes, the others check older ones.
+# PASSWORD_HASH_ITERATIONS comes from the calibrate_hasher command, it
+# defaults to Django's count.
+PASSWORD_HASHERS = [
+    'core.hashers.CalibratedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get('PASSWORD_HASH_ITERATIONS', 260000)
+)
+# hashes computed at once by a worker, the rest of the logins wait
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -134,10 +315,32 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/static/'
-MEDIA_URL = '/static/media/'
+# served to the owners of the recipes by recipe.views.MediaView
+MEDIA_URL = '/api/media/'
 
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
+# collectstatic writes hashed names and their gzip variants, the proxy
+# sends them as they are and caches them forever
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
+# recipe images stored once per content, named by their hash
+# (core.storage), the upload handlers hash them as they arrive
+CONTENT_ADDRESSED_MEDIA = bool(
+    int(os.environ.get('CONTENT_ADDRESSED_MEDIA', 1))
+)
+FILE_UPLOAD_HANDLERS = [
+    'core.storage.HashingMemoryFileUploadHandler',
+    'core.storage.HashingTemporaryFileUploadHandler',
+]
+
+# MediaView hands the file transfer to the proxy with an X-Accel-Redirect
+# to this internal location. Empty, Django sends the files (development).
+MEDIA_ACCEL_REDIRECT_URL = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_URL', '' if DEBUG else '/protected-media/'
+)
+# the names are uuids or content hashes, a file never changes
+MEDIA_CACHE_CONTROL = 'private, max-age=31536000, immutable'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -148,8 +351,28 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.SharedTokenBucketThrottle',
+    ],
+    # per client and endpoint, views map actions to stricter scopes
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '100/min'),
+        'user': os.environ.get('THROTTLE_USER_RATE', '600/min'),
+        'upload': os.environ.get('THROTTLE_UPLOAD_RATE', '20/min'),
+        'bulk': os.environ.get('THROTTLE_BULK_RATE', '10/min'),
+    },
 }
 
+# Buckets of core.throttling, a file mapped by every worker of the node
+THROTTLE_FILE = os.environ.get('THROTTLE_FILE', '/tmp/django-throttle')
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
-}
\ No newline at end of file
+}
+
+# Serve the schema generated once per worker (core.schema). With
+# SCHEMA_CACHE_DIR set, workers share the files written by build_schema.
+SCHEMA_CACHE = bool(int(os.environ.get('SCHEMA_CACHE', 1)))
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR')
+SCHEMA_CACHE_CONTROL = 'public, no-cache'
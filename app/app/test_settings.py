@@ -0,0 +1,30 @@
+"""
+Django settings for the tests:
+python manage.py test --settings=app.test_settings
+"""
+import os
+import tempfile
+
+from app.settings import *  # noqa: F401, F403
+from app.settings import DATABASES
+
+# A mirror of default standing in for a lagging replica (it doesn't see
+# the writes of the test transaction) and a second database for the
+# sharding tests. Only the test cases listing them in their databases
+# use them, nothing routes there by default.
+TEST_DATABASES = []
+for alias, test_settings in (
+    ('replica_1', {'TEST': {'MIRROR': 'default'}}),
+    ('shard_1', {'NAME': f'{DATABASES["default"]["NAME"]}_shard_1'}),
+):
+    if alias not in DATABASES:
+        DATABASES[alias] = {**DATABASES['default'], **test_settings}
+        TEST_DATABASES.append(alias)
+
+# fresh throttle buckets per test run, removed when it exits
+_throttle_dir = tempfile.TemporaryDirectory(prefix='django-throttle-')
+THROTTLE_FILE = os.path.join(_throttle_dir.name, 'buckets')
+
+# the tests render pages without running collectstatic, the manifest
+# storage would refuse every name missing from its manifest
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
@@ -14,28 +14,26 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from drf_spectacular.views import(
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
 
+from core.lazy import lazy_view
+from recipe.views import MediaView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/schema', SpectacularAPIView.as_view(), name='api_schema'),
+    # the schema machinery is imported on the first schema request
+    path('api/schema', lazy_view('core.schema.CachedSpectacularAPIView'),
+         name='api_schema'),
     path('api/docs/',
-         SpectacularSwaggerView.as_view(url_name="api_schema"),
+         lazy_view('drf_spectacular.views.SpectacularSwaggerView',
+                   url_name="api_schema"),
          name='api-docs'
          ),
     path('api/user/', include('user.urls')),
-    path('api/recipe/', include('recipe.urls'))
+    path('api/recipe/', include('recipe.urls')),
+    # in development too: the images are not public
+    path(settings.MEDIA_URL.lstrip('/') + '<path:name>',
+         MediaView.as_view(), name='media'),
 ]
-
-if settings.DEBUG:
-	urlpatterns += static(
-		settings.MEDIA_URL,
-		document_root = settings.MEDIA_ROOT,
-		)
\ No newline at end of file
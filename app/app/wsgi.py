@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+from core.readiness import warm_up, connect_databases  # noqa: E402
+
+# uwsgi loads the app in the master before forking the workers, so
+# connections are opened after the fork, by each worker
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    warm_up()
+else:
+    warm_up(connect=False)
+    postfork(connect_databases)
+    # objects loaded so far are shared with the workers, keep the
+    # collector from touching (and so copying) their memory pages
+    gc.freeze()
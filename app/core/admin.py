@@ -2,14 +2,23 @@
 Customização do admin do core
 '''
 
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.functional import cached_property
 
 # essa biblioteca é importante para questões de tradução uma vez implementada no admin
 # não precisamos implementar novamente. Boas Praticas.
 from django.utils.translation import gettext_lazy as _
 
 from core import models
+from core.db.sharding import sharding_enabled
+from core.deletion import request_deletion
+from core.jobs import retry
 
 
 class UserAdmin(BaseUserAdmin):
@@ -35,6 +44,7 @@ class UserAdmin(BaseUserAdmin):
     )
     # impede que os campos sejam modificados
     readonly_fields = ['last_login']
+    actions = ['delete_in_background']
     add_fieldsets = (
         (None, {
         'classes': ('wide',),
@@ -50,7 +60,225 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    # deleting a user disables it, process_user_deletions removes its
+    # rows in batches, see core.deletion
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_deleted_objects(self, objs, request):
+        '''the users only, collecting their rows is the slow part'''
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return [str(obj) for obj in objs], {}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        request_deletion(obj)
+
+    def response_delete(self, request, obj_display, obj_id):
+        self.message_user(
+            request,
+            _('%(user)s was disabled, its data is deleted in the '
+              'background.') % {'user': obj_display},
+            messages.SUCCESS,
+        )
+        return HttpResponseRedirect(reverse('admin:core_user_changelist'))
+
+    @admin.action(
+        permissions=['delete'],
+        description=_('Delete selected users in the background'),
+    )
+    def delete_in_background(self, request, queryset):
+        for user in queryset:
+            request_deletion(user)
+        self.message_user(
+            request,
+            _('Disabled %(count)d users, their data is deleted in the '
+              'background.') % {'count': len(queryset)},
+            messages.SUCCESS,
+        )
+
+
+def estimated_count(queryset):
+    '''rows of the table from the planner statistics, None if unknown'''
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # -1 or 0 until the table is first analyzed
+    return int(row[0]) if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    The unfiltered changelist of a large table is counted from the
+    planner statistics, COUNT(*) reads the whole table.
+    '''
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate and estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    '''
+    Admin for tables too big to count, list or delete in one go: counts
+    are estimated, filtered results are counted once and deleting goes
+    through batches instead of the collecting confirmation page.
+    '''
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ['user']
+    list_select_related = ['user']
+    ordering = ['-id']
+    actions = ['delete_in_batches']
+
+    def get_list_select_related(self, request):
+        # with sharding the users live in another database, no join
+        if sharding_enabled():
+            return False
+        return super().get_list_select_related(request)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(
+        permissions=['delete'],
+        description=_('Delete selected %(verbose_name_plural)s in batches'),
+    )
+    def delete_in_batches(self, request, queryset):
+        ids = queryset.order_by('pk').values_list('pk', flat=True)
+        deleted, last = 0, None
+        while True:
+            # keyset pages, no cursor stays open while rows go away
+            page = ids if last is None else ids.filter(pk__gt=last)
+            batch = list(page[:settings.ADMIN_ACTION_BATCH_SIZE])
+            if not batch:
+                break
+            deleted += self._delete_batch(queryset, batch)
+            last = batch[-1]
+
+        self.message_user(
+            request,
+            _('Deleted %(count)d %(name)s.') % {
+                'count': deleted,
+                'name': self.model._meta.verbose_name_plural,
+            },
+            messages.SUCCESS,
+        )
+
+    def _delete_batch(self, queryset, ids):
+        '''one short transaction per batch, with the m2m rows'''
+        model = queryset.model
+        with transaction.atomic(using=queryset.db):
+            _, per_model = model.objects.using(queryset.db).filter(
+                pk__in=ids
+            ).delete()
+        return per_model.get(model._meta.label, 0)
+
+
+class RecipeAdmin(LargeTableAdmin):
+    '''recipes, tags and ingredients picked by search, never listed'''
+
+    list_display = ['title', 'user', 'time_minutes', 'price']
+    autocomplete_fields = ['tags', 'ingredients']
+    # prefix searches use the indexes of migration 0005
+    search_fields = ['^title']
+
+
+class RecipeAttrAdmin(LargeTableAdmin):
+    '''tags and ingredients, searched by the recipe autocomplete too'''
+
+    list_display = ['name', 'user']
+    search_fields = ['^name']
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    '''browse the slow query log, entries are read only'''
+
+    ordering = ['-id']
+    list_display = ['created_at', 'duration_ms', 'method', 'view', 'path']
+    list_filter = ['view', 'method', 'database']
+    search_fields = ['path', 'sql']
+    readonly_fields = [
+        'created_at', 'duration_ms', 'database', 'view', 'method',
+        'path', 'sql', 'plan',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class UserDeletionAdmin(admin.ModelAdmin):
+    '''progress of the users deleted in the background'''
+
+    ordering = ['-id']
+    list_display = [
+        'email', 'requested_at', 'started_at', 'finished_at',
+        'deleted_rows', 'deleted_files',
+    ]
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class JobAdmin(admin.ModelAdmin):
+    '''background jobs, read only, failed ones can be queued again'''
+
+    ordering = ['-id']
+    list_display = [
+        'id', 'name', 'status', 'attempts', 'run_after',
+        'created_at', 'finished_at', 'locked_by',
+    ]
+    list_filter = ['status', 'name']
+    search_fields = ['name']
+    readonly_fields = [
+        'name', 'kwargs', 'status', 'attempts', 'max_attempts',
+        'run_after', 'locked_until', 'locked_by', 'last_error',
+        'created_at', 'finished_at',
+    ]
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(permissions=['change'], description=_('Retry failed jobs'))
+    def retry_jobs(self, request, queryset):
+        self.message_user(
+            request,
+            _('Queued %(count)d jobs again.') % {'count': retry(queryset)},
+            messages.SUCCESS,
+        )
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
\ No newline at end of file
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
+admin.site.register(models.UserDeletion, UserDeletionAdmin)
+admin.site.register(models.Job, JobAdmin)
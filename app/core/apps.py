@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.models.signals import (
+            post_delete,
+            post_init,
+            post_migrate,
+            post_save,
+            pre_delete,
+        )
+
+        from core import checks  # noqa: F401, registers the checks
+        from core import storage
+        from core.db import sharding
+        from core.models import Recipe
+
+        post_migrate.connect(sharding.reserve_id_ranges, sender=self)
+        pre_delete.connect(
+            sharding.delete_rows_of_deleted_user,
+            sender=settings.AUTH_USER_MODEL,
+        )
+        # reference counts of the content addressed images
+        post_init.connect(storage.image_loaded, sender=Recipe)
+        post_save.connect(storage.image_saved, sender=Recipe)
+        post_delete.connect(storage.image_deleted, sender=Recipe)
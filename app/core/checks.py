@@ -0,0 +1,53 @@
+"""
+System checks of the project
+"""
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.utils.module_loading import import_string
+
+PATH_ROUTED_MIDDLEWARE = 'core.middleware.PathRoutedMiddleware'
+ADMIN_MIDDLEWARE = (
+    ('django.contrib.auth.middleware.AuthenticationMiddleware', 'core.E001'),
+    ('django.contrib.messages.middleware.MessageMiddleware', 'core.E002'),
+    ('django.contrib.sessions.middleware.SessionMiddleware', 'core.E003'),
+)
+
+
+def _contains_subclass(class_path, middleware_paths):
+    '''like the admin check, a subclass of class_path counts too'''
+    cls = import_string(class_path)
+    for path in middleware_paths:
+        try:
+            middleware = import_string(path)
+        except ImportError:
+            continue
+        if isinstance(middleware, type) and issubclass(middleware, cls):
+            return True
+    return False
+
+
+@checks.register(checks.Tags.admin)
+def check_admin_middleware(app_configs=None, **kwargs):
+    '''
+    admin.E408 to E410 look for the admin middleware in MIDDLEWARE, they
+    are silenced: PathRoutedMiddleware runs them from FULL_MIDDLEWARE.
+    Look for them there instead.
+    '''
+    if not apps.is_installed('django.contrib.admin'):
+        return []
+    if PATH_ROUTED_MIDDLEWARE in settings.MIDDLEWARE:
+        middleware_paths = settings.FULL_MIDDLEWARE
+        setting = 'FULL_MIDDLEWARE'
+    else:
+        middleware_paths = settings.MIDDLEWARE
+        setting = 'MIDDLEWARE'
+    return [
+        checks.Error(
+            f"'{class_path}' must be in {setting} in order to use the admin "
+            f"application.",
+            id=check_id,
+        )
+        for class_path, check_id in ADMIN_MIDDLEWARE
+        if not _contains_subclass(class_path, middleware_paths)
+    ]
@@ -0,0 +1,9 @@
+from django.conf import settings
+
+
+def used_databases():
+    '''the aliases of DATABASES the app uses, not the test only ones'''
+    return [
+        alias for alias in settings.DATABASES
+        if alias not in settings.TEST_DATABASES
+    ]
@@ -0,0 +1,102 @@
+"""
+Connection reuse helpers shared by the database backends
+"""
+import threading
+
+from django.db.utils import OperationalError
+
+
+class PooledConnectionMixin:
+    '''
+    Health checked, bounded persistent connections.
+
+    Reuse needs CONN_MAX_AGE > 0. When CONN_HEALTH_CHECKS is on, a reused
+    connection is pinged once per request before its first query, so a
+    connection broken by a failover is replaced instead of failing the
+    request.
+
+    POOL_MAX_CONNECTIONS bounds the connections of an alias in use at
+    once by the threads of the process: a thread takes a slot on its
+    first query and gives it back at the end of the request (or job),
+    idle persistent connections hold none. With one thread per process
+    (uwsgi without --threads) it bounds nothing, size it below the
+    threads of the ASGI executor or of run_worker --concurrency.
+    '''
+
+    _pool_lock = threading.Lock()
+    _pool_slots = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self._holds_pool_slot = False
+
+    def _pool_semaphore(self):
+        '''process wide semaphore for this alias, None when unbounded'''
+        size = self.settings_dict.get('POOL_MAX_CONNECTIONS')
+        if not size:
+            return None
+        with self._pool_lock:
+            if self.alias not in self._pool_slots:
+                self._pool_slots[self.alias] = threading.BoundedSemaphore(size)
+            return self._pool_slots[self.alias]
+
+    def _acquire_pool_slot(self):
+        semaphore = self._pool_semaphore()
+        if semaphore is None or self._holds_pool_slot:
+            return
+        timeout = self.settings_dict.get('POOL_TIMEOUT', 10)
+        if not semaphore.acquire(timeout=timeout):
+            raise OperationalError(
+                f'connection pool for {self.alias!r} exhausted '
+                f'after {timeout}s'
+            )
+        self._holds_pool_slot = True
+
+    def _release_pool_slot(self):
+        if self._holds_pool_slot:
+            self._holds_pool_slot = False
+            self._pool_semaphore().release()
+
+    def connect(self):
+        self._acquire_pool_slot()
+        try:
+            super().connect()
+        except Exception:
+            self._release_pool_slot()
+            raise
+        # a brand new connection doesn't need a ping
+        self.health_check_done = True
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_pool_slot()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # called at request start and end, check again on next use
+        self.health_check_done = False
+        # kept open but idle until the next request, free its slot
+        if not self.in_atomic_block:
+            self._release_pool_slot()
+
+    def close_if_health_check_failed(self):
+        '''drop a reused connection that no longer answers'''
+        if (
+            self.connection is None or
+            self.health_check_done or
+            not self.settings_dict.get('CONN_HEALTH_CHECKS') or
+            self.in_atomic_block
+        ):
+            return
+        self.health_check_done = True
+        if not self.is_usable():
+            self.close()
+
+    def ensure_connection(self):
+        # a kept connection takes a slot again on its first use
+        self._acquire_pool_slot()
+        self.close_if_health_check_failed()
+        super().ensure_connection()
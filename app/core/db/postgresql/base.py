@@ -0,0 +1,10 @@
+"""
+PostgreSQL backend with health checked, bounded persistent connections
+"""
+from django.db.backends.postgresql import base
+
+from core.db.pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    pass
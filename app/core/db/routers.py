@@ -0,0 +1,121 @@
+"""
+Database routers
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from core.db.sharding import (
+    current_shard,
+    is_sharded,
+    shard_for_instance,
+    sharding_enabled,
+)
+
+
+class ReplicaState:
+    '''routing state of the current request'''
+
+    def __init__(self, pinned, user_pinned=None):
+        # pinned requests read from the primary
+        self.pinned = pinned
+        self.wrote = False
+        # True or False once the view authenticated the user, None before
+        self.user_pinned = user_pinned
+
+    def use_primary(self):
+        '''pinned, by the client or by the user as soon as it is known'''
+        if not self.pinned and self.user_pinned is not None:
+            pinned = self.user_pinned()
+            if pinned is not None:
+                self.user_pinned = None
+                self.pinned = pinned
+        return self.pinned
+
+
+# no state outside of requests (commands, shell): everything stays on
+# the primary, only ReplicaRoutingMiddleware opts requests in
+_replica_state = ContextVar('replica_state', default=None)
+
+
+def start_replica_reads(pinned=False, user_pinned=None):
+    '''route the reads of the current context to the replicas'''
+    return _replica_state.set(ReplicaState(pinned, user_pinned))
+
+
+def stop_replica_reads(token):
+    '''back to the primary, returns the state of the finished context'''
+    state = _replica_state.get()
+    _replica_state.reset(token)
+    return state
+
+
+class ReplicaRouter:
+    '''send reads to REPLICA_DATABASES, pin to the primary after writes'''
+
+    def db_for_read(self, model, **hints):
+        state = _replica_state.get()
+        if (
+            state is None or
+            not settings.REPLICA_DATABASES or
+            state.use_primary()
+        ):
+            return None
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        state = _replica_state.get()
+        if state is not None:
+            # read your writes for the rest of the request
+            state.pinned = True
+            state.wrote = True
+
+        # objects loaded from a replica are saved on the primary
+        instance = hints.get('instance')
+        if (
+            instance is not None and
+            instance._state.db in settings.REPLICA_DATABASES
+        ):
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        same_data = {'default', *settings.REPLICA_DATABASES}
+        if obj1._state.db in same_data and obj2._state.db in same_data:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ShardRouter:
+    '''keep the recipes, tags and ingredients of a user on its shard'''
+
+    def _db_for_model(self, model, hints):
+        if not sharding_enabled() or not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None:
+            shard = shard_for_instance(instance)
+            if shard:
+                return shard
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_model(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_model(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the user foreign keys cross databases, nothing else does
+        user_model = get_user_model()
+        if sharding_enabled() and user_model in (type(obj1), type(obj2)):
+            return True
+        return None
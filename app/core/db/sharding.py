@@ -0,0 +1,195 @@
+"""
+Placement of user owned rows (recipes, tags, ingredients) on shards
+"""
+import functools
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+
+from core.storage import retain
+
+# ids of each shard start at index * ID_RANGE so rows keep their primary
+# key when a user is moved to another shard
+ID_RANGE = 2 ** 40
+
+# request whose authenticated user picks the shard for queries without
+# an instance to route on, set by ShardRoutingMiddleware
+_shard_request = ContextVar('shard_request', default=None)
+
+
+def sharding_enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+@functools.lru_cache(maxsize=None)
+def sharded_models():
+    '''the user owned models, with the recipe m2m through tables'''
+    from core.models import Recipe, Tag, Ingredient
+
+    return (
+        Tag,
+        Ingredient,
+        Recipe,
+        Recipe.tags.through,
+        Recipe.ingredients.through,
+    )
+
+
+def is_sharded(model):
+    return model in sharded_models()
+
+
+def shard_for_new_user(user_id):
+    '''placement of a new user, chosen by id'''
+    return settings.SHARD_DATABASES[user_id % len(settings.SHARD_DATABASES)]
+
+
+def shard_for_user(user):
+    '''users created before sharding have no shard and stay on default'''
+    return user.shard or 'default'
+
+
+def shard_for_instance(instance):
+    '''shard of a model instance, None when it can't be told'''
+    if isinstance(instance, get_user_model()):
+        # related managers, user.recipe_set
+        return shard_for_user(instance)
+    if not is_sharded(type(instance)):
+        return None
+    if instance._state.db:
+        return instance._state.db
+
+    user = instance._state.fields_cache.get('user')
+    if user is None and getattr(instance, 'user_id', None):
+        user = get_user_model().objects.using('default').only(
+            'id', 'shard'
+        ).get(pk=instance.user_id)
+    if user is None:
+        return None
+    return shard_for_user(user)
+
+
+def current_shard():
+    '''shard of the user authenticated on the current request'''
+    request = _shard_request.get()
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return shard_for_user(user)
+
+
+def start_shard_routing(request):
+    return _shard_request.set(request)
+
+
+def stop_shard_routing(token):
+    _shard_request.reset(token)
+
+
+def reserve_id_range(using):
+    '''move the id sequences of a shard to the start of its range'''
+    connection = connections[using]
+    index = settings.SHARD_DATABASES.index(using)
+    if index == 0:
+        return
+
+    start = index * ID_RANGE
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            table = model._meta.db_table
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    "GREATEST(nextval(pg_get_serial_sequence(%s, 'id')), %s))",
+                    [table, table, start],
+                )
+            elif connection.vendor == 'sqlite':
+                # local shards, AUTOINCREMENT tables keep sqlite_sequence
+                cursor.execute(
+                    'DELETE FROM sqlite_sequence WHERE name = %s AND seq < %s',
+                    [table, start],
+                )
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS '
+                    '(SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, start, table],
+                )
+
+
+def _copy(queryset, using, batch_size):
+    '''copy the rows of queryset to another database, keeping the ids'''
+    model = queryset.model
+    batch = []
+    for obj in queryset.iterator(chunk_size=batch_size):
+        obj._state.db = None
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.using(using).bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.using(using).bulk_create(batch)
+
+
+def _user_rows(user, using):
+    '''querysets of every sharded row of user, parents first'''
+    Tag, Ingredient, Recipe, RecipeTags, RecipeIngredients = sharded_models()
+    return [
+        Tag.objects.using(using).filter(user=user),
+        Ingredient.objects.using(using).filter(user=user),
+        Recipe.objects.using(using).filter(user=user),
+        RecipeTags.objects.using(using).filter(recipe__user=user),
+        RecipeIngredients.objects.using(using).filter(recipe__user=user),
+    ]
+
+
+def delete_user_rows(user, using):
+    '''delete the sharded rows of user on one database, children first'''
+    with transaction.atomic(using=using):
+        for queryset in reversed(_user_rows(user, using)):
+            queryset.delete()
+
+
+def move_user(user, target, batch_size=500):
+    '''
+    Copy the rows of user to target, point the user at it and delete
+    the source rows. Safe to run again after a failure, the target is
+    cleared first. Writes the user makes during the move are lost, so
+    move users while they are inactive.
+    '''
+    source = shard_for_user(user)
+    if source == target:
+        return 0
+
+    delete_user_rows(user, target)
+    copied = 0
+    with transaction.atomic(using=target):
+        for queryset in _user_rows(user, source):
+            copied += queryset.count()
+            _copy(queryset, target, batch_size)
+        # the copies hold their images too, deleting the source releases
+        # them. Counted before the copy commits: a failure in between
+        # leaves the counts too high, which collect_orphaned_media fixes,
+        # never too low
+        retain(_user_rows(user, target)[2].values_list('image', flat=True))
+
+    user.shard = target
+    user.save(using='default', update_fields=['shard'])
+
+    delete_user_rows(user, source)
+    return copied
+
+
+def reserve_id_ranges(sender, using, **kwargs):
+    '''post_migrate handler'''
+    if using in settings.SHARD_DATABASES:
+        reserve_id_range(using)
+
+
+def delete_rows_of_deleted_user(sender, instance, using, **kwargs):
+    '''pre_delete handler, CASCADE only reaches the user's database'''
+    shard = shard_for_user(instance)
+    if shard != using:
+        delete_user_rows(instance, shard)
@@ -0,0 +1,145 @@
+"""
+Deletion of users in the background, in short batches
+
+Deleting a user cascades to all its recipes, tags and ingredients in one
+transaction, holding locks for as long as that takes. request_deletion
+disables the account at once and a background job (or the
+process_user_deletions command) removes its rows and images afterwards,
+a transaction per batch.
+
+Recipes are still deleted by the request: their cascade is only their
+tag and ingredient links, a DELETE per m2m table whatever their number,
+and the image, released on commit (core.storage).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.db.sharding import shard_for_user
+from core.jobs import enqueue, job
+from core.models import Recipe, Tag, Ingredient, UserDeletion
+from core.storage import ContentAddressedStorage
+
+
+def request_deletion(user):
+    '''disable user now and queue the deletion of its rows'''
+    with transaction.atomic(using='default'):
+        user.is_active = False
+        user.save(using='default', update_fields=['is_active'])
+        deletion, created = UserDeletion.objects.get_or_create(
+            user=user, defaults={'email': user.email},
+        )
+        if created:
+            enqueue(delete_user, deletion_id=deletion.id)
+    return deletion
+
+
+def _lease():
+    return timezone.now() + datetime.timedelta(
+        seconds=settings.USER_DELETION_LEASE_SECONDS
+    )
+
+
+def claim(deletion):
+    '''take deletion for this worker, False if another one holds it'''
+    now = timezone.now()
+    return UserDeletion.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        id=deletion.id,
+        finished_at__isnull=True,
+    ).update(
+        locked_until=_lease(), started_at=Coalesce('started_at', now)
+    ) == 1
+
+
+def _delete_batch(queryset, batch_size):
+    '''
+    Delete the first batch_size rows of queryset, with their m2m rows
+    and image files. Returns the rows and the files deleted.
+    '''
+    model = queryset.model
+    ids = list(queryset.order_by('id').values_list('id', flat=True)
+               [:batch_size])
+    if not ids:
+        return 0, 0
+
+    batch = model.objects.using(queryset.db).filter(id__in=ids)
+    files = 0
+    if model is Recipe:
+        names = batch.exclude(image='').exclude(image__isnull=True) \
+            .values_list('image', flat=True)
+        storage = Recipe._meta.get_field('image').storage
+        if isinstance(storage, ContentAddressedStorage):
+            # shared files, released by core.storage.image_deleted
+            files = names.count()
+        else:
+            # the files first: a crash leaves rows to retry, not files
+            for name in names:
+                storage.delete(name)
+                files += 1
+    with transaction.atomic(using=queryset.db):
+        rows, _ = batch.delete()
+    return rows, files
+
+
+def run_deletion(deletion, batch_size=None, progress=None):
+    '''
+    Delete the rows of a claimed deletion, then the user. progress is
+    called with deletion after every batch. Safe to run again after a
+    failure, it goes on with the rows left.
+    '''
+    batch_size = batch_size or settings.USER_DELETION_BATCH_SIZE
+    user = deletion.user
+    if user is not None:
+        using = shard_for_user(user)
+        # recipes first, the m2m rows go with them
+        for model in (Recipe, Tag, Ingredient):
+            queryset = model.objects.using(using).filter(user_id=user.id)
+            while True:
+                rows, files = _delete_batch(queryset, batch_size)
+                if not rows:
+                    break
+                UserDeletion.objects.filter(id=deletion.id).update(
+                    deleted_rows=F('deleted_rows') + rows,
+                    deleted_files=F('deleted_files') + files,
+                    locked_until=_lease(),
+                )
+                deletion.deleted_rows += rows
+                deletion.deleted_files += files
+                if progress is not None:
+                    progress(deletion)
+
+    with transaction.atomic(using='default'):
+        if user is not None:
+            user.delete(using='default')
+        deletion.finished_at = timezone.now()
+        deletion.locked_until = None
+        UserDeletion.objects.filter(id=deletion.id).update(
+            user=None,
+            finished_at=deletion.finished_at,
+            locked_until=None,
+        )
+    deletion.user = None
+    return deletion
+
+
+def pending_deletions():
+    return UserDeletion.objects.filter(
+        finished_at__isnull=True
+    ).select_related('user').order_by('id')
+
+
+@job
+def delete_user(deletion_id):
+    '''job queued by request_deletion'''
+    deletion = pending_deletions().filter(id=deletion_id).first()
+    if deletion is None:
+        return
+    if not claim(deletion):
+        # retried after the lease of the other worker
+        raise RuntimeError(f'{deletion} is being deleted elsewhere')
+    run_deletion(deletion)
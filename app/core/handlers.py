@@ -0,0 +1,112 @@
+"""
+ASGI handler running the sync Django code on a fixed thread pool
+"""
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+
+from core.readiness import warm_up
+
+
+class _RequestThread:
+    '''thread sensitive context of one request (weak referenceable key)'''
+
+
+class SyncThreadPool:
+    '''
+    ASGI_SYNC_THREADS single thread executors. A request keeps the same
+    thread for all its sync code, and threads outlive requests so their
+    persistent database connections are reused.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = weakref.WeakKeyDictionary()
+
+    def _queue(self):
+        # one queue per event loop, uvicorn runs a loop per worker process
+        loop = asyncio.get_running_loop()
+        if loop not in self._idle:
+            queue = asyncio.Queue()
+            for _ in range(self.size):
+                queue.put_nowait(ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='asgi-sync'
+                ))
+            self._idle[loop] = queue
+        return self._idle[loop]
+
+    async def acquire(self):
+        return await self._queue().get()
+
+    def release(self, executor):
+        self._queue().put_nowait(executor)
+
+
+class PooledASGIHandler(ASGIHandler):
+    '''
+    Django 3.2 runs the sync code of every request on one thread per
+    process. Give each request its own thread from SyncThreadPool instead,
+    taken once the body has been read on the event loop so slow uploads
+    don't hold a thread.
+    '''
+
+    def __init__(self):
+        # not public API of asgiref, tested for the range of requirements.txt
+        for name in ('thread_sensitive_context', 'context_to_thread_executor'):
+            if not hasattr(SyncToAsync, name):
+                raise ImproperlyConfigured(
+                    f'SyncToAsync has no {name}, PooledASGIHandler needs '
+                    f'the asgiref versions of requirements.txt'
+                )
+        super().__init__()
+        self.pool = SyncThreadPool(settings.ASGI_SYNC_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        context = _RequestThread()
+        token = SyncToAsync.thread_sensitive_context.set(context)
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            executor = SyncToAsync.context_to_thread_executor.pop(
+                context, None
+            )
+            SyncToAsync.thread_sensitive_context.reset(token)
+            if executor is not None:
+                self.pool.release(executor)
+
+    async def read_body(self, receive):
+        body_file = await super().read_body(receive)
+        context = SyncToAsync.thread_sensitive_context.get()
+        SyncToAsync.context_to_thread_executor[context] = (
+            await self.pool.acquire()
+        )
+        return body_file
+
+    async def _lifespan(self, receive, send):
+        '''accept startup and shutdown, nothing to do for either'''
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def get_asgi_application():
+    '''like django.core.asgi.get_asgi_application, with the thread pool'''
+    django.setup(set_prefix=False)
+    handler = PooledASGIHandler()
+    # connections belong to the pool threads, they open them on first use
+    warm_up(connect=False)
+    return handler
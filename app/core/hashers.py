@@ -0,0 +1,41 @@
+"""
+Password hashing with a calibrated cost and bounded concurrency
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def hashing_slots():
+    '''semaphore bounding the hashes computed at once by this process'''
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(
+                    settings.PASSWORD_HASH_CONCURRENCY
+                )
+    return _slots
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    '''
+    PBKDF2 with PASSWORD_HASH_ITERATIONS, see the calibrate_hasher
+    command. It keeps the pbkdf2_sha256 algorithm name, so hashes made
+    with another count are rehashed with the new one on the next login.
+    Threads past PASSWORD_HASH_CONCURRENCY wait for a slot instead of
+    taking every core from the other requests.
+    '''
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+    def encode(self, password, salt, iterations=None):
+        # verify and harden_runtime hash through encode too
+        with hashing_slots():
+            return super().encode(password, salt, iterations)
@@ -0,0 +1,100 @@
+"""
+Database instrumentation: catch slow queries and keep their EXPLAIN plan
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import SlowQuery
+
+
+class SlowQueryRecorder:
+    '''execute_wrapper that collects queries slower than the threshold'''
+
+    def __init__(self, threshold_ms, analyze=False, request=None):
+        self.threshold_ms = threshold_ms
+        self.analyze = analyze
+        self.request = request
+        self.entries = []
+        # the EXPLAIN itself goes through this wrapper, don't capture it
+        self._explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+
+        start = time.monotonic()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.monotonic() - start) * 1000
+
+        if duration_ms >= self.threshold_ms:
+            self.entries.append(self._entry(
+                context['connection'], sql, params, many, duration_ms
+            ))
+        return result
+
+    def _entry(self, conn, sql, params, many, duration_ms):
+        '''build the row data for one slow query'''
+        # the parameters are only used for the plan, never stored
+        entry = {
+            'duration_ms': duration_ms,
+            'database': conn.alias,
+            'sql': sql,
+            'plan': '' if many else self._explain(conn, sql, params),
+        }
+        entry.update(self._request_info())
+        return entry
+
+    def _explain(self, conn, sql, params):
+        '''return the plan for a SELECT, ANALYZE only when configured'''
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return ''
+
+        options = {'analyze': True} if self.analyze else {}
+        try:
+            prefix = conn.ops.explain_query_prefix(**options)
+        except ValueError:
+            # backend without ANALYZE support (sqlite on local runs)
+            prefix = conn.ops.explain_query_prefix()
+
+        self._explaining = True
+        try:
+            # a failing EXPLAIN must not abort the transaction of the
+            # caller (PostgreSQL), roll back to a savepoint instead
+            with transaction.atomic(using=conn.alias):
+                with conn.cursor() as cursor:
+                    cursor.execute(f'{prefix} {sql}', params)
+                    rows = cursor.fetchall()
+        except Exception as exc:
+            return f'EXPLAIN failed: {exc}'
+        finally:
+            self._explaining = False
+
+        return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+    def _request_info(self):
+        '''which view / path triggered the query'''
+        if self.request is None:
+            return {}
+        match = getattr(self.request, 'resolver_match', None)
+        return {
+            'view': match.view_name if match else '',
+            'method': self.request.method,
+            'path': self.request.path[:255],
+        }
+
+
+def save_slow_queries(entries):
+    '''persist the captured queries and keep the table bounded'''
+    if not entries:
+        return
+
+    SlowQuery.objects.bulk_create(SlowQuery(**entry) for entry in entries)
+
+    max_rows = settings.SLOW_QUERY_LOG_MAX_ROWS
+    cutoff = SlowQuery.objects.order_by('-id').values_list(
+        'id', flat=True
+    )[max_rows:max_rows + 1]
+    if cutoff:
+        SlowQuery.objects.filter(id__lte=cutoff[0]).delete()
@@ -0,0 +1,159 @@
+"""
+Background jobs kept in the database, run by the run_worker command
+
+A job is a function decorated with @job, queued with its keyword
+arguments by enqueue. The row is inserted in the transaction of the
+caller, so a job exists exactly when the writes that called for it were
+committed. Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED and
+retry failures with exponential backoff.
+"""
+import datetime
+import random
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import Job
+
+# name -> function of the functions decorated with @job
+_registry = {}
+
+
+def job_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def job(func):
+    '''register func to run in the background, named by its path'''
+    _registry[job_name(func)] = func
+    return func
+
+
+def enqueue(func, delay=0, max_attempts=None, **kwargs):
+    '''
+    Queue func(**kwargs), kwargs must be JSON serializable. Call it in
+    the transaction of the writes it follows, on the default database.
+    '''
+    name = job_name(func)
+    if _registry.get(name) is not func:
+        raise ValueError(f'{name} is not decorated with @job')
+    return Job.objects.using('default').create(
+        name=name,
+        kwargs=kwargs,
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def _lease():
+    return timezone.now() + datetime.timedelta(
+        seconds=settings.JOB_LEASE_SECONDS
+    )
+
+
+def claim(worker):
+    '''
+    The next job due, marked running for worker, or None. Running jobs
+    whose lease expired belong to a worker that died and are taken too.
+    '''
+    now = timezone.now()
+    with transaction.atomic(using='default'):
+        job = Job.objects.using('default').select_for_update(
+            skip_locked=True
+        ).filter(
+            Q(status=Job.Status.QUEUED, run_after__lte=now) |
+            Q(status=Job.Status.RUNNING, locked_until__lt=now)
+        ).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        if job.attempts >= job.max_attempts:
+            # its worker died on the last attempt
+            Job.objects.using('default').filter(id=job.id).update(
+                status=Job.Status.FAILED,
+                finished_at=now,
+                locked_until=None,
+                last_error=f'{job.locked_by} stopped while running it',
+            )
+            return None
+        # the attempts guard claims on databases without row locks
+        claimed = Job.objects.using('default').filter(
+            id=job.id, attempts=job.attempts
+        ).update(
+            status=Job.Status.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=_lease(),
+            locked_by=worker,
+        )
+        if not claimed:
+            return None
+    job.refresh_from_db()
+    return job
+
+
+def renew(worker_prefix):
+    '''extend the lease of the jobs run by the workers of a process'''
+    return Job.objects.using('default').filter(
+        status=Job.Status.RUNNING, locked_by__startswith=worker_prefix
+    ).update(locked_until=_lease())
+
+
+def backoff(attempts):
+    '''seconds before retrying a job failed attempts times, jittered'''
+    delay = min(
+        settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1),
+        settings.JOB_RETRY_BACKOFF_MAX,
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def _function(name):
+    if name not in _registry:
+        # registered when its module is imported
+        import_string(name)
+    return _registry[name]
+
+
+def run(job):
+    '''run a claimed job, recording its outcome, True if it succeeded'''
+    jobs = Job.objects.using('default').filter(id=job.id)
+    try:
+        _function(job.name)(**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.Status.QUEUED
+            job.run_after = timezone.now() + datetime.timedelta(
+                seconds=backoff(job.attempts)
+            )
+        else:
+            job.status = Job.Status.FAILED
+            job.finished_at = timezone.now()
+        jobs.update(
+            status=job.status,
+            run_after=job.run_after,
+            finished_at=job.finished_at,
+            last_error=job.last_error,
+            locked_until=None,
+        )
+        return False
+
+    job.status = Job.Status.DONE
+    job.finished_at = timezone.now()
+    jobs.update(
+        status=job.status, finished_at=job.finished_at, locked_until=None
+    )
+    return True
+
+
+def retry(queryset):
+    '''queue failed jobs again, with their attempts reset'''
+    return queryset.filter(status=Job.Status.FAILED).update(
+        status=Job.Status.QUEUED,
+        attempts=0,
+        run_after=timezone.now(),
+        finished_at=None,
+    )
@@ -0,0 +1,24 @@
+"""
+Deferred imports for code serving requests never needs
+"""
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path, **initkwargs):
+    '''
+    A view importing its class on the first request, for views workers
+    rarely serve and whose module is costly to import (the schema views
+    pull the schema generator and renderers).
+    '''
+    view = None
+
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    # every class based view of DRF is csrf exempt, the middleware checks
+    # the attribute before the view is loaded
+    dispatch.csrf_exempt = True
+    return dispatch
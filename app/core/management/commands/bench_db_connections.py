@@ -0,0 +1,62 @@
+"""
+comando django para medir o ganho de reutilizar conexões do banco
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    '''Compare a new connection per request against a reused one'''
+
+    help = 'Benchmark fresh vs reused (health checked) database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def _request(self, conn):
+        '''one simulated request: a single trivial query'''
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+    def _fresh(self, conn):
+        conn.close()
+        start = time.perf_counter()
+        self._request(conn)
+        return time.perf_counter() - start
+
+    def _reused(self, conn):
+        # request boundary, the next use runs the health check
+        conn.health_check_done = False
+        start = time.perf_counter()
+        self._request(conn)
+        return time.perf_counter() - start
+
+    def _report(self, label, samples):
+        samples_ms = sorted(sample * 1000 for sample in samples)
+        p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+        self.stdout.write(
+            f'{label:<8} mean {statistics.mean(samples_ms):7.3f} ms  '
+            f'p50 {statistics.median(samples_ms):7.3f} ms  '
+            f'p95 {p95:7.3f} ms'
+        )
+        return statistics.mean(samples_ms)
+
+    def handle(self, *args, **options):
+        conn = connections[options['database']]
+        iterations = options['iterations']
+
+        fresh = [self._fresh(conn) for _ in range(iterations)]
+        conn.ensure_connection()
+        reused = [self._reused(conn) for _ in range(iterations)]
+
+        fresh_mean = self._report('fresh', fresh)
+        reused_mean = self._report('reused', reused)
+        self.stdout.write(self.style.SUCCESS(
+            f'saved {fresh_mean - reused_mean:.3f} ms per request '
+            f'({fresh_mean / reused_mean:.1f}x)'
+        ))
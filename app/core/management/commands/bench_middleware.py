@@ -0,0 +1,84 @@
+"""
+comando django para medir o custo da cadeia de middlewares por request
+"""
+import time
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import path
+
+
+def empty_view(request):
+    return HttpResponse('ok')
+
+
+# ROOT_URLCONF of the benchmark, a view costing nothing under both chains
+urlpatterns = [
+    path('api/bench/', empty_view),
+    path('admin/bench/', empty_view),
+]
+
+
+class Command(BaseCommand):
+    '''Compare the single middleware chain with the path routed one'''
+
+    help = (
+        'Time requests through the middleware, on a view doing nothing, '
+        'with every middleware on every path and with the lean chain on '
+        'the API paths.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--rounds', type=int, default=15)
+
+    def _flat_middleware(self):
+        '''MIDDLEWARE as it was before the routing, full chain everywhere'''
+        flat = []
+        for middleware in settings.MIDDLEWARE:
+            if middleware == 'core.middleware.PathRoutedMiddleware':
+                flat.extend(settings.FULL_MIDDLEWARE)
+            else:
+                flat.append(middleware)
+        return flat
+
+    def _handler(self, middleware):
+        with override_settings(MIDDLEWARE=middleware):
+            handler = BaseHandler()
+            handler.load_middleware()
+        return handler
+
+    def _time(self, handler, request_path, count):
+        '''microseconds per request through handler'''
+        factory = RequestFactory()
+        requests = [
+            factory.get(request_path, HTTP_AUTHORIZATION='Token bench')
+            for _ in range(count)
+        ]
+        start = time.perf_counter()
+        for request in requests:
+            handler.get_response(request)
+        return (time.perf_counter() - start) / count * 1e6
+
+    def handle(self, *args, **options):
+        count = options['requests']
+
+        with override_settings(ROOT_URLCONF=__name__,
+                               ALLOWED_HOSTS=['testserver']):
+            single = self._handler(self._flat_middleware())
+            routed = self._handler(settings.MIDDLEWARE)
+            for request_path in ('/api/bench/', '/admin/bench/'):
+                # alternate the chains, keep the least disturbed round
+                before, after = [], []
+                for _ in range(options['rounds']):
+                    before.append(self._time(single, request_path, count))
+                    after.append(self._time(routed, request_path, count))
+                before, after = min(before), min(after)
+                self.stdout.write(
+                    f'{request_path:<14} single chain {before:7.1f} us  '
+                    f'routed {after:7.1f} us  saved {before - after:6.1f} '
+                    f'us ({(before - after) / before:.0%})'
+                )
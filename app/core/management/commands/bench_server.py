@@ -0,0 +1,116 @@
+"""
+comando django para comparar os modos de servidor (uwsgi e asgi)
+"""
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    '''Load a running server with concurrent keep-alive clients'''
+
+    help = (
+        'Benchmark a running instance, e.g. once with APP_SERVER=wsgi and '
+        'once with APP_SERVER=asgi behind the same proxy. --slow-clients '
+        'keeps connections busy trickling an upload meanwhile.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--token', help='API token of a test user')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--slow-clients', type=int, default=0)
+
+    def _client(self, url, headers, count, latencies, errors):
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        path = url.path + (f'?{url.query}' if url.query else '')
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as exc:
+                errors.append(exc)
+                conn.close()
+                continue
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    def _slow_client(self, url, headers, stop):
+        '''POST a body one byte per second until stopped'''
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+        try:
+            conn.putrequest('POST', url.path)
+            for name, value in headers.items():
+                conn.putheader(name, value)
+            conn.putheader('Content-Length', '3600')
+            conn.endheaders()
+            while not stop.wait(1):
+                conn.send(b'x')
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// urls are supported')
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        stop = threading.Event()
+        slow = [
+            threading.Thread(
+                target=self._slow_client, args=(url, headers, stop)
+            )
+            for _ in range(options['slow_clients'])
+        ]
+        for thread in slow:
+            thread.start()
+
+        latencies, errors = [], []
+        per_client = options['requests'] // options['concurrency']
+        clients = [
+            threading.Thread(
+                target=self._client,
+                args=(url, headers, per_client, latencies, errors),
+            )
+            for _ in range(options['concurrency'])
+        ]
+        start = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        for thread in slow:
+            thread.join()
+
+        if not latencies:
+            raise CommandError(f'All requests failed: {errors[:3]}')
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+
+        def percentile(p):
+            return latencies_ms[min(len(latencies_ms) - 1,
+                                    int(len(latencies_ms) * p))]
+
+        self.stdout.write(
+            f'{len(latencies)} ok, {len(errors)} errors in {elapsed:.2f}s '
+            f'-> {len(latencies) / elapsed:.1f} req/s'
+        )
+        self.stdout.write(
+            f'latency p50 {statistics.median(latencies_ms):.1f} ms  '
+            f'p95 {percentile(0.95):.1f} ms  p99 {percentile(0.99):.1f} ms'
+        )
@@ -0,0 +1,41 @@
+"""
+comando django para gerar o schema da api antes de subir o servidor
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import translation
+
+from core.schema import (
+    CachedSpectacularAPIView,
+    _file_name,
+    _write_cache_file,
+    schema_language,
+)
+
+
+class Command(BaseCommand):
+    '''Render the OpenAPI schema into SCHEMA_CACHE_DIR'''
+
+    help = (
+        'Render the schema in every format served by /api/schema, plain '
+        'and gzipped, so workers read it instead of generating it.'
+    )
+
+    def handle(self, *args, **options):
+        if not settings.SCHEMA_CACHE_DIR:
+            raise CommandError('Set SCHEMA_CACHE_DIR to build the schema')
+
+        view = CachedSpectacularAPIView()
+        language = schema_language()
+        for renderer_class in view.renderer_classes:
+            renderer = renderer_class()
+            with translation.override(language):
+                schema = view.render_schema(renderer)
+            _write_cache_file(_file_name(renderer.media_type, language),
+                              schema)
+            self.stdout.write(
+                f'{renderer.media_type}: {len(schema.body)} bytes, '
+                f'{len(schema.gzipped)} gzipped'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Schema built'))
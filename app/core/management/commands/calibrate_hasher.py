@@ -0,0 +1,59 @@
+"""
+comando django para calibrar o custo do hash de senha nesta maquina
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    '''Pick the PBKDF2 iteration count hashing in --target-ms here'''
+
+    help = (
+        'Time the password hasher on this machine and print the '
+        'PASSWORD_HASH_ITERATIONS hashing a password in --target-ms. '
+        'Existing hashes are upgraded on the next login.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100)
+        parser.add_argument(
+            '--min-iterations', type=int, default=100000,
+            help='never go below this count, whatever the hardware',
+        )
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def _time(self, hasher, iterations, rounds):
+        '''best time of rounds hashes, the least disturbed one'''
+        salt = hasher.salt()
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            hasher.encode('calibration password', salt, iterations)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        hasher = get_hasher()
+        if not hasattr(hasher, 'iterations'):
+            raise CommandError(f'{hasher.algorithm} has no iteration count')
+
+        probe = 20000
+        per_iteration = self._time(hasher, probe, options['rounds']) / probe
+        target = options['target_ms'] / 1000
+        # rounded, small changes would rehash every password for nothing
+        iterations = max(
+            options['min_iterations'],
+            int(target / per_iteration) // 10000 * 10000,
+        )
+        elapsed = self._time(hasher, iterations, options['rounds'])
+
+        self.stdout.write(
+            f'{hasher.algorithm}: {iterations} iterations take '
+            f'{elapsed * 1000:.1f} ms here, {1 / elapsed:.1f} hashes/s per '
+            f'core (currently {settings.PASSWORD_HASH_ITERATIONS})'
+        )
+        self.stdout.write(f'PASSWORD_HASH_ITERATIONS={iterations}')
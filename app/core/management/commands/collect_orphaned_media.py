@@ -0,0 +1,256 @@
+"""
+comando django para apagar as imagens que nenhuma receita usa mais
+"""
+import datetime
+import heapq
+import itertools
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Collate
+
+from core.models import Recipe, StoredFile
+
+# directory of the recipe images, see recipe_image_file_path
+IMAGE_DIRECTORY = 'uploads/recipe'
+
+
+def sorted_files(root, directory):
+    '''
+    (name, DirEntry) of the files under root/directory, in the order of
+    their names. Only one directory listing is held at a time.
+    '''
+    try:
+        entries = list(os.scandir(os.path.join(root, directory)))
+    except FileNotFoundError:
+        return
+    # a directory sorts as its name and the separator, like its files
+    entries.sort(key=lambda entry: (
+        entry.name + '/' if entry.is_dir(follow_symlinks=False)
+        else entry.name
+    ))
+    for entry in entries:
+        name = f'{directory}/{entry.name}'
+        if entry.is_dir(follow_symlinks=False):
+            yield from sorted_files(root, name)
+        elif entry.is_file(follow_symlinks=False):
+            yield name, entry
+
+
+def name_order(queryset, field):
+    '''queryset under IMAGE_DIRECTORY, ordered by field in code points'''
+    queryset = queryset.filter(**{f'{field}__startswith': IMAGE_DIRECTORY})
+    if connections[queryset.db].vendor == 'postgresql':
+        # byte order, like the file names, whatever the database locale
+        return queryset.order_by(Collate(field, 'C'))
+    return queryset.order_by(field)
+
+
+def sorted_names(queryset, field, chunk_size):
+    '''values of field in queryset, in code point order, streamed'''
+    return name_order(queryset, field).values_list(
+        field, flat=True
+    ).iterator(chunk_size=chunk_size)
+
+
+def unreferenced(files, names):
+    '''the (name, entry) of files missing from names, both sorted'''
+    names = iter(names)
+    current = next(names, None)
+    for name, entry in files:
+        while current is not None and current < name:
+            current = next(names, None)
+        if current != name:
+            yield name, entry
+
+
+def databases():
+    return settings.SHARD_DATABASES or ['default']
+
+
+def recipe_names(chunk_size):
+    '''the image names of every recipe database, merged'''
+    return heapq.merge(*[
+        sorted_names(
+            Recipe.objects.using(using).exclude(image=''), 'image',
+            chunk_size,
+        )
+        for using in databases()
+    ])
+
+
+def referenced_names(chunk_size):
+    '''the image names of every recipe database and StoredFile, merged'''
+    return heapq.merge(recipe_names(chunk_size), sorted_names(
+        StoredFile.objects.using('default'), 'name', chunk_size
+    ))
+
+
+def recipe_counts(chunk_size):
+    '''(name, recipes using it) of every recipe database, in name order'''
+    for name, rows in itertools.groupby(recipe_names(chunk_size)):
+        yield name, sum(1 for _ in rows)
+
+
+def reconcile(cutoff, chunk_size, dry_run=False):
+    '''
+    Set StoredFile.references to the recipes using each file on every
+    database, and drop the StoredFile rows no recipe uses, so their file
+    is collected. Counts only go down, and pending saves are forgotten,
+    for files not stored since cutoff: a row using one may be committing.
+    Returns the counts fixed and the rows dropped.
+    '''
+    counts = recipe_counts(chunk_size)
+    current = next(counts, None)
+    fixed = dropped = 0
+    stored_files = name_order(
+        StoredFile.objects.using('default'), 'name'
+    ).values_list(
+        'id', 'name', 'references', 'pending', 'stored_at'
+    ).iterator(chunk_size=chunk_size)
+    for pk, name, references, pending, stored_at in stored_files:
+        while current is not None and current[0] < name:
+            current = next(counts, None)
+        rows = current[1] if current is not None and current[0] == name \
+            else 0
+        settled = stored_at is None or stored_at <= cutoff
+        if rows > references:
+            # a row committed, its retain still to come or lost
+            settled = False
+        elif not settled or (rows == references and rows and not pending):
+            continue
+
+        # skipped when changed meanwhile, the next run sees it again
+        stored_file = StoredFile.objects.using('default').filter(
+            id=pk, references=references, pending=pending,
+        )
+        if settled:
+            stored_file = stored_file.filter(
+                Q(stored_at__isnull=True) | Q(stored_at__lte=cutoff)
+            )
+        if dry_run:
+            changed = stored_file.exists()
+        elif not rows:
+            changed = stored_file.delete()[0]
+        elif settled:
+            changed = stored_file.update(references=rows, pending=0)
+        else:
+            changed = stored_file.update(references=rows)
+        if changed and rows:
+            fixed += 1
+        elif changed:
+            dropped += 1
+    return fixed, dropped
+
+
+def still_referenced(names):
+    '''names used now, rechecked before deleting anything'''
+    used = set(StoredFile.objects.using('default').filter(
+        name__in=names
+    ).values_list('name', flat=True))
+    for using in databases():
+        used.update(Recipe.objects.using(using).filter(
+            image__in=names
+        ).values_list('image', flat=True))
+    return used
+
+
+class Command(BaseCommand):
+    '''Delete the recipe images no row references'''
+
+    help = (
+        'Compare the files under MEDIA_ROOT/uploads/recipe with the '
+        'images referenced in the database, both streamed in name order, '
+        'and delete the unreferenced files older than --grace-hours. The '
+        'reference counts of the shared images are recounted from the '
+        'recipes first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='report the orphans without deleting them',
+        )
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='keep newer files, their rows may not be committed yet',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--no-reconcile', action='store_false', dest='reconcile',
+            help='trust StoredFile as it is, without recounting it from '
+                 'the recipes',
+        )
+        parser.add_argument(
+            '--report-every', type=int, default=10000,
+            help='print the progress every this many files',
+        )
+
+    def _report(self, label, scanned, orphans, size, start):
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f'{label}: scanned {scanned} files in {elapsed:.1f}s '
+            f'({scanned / max(elapsed, 1e-9):.0f} files/s), '
+            f'{orphans} orphans of {size / 2 ** 20:.1f} MiB'
+        )
+
+    def _delete(self, batch, dry_run):
+        '''delete the candidates still unreferenced, count and size'''
+        used = still_referenced([name for name, _ in batch])
+        orphans = [entry for name, entry in batch if name not in used]
+        for entry in orphans:
+            if dry_run:
+                self.stdout.write(f'would delete {entry.path}')
+                continue
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        # DirEntry keeps the stat taken for the grace period
+        return len(orphans), sum(entry.stat().st_size for entry in orphans)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        cutoff = time.time() - options['grace_hours'] * 3600
+        scanned = orphans = size = 0
+
+        if options['reconcile']:
+            fixed, dropped = reconcile(
+                datetime.datetime.fromtimestamp(cutoff, datetime.timezone.utc),
+                options['batch_size'], options['dry_run'],
+            )
+            self.stdout.write(
+                f'reconciled: {fixed} reference counts fixed, {dropped} '
+                f'stored files without recipes dropped'
+            )
+
+        def counted(files):
+            nonlocal scanned
+            for item in files:
+                scanned += 1
+                if scanned % options['report_every'] == 0:
+                    self._report('progress', scanned, orphans, size, start)
+                yield item
+
+        files = counted(sorted_files(settings.MEDIA_ROOT, IMAGE_DIRECTORY))
+        candidates = (
+            (name, entry)
+            for name, entry in unreferenced(
+                files, referenced_names(options['batch_size'])
+            )
+            if entry.stat().st_mtime <= cutoff
+        )
+        while True:
+            batch = list(itertools.islice(candidates, options['batch_size']))
+            if not batch:
+                break
+            count, freed = self._delete(batch, options['dry_run'])
+            orphans += count
+            size += freed
+
+        label = 'dry run' if options['dry_run'] else 'deleted'
+        self._report(label, scanned, orphans, size, start)
@@ -0,0 +1,49 @@
+"""
+comando django para apagar em lotes os usuarios marcados para exclusao
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.deletion import claim, pending_deletions, run_deletion
+
+
+class Command(BaseCommand):
+    '''Delete the rows of the users queued by request_deletion'''
+
+    help = (
+        'Delete the recipes, tags, ingredients and images of the users '
+        'deleted from the admin, a short transaction per batch, then the '
+        'users. --loop keeps polling for new deletions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='keep running, checking for deletions every --interval',
+        )
+        parser.add_argument('--interval', type=float, default=10)
+
+    def _progress(self, deletion):
+        self.stdout.write(
+            f'{deletion.email}: {deletion.deleted_rows} rows, '
+            f'{deletion.deleted_files} files deleted'
+        )
+
+    def _run_pending(self, batch_size):
+        for deletion in pending_deletions():
+            if not claim(deletion):
+                continue
+            run_deletion(deletion, batch_size, progress=self._progress)
+            self.stdout.write(self.style.SUCCESS(
+                f'{deletion.email}: deleted, {deletion.deleted_rows} rows '
+                f'and {deletion.deleted_files} files'
+            ))
+
+    def handle(self, *args, **options):
+        while True:
+            self._run_pending(options['batch_size'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
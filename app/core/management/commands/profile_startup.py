@@ -0,0 +1,127 @@
+"""
+comando django para medir o tempo de import e de startup de um worker
+"""
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# what a worker does before serving, run in a fresh interpreter
+STARTUP_SCRIPT = '''
+import json, sys, time
+
+phases = []
+start = last = time.perf_counter()
+
+def phase(name):
+    global last
+    now = time.perf_counter()
+    phases.append((name, now - last))
+    last = now
+
+from django.conf import settings
+settings.INSTALLED_APPS
+phase('settings')
+
+import django
+django.setup()
+phase('app registry')
+
+from django.urls import get_resolver
+get_resolver().url_patterns
+phase('url conf')
+
+from core.readiness import warm_up
+warm_up(connect=False)
+phase('warm up')
+
+print(json.dumps({
+    'phases': phases,
+    'total': time.perf_counter() - start,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+# imported on demand only, a worker loading them at startup is a regression
+DEFERRED_MODULES = ('drf_spectacular.views', 'PIL')
+
+
+def parse_importtime(output):
+    '''[(module, self us, cumulative us, depth)] from -X importtime'''
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us),
+                        depth))
+    return imports
+
+
+class Command(BaseCommand):
+    '''Report where the startup time of a worker goes'''
+
+    help = (
+        'Start a worker in a fresh interpreter and report the time of each '
+        'startup phase, the import time per package and the slowest '
+        'imports, and check the deferred modules were not imported.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='number of packages and modules listed',
+        )
+
+    def _run_startup(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True, text=True, env=os.environ.copy(),
+        )
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout), parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        report, imports = self._run_startup()
+        limit = options['limit']
+
+        self.stdout.write(f'startup {report["total"] * 1000:.1f} ms')
+        for name, seconds in report['phases']:
+            self.stdout.write(f'  {name:<14} {seconds * 1000:8.1f} ms')
+
+        # self times don't overlap, they add up per package
+        packages = {}
+        for name, self_us, _, _ in imports:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+        self.stdout.write(f'\nimport time per package ({len(imports)} '
+                          f'modules)')
+        for package, self_us in sorted(
+            packages.items(), key=lambda item: -item[1]
+        )[:limit]:
+            self.stdout.write(f'  {package:<30} {self_us / 1000:8.1f} ms')
+
+        self.stdout.write('\nslowest imports, with what they import')
+        for name, _, cumulative_us, depth in sorted(
+            imports, key=lambda item: -item[2]
+        )[:limit]:
+            self.stdout.write(f'  {name:<40} {cumulative_us / 1000:8.1f} ms'
+                              f'  depth {depth}')
+
+        loaded = [
+            name for name in report['modules']
+            if name.startswith(DEFERRED_MODULES)
+        ]
+        if loaded:
+            self.stdout.write(self.style.WARNING(
+                f'\nimported at startup but meant to be lazy: '
+                f'{", ".join(loaded)}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'\nnot imported at startup: {", ".join(DEFERRED_MODULES)}'
+            ))
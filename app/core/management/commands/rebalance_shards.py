@@ -0,0 +1,111 @@
+"""
+comando django para mover usuarios entre shards
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core.db.sharding import move_user, shard_for_user, sharded_models
+
+
+class Command(BaseCommand):
+    '''Report shard usage and move users to even it out'''
+
+    help = (
+        'Show rows per shard and plan moves from the fullest to the '
+        'emptiest shard. --apply runs the plan, --move moves one user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--move', nargs=2, metavar=('USER_ID', 'SHARD'),
+            help='move a single user to SHARD',
+        )
+        parser.add_argument(
+            '--apply', action='store_true',
+            help='run the planned moves instead of only printing them',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.1,
+            help='stop once shards are within this fraction of each other',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def _user_weights(self, shard):
+        '''rows owned by each user on shard'''
+        weights = {}
+        for model in sharded_models()[:3]:
+            rows = model.objects.using(shard).values('user_id').annotate(
+                rows=Count('id')
+            )
+            for row in rows:
+                weights[row['user_id']] = (
+                    weights.get(row['user_id'], 0) + row['rows']
+                )
+        return weights
+
+    def _plan(self, weights, tolerance):
+        '''greedy moves of the best fitting user, fullest to emptiest'''
+        loads = {
+            shard: sum(users.values()) for shard, users in weights.items()
+        }
+        moves = []
+        while True:
+            source = max(loads, key=loads.get)
+            target = min(loads, key=loads.get)
+            gap = loads[source] - loads[target]
+            if gap <= tolerance * max(loads[source], 1):
+                break
+            candidates = [
+                (rows, user_id)
+                for user_id, rows in weights[source].items()
+                if rows <= gap / 2
+            ]
+            if not candidates:
+                break
+            rows, user_id = max(candidates)
+            del weights[source][user_id]
+            weights[target][user_id] = rows
+            loads[source] -= rows
+            loads[target] += rows
+            moves.append((user_id, source, target, rows))
+        return loads, moves
+
+    def _move(self, user_id, shard, batch_size):
+        user = get_user_model().objects.get(pk=user_id)
+        source = shard_for_user(user)
+        rows = move_user(user, shard, batch_size=batch_size)
+        self.stdout.write(f'moved user {user_id} {source} -> {shard}, '
+                          f'{rows} rows')
+
+    def handle(self, *args, **options):
+        shards = settings.SHARD_DATABASES
+        if not shards:
+            raise CommandError('Sharding is disabled, set DB_SHARDS')
+
+        if options['move']:
+            user_id, shard = options['move']
+            if shard not in shards:
+                raise CommandError(f'Unknown shard {shard}')
+            self._move(int(user_id), shard, options['batch_size'])
+            return
+
+        weights = {shard: self._user_weights(shard) for shard in shards}
+        for shard, users in weights.items():
+            self.stdout.write(
+                f'{shard}: {len(users)} users, {sum(users.values())} rows'
+            )
+
+        loads, moves = self._plan(weights, options['tolerance'])
+        for user_id, source, target, rows in moves:
+            self.stdout.write(
+                f'plan: user {user_id} {source} -> {target} ({rows} rows)'
+            )
+            if options['apply']:
+                self._move(user_id, target, options['batch_size'])
+
+        if not moves:
+            self.stdout.write(self.style.SUCCESS('Shards are balanced'))
+        elif not options['apply']:
+            self.stdout.write('dry run, pass --apply to move the users')
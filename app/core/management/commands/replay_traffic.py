@@ -0,0 +1,297 @@
+"""
+comando django para repetir requests gravados contra uma instancia
+"""
+import http.client
+import itertools
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework.authtoken.models import Token
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def read_records(path):
+    '''the requests of a JSONL file, one object per line, streamed'''
+    with open(path) as records:
+        for number, line in enumerate(records, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                raise CommandError(f'{path}:{number}: {exc}')
+            if 'path' not in record:
+                raise CommandError(f'{path}:{number}: no path')
+            yield record
+
+
+def route(method, path):
+    '''the url name of path, so /api/recipe/recipe/1/ and /2/ add up'''
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return f'{method} {path}'
+    return f'{method} {match.view_name or match.route}'
+
+
+def outcome(status):
+    '''ok, 4xx or 5xx, connection errors count as server errors'''
+    if not isinstance(status, int) or status >= 500:
+        return '5xx'
+    return '4xx' if status >= 400 else 'ok'
+
+
+def percentile(values, p):
+    '''p of sorted values, nearest rank'''
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Pacer:
+    '''
+    Hand out the records to the workers at their time: --rate per
+    second, or the recorded offsets divided by --speed.
+    '''
+
+    def __init__(self, records, rate=None, speed=None):
+        self.records = records
+        self.rate = rate
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.index = 0
+        self.first_time = None
+        self.start = None
+        # a bad line, raised by the command once the workers stopped
+        self.error = None
+
+    def _due(self, record):
+        if self.rate:
+            return self.index / self.rate
+        if self.speed and 'time' in record:
+            if self.first_time is None:
+                self.first_time = record['time']
+            return (record['time'] - self.first_time) / self.speed
+        return 0
+
+    def next(self):
+        '''the next record, after waiting for it, None at the end'''
+        with self.lock:
+            try:
+                record = next(self.records, None)
+            except CommandError as exc:
+                self.error = exc
+                self.records = iter(())
+                record = None
+            if record is None:
+                return None
+            if self.start is None:
+                self.start = time.monotonic()
+            due = self.start + self._due(record)
+            self.index += 1
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return record
+
+
+class Command(BaseCommand):
+    '''Replay recorded requests against a running instance'''
+
+    help = (
+        'Send the requests of a JSONL file, one object per line with '
+        'method, path, query, body, user and optionally time (seconds), '
+        'to a running instance, e.g. http://localhost:8000 for the '
+        'docker-compose stack. Each worker keeps one connection open. '
+        'Reports the throughput, the latency percentiles per route and the '
+        'error rates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--url', default='http://localhost:8000')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--rate', type=float,
+            help='requests per second, all of them, instead of the recorded '
+                 'times',
+        )
+        parser.add_argument(
+            '--speed', type=float, default=None,
+            help='follow the recorded times, this many times faster',
+        )
+        parser.add_argument('--limit', type=int, help='replay the first N')
+        parser.add_argument(
+            '--token',
+            help='API token sent for every recorded user, instead of the '
+                 'tokens of the users of this database',
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='create the recorded users missing from this database',
+        )
+
+    def _user(self, value, create):
+        '''the user recorded as value, an id or an email'''
+        users = get_user_model().objects
+        if isinstance(value, int) or str(value).isdigit():
+            user = users.filter(id=int(value)).first()
+            email = f'replay-{value}@example.com'
+        else:
+            user = users.filter(email=value).first()
+            email = value
+        if user is None:
+            user = users.filter(email=email).first()
+        if user is None and create:
+            user = users.create_user(email)
+        return user
+
+    def _tokens(self, options):
+        '''a function from recorded users to Authorization headers'''
+        cache = {}
+        lock = threading.Lock()
+
+        def authorization(value):
+            if value is None:
+                return None
+            if options['token']:
+                return f'Token {options["token"]}'
+            with lock:
+                if value not in cache:
+                    user = self._user(value, options['create_users'])
+                    cache[value] = user and \
+                        Token.objects.get_or_create(user=user)[0].key
+                    if user is None:
+                        self.stderr.write(
+                            f'unknown user {value}, replayed anonymously'
+                        )
+            return cache[value] and f'Token {cache[value]}'
+
+        return authorization
+
+    def _request(self, record, authorization):
+        '''method, path with its query, body and headers of record'''
+        method = record.get('method', 'GET').upper()
+        path = record['path']
+        query = record.get('query')
+        if isinstance(query, dict):
+            query = urlencode(query, doseq=True)
+        if query:
+            path += f'?{query}'
+
+        headers = {'Accept': 'application/json'}
+        token = authorization(record.get('user'))
+        if token:
+            headers['Authorization'] = token
+        body = record.get('body')
+        if body is not None:
+            if not isinstance(body, str):
+                body = json.dumps(body)
+            headers['Content-Type'] = record.get(
+                'content_type', 'application/json'
+            )
+            body = body.encode()
+        return method, path, body, headers
+
+    def _worker(self, url, pacer, authorization, results):
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        while True:
+            record = pacer.next()
+            if record is None:
+                break
+            method, path, body, headers = self._request(record, authorization)
+            name = route(method, record['path'])
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as exc:
+                # a new connection for the next request
+                conn.close()
+                status = type(exc).__name__
+            results.append((name, status, time.perf_counter() - start))
+        conn.close()
+        # the token lookups opened one for this thread
+        connections.close_all()
+
+    def _report(self, results, elapsed):
+        by_route = defaultdict(list)
+        statuses = Counter()
+        for name, status, latency in results:
+            by_route[name].append((status, latency))
+            statuses[status] += 1
+
+        failed = sum(
+            count for status, count in statuses.items()
+            if outcome(status) != 'ok'
+        )
+        self.stdout.write(
+            f'{len(results)} requests in {elapsed:.2f}s -> '
+            f'{len(results) / elapsed:.1f} req/s, '
+            f'{failed / len(results):.1%} errors'
+        )
+        self.stdout.write('statuses: ' + ', '.join(
+            f'{status} x{count}'
+            for status, count in sorted(
+                statuses.items(), key=lambda item: str(item[0])
+            )
+        ))
+        self.stdout.write(
+            f'{"route":<44} {"count":>6} {"req/s":>7} {"p50 ms":>8} '
+            f'{"p95 ms":>8} {"p99 ms":>8} {"4xx":>6} {"5xx":>6}'
+        )
+        for name, samples in sorted(
+            by_route.items(), key=lambda item: -len(item[1])
+        ):
+            latencies = sorted(latency * 1000 for _, latency in samples)
+            outcomes = Counter(outcome(status) for status, _ in samples)
+            self.stdout.write(
+                f'{name[:44]:<44} {len(samples):>6} '
+                f'{len(samples) / elapsed:>7.1f} ' + ' '.join(
+                    f'{percentile(latencies, p):>8.1f}' for p in PERCENTILES
+                ) +
+                f' {outcomes["4xx"] / len(samples):>6.1%}'
+                f' {outcomes["5xx"] / len(samples):>6.1%}'
+            )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// urls are supported')
+        if options['rate'] is not None and options['rate'] <= 0:
+            raise CommandError('--rate must be positive')
+
+        records = read_records(options['file'])
+        if options['limit']:
+            records = itertools.islice(records, options['limit'])
+        pacer = Pacer(records, options['rate'], options['speed'])
+        authorization = self._tokens(options)
+
+        results = []
+        workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(url, pacer, authorization, results),
+            )
+            for _ in range(options['concurrency'])
+        ]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if pacer.error is not None:
+            raise pacer.error
+        if not results:
+            raise CommandError(f'No requests in {options["file"]}')
+        self._report(results, elapsed)
@@ -0,0 +1,100 @@
+"""
+comando django para executar os jobs em segundo plano
+"""
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    '''Run the jobs queued with core.jobs.enqueue'''
+
+    help = (
+        'Claim and run the background jobs stored in the database, '
+        '--concurrency at a time. Several workers can run side by side. '
+        'SIGTERM lets the running jobs finish before exiting.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=settings.JOB_WORKER_CONCURRENCY,
+            help='jobs run at once, each in its own thread',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1)
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='exit once no job is due instead of waiting for more',
+        )
+
+    @staticmethod
+    def _close_old_connections():
+        '''
+        close_old_connections between jobs, one may leave its connection
+        broken or past CONN_MAX_AGE. Not the ones inside a transaction of
+        the caller (call_command in atomic), closing would break it.
+        '''
+        for connection in connections.all():
+            if not connection.in_atomic_block:
+                connection.close_if_unusable_or_obsolete()
+
+    def _work(self, worker, stop, options, threaded):
+        while not stop.is_set():
+            self._close_old_connections()
+            job = jobs.claim(worker)
+            if job is None:
+                if options['burst']:
+                    break
+                stop.wait(options['poll_interval'])
+                continue
+            succeeded = jobs.run(job)
+            self.stdout.write(
+                f'{worker} {job}: {"done" if succeeded else job.status} '
+                f'(attempt {job.attempts})'
+            )
+        if threaded:
+            connections.close_all()
+
+    def _renew_leases(self, prefix, stop):
+        '''keep the jobs of long running functions from being retaken'''
+        while not stop.wait(settings.JOB_LEASE_SECONDS / 3):
+            jobs.renew(prefix)
+        connections.close_all()
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}:'
+        previous = {
+            signum: signal.signal(signum, lambda *args: stop.set())
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        renewer = threading.Thread(
+            target=self._renew_leases, args=(prefix, stop), daemon=True
+        )
+        renewer.start()
+        try:
+            if options['concurrency'] == 1:
+                self._work(f'{prefix}0', stop, options, threaded=False)
+                return
+            workers = [
+                threading.Thread(
+                    target=self._work,
+                    args=(f'{prefix}{number}', stop, options, True),
+                )
+                for number in range(options['concurrency'])
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            stop.set()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
@@ -3,28 +3,77 @@ comando django para esperar o banco ligar
 """
 
 import time
+from concurrent import futures
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import used_databases
 
 
 class Command(BaseCommand):
     '''Django comand to wait for database'''
 
+    help = (
+        'Wait until every database answers, checking them in parallel '
+        'with exponential backoff. Fails after --timeout seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='give up after this many seconds, 0 waits forever',
+        )
+        parser.add_argument('--initial-delay', type=float, default=0.1)
+        parser.add_argument('--max-delay', type=float, default=5)
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='database alias to wait for, all of them by default',
+        )
+
+    def _available(self, alias):
+        try:
+            self.check(databases=[alias])
+        # captura os erros para a gente
+        except (Psycopg2Error, OperationalError):
+            return False
+        finally:
+            # opened by a pool thread, nobody would reuse it
+            connections[alias].close()
+        return True
+
     def handle(self, *args, **options):
         # Mensagem do momento de espera
         self.stdout.write('Waiting for database')
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-
-            # captura os erros para a gente
-            except (Psycopg2Error, OperationalError):
-                self.stdout.write('Database Unavilable, wait a second')
-                time.sleep(1)
+        pending = options['databases'] or used_databases()
+        deadline = (
+            time.monotonic() + options['timeout']
+            if options['timeout'] else None
+        )
+        delay = options['initial_delay']
+
+        with futures.ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            while True:
+                available = pool.map(self._available, pending)
+                pending = [
+                    alias for alias, up in zip(pending, available) if not up
+                ]
+                if not pending:
+                    break
+
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise CommandError(
+                        f'Database unavailable after {options["timeout"]}s: '
+                        f'{", ".join(pending)}'
+                    )
+                self.stdout.write(
+                    f'Database Unavilable ({", ".join(pending)}), '
+                    f'retrying in {delay:.1f}s'
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
 
         self.stdout.write(self.style.SUCCESS('Database Available'))
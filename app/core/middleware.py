@@ -0,0 +1,335 @@
+"""
+Middlewares for the project
+"""
+import hashlib
+import logging
+from collections import namedtuple
+from contextlib import ExitStack
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connections, DatabaseError
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.functional import empty
+from django.utils.module_loading import import_string
+
+from core.db.routers import start_replica_reads, stop_replica_reads
+from core.db.sharding import (
+    sharding_enabled,
+    start_shard_routing,
+    stop_shard_routing,
+)
+from core.instrumentation import SlowQueryRecorder, save_slow_queries
+from core.recording import writer
+from core.readiness import readiness
+
+logger = logging.getLogger(__name__)
+
+# a middleware list of PathRoutedMiddleware, built once
+MiddlewareChain = namedtuple('MiddlewareChain', [
+    'handler', 'view_hooks', 'template_response_hooks', 'exception_hooks',
+])
+
+
+class SlowQueryMiddleware:
+    '''record queries slower than SLOW_QUERY_THRESHOLD_MS with their plan'''
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD_MS is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(
+            settings.SLOW_QUERY_THRESHOLD_MS,
+            analyze=settings.SLOW_QUERY_EXPLAIN_ANALYZE,
+            request=request,
+        )
+        # every alias: the replicas and the shards run queries too
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        try:
+            save_slow_queries(recorder.entries)
+        except DatabaseError:
+            # never fail the request because the log could not be written
+            logger.exception('could not save slow queries')
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Let safe requests read from the replicas.
+
+    A client that wrote something stays on the primary for
+    REPLICA_PIN_SECONDS so it always reads its own writes. Clients are
+    told apart by their token, or their address before they have one,
+    and by their user once the view authenticated it. A token issued by
+    a write is pinned too: the next request of the client carries it.
+    '''
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.cache = caches[settings.REPLICA_PIN_CACHE]
+
+    def _key(self, client):
+        return 'replica-pin:' + hashlib.sha256(client.encode()).hexdigest()
+
+    def _pin_key(self, request):
+        return self._key(
+            request.META.get('HTTP_AUTHORIZATION') or
+            request.META.get('REMOTE_ADDR', '')
+        )
+
+    def _user(self, request):
+        '''the user of request if authenticated already, without loading it'''
+        user = request.__dict__.get('user')
+        # AuthenticationMiddleware sets a lazy object, loading it queries
+        if getattr(user, '_wrapped', None) is empty:
+            return None
+        return user
+
+    def _user_pinned(self, request):
+        '''None until the user is known, then whether it is pinned'''
+        def pinned():
+            user = self._user(request)
+            if user is None:
+                return None
+            if not user.is_authenticated:
+                return False
+            return self.cache.get(self._key(f'user:{user.id}')) is not None
+        return pinned
+
+    def _written_keys(self, request, response):
+        '''the keys pinned after a write'''
+        keys = [self._pin_key(request)]
+        user = self._user(request)
+        if user is not None and user.is_authenticated:
+            keys.append(self._key(f'user:{user.id}'))
+        # the token of a login or registration, the next request sends it
+        data = getattr(response, 'data', None)
+        if isinstance(data, dict) and isinstance(data.get('token'), str):
+            keys.append(self._key(f'Token {data["token"]}'))
+        return keys
+
+    def __call__(self, request):
+        key = self._pin_key(request)
+        safe = request.method in self.safe_methods
+        pinned = not safe or self.cache.get(key) is not None
+
+        token = start_replica_reads(pinned, self._user_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            state = stop_replica_reads(token)
+
+        if state.wrote or not safe:
+            self.cache.set_many(
+                dict.fromkeys(self._written_keys(request, response), True),
+                settings.REPLICA_PIN_SECONDS,
+            )
+        return response
+
+
+class ShardRoutingMiddleware:
+    '''
+    Route the API queries on user owned models to the shard of the
+    authenticated user. DRF authenticates inside the view and copies the
+    user onto the request, the router looks it up when a query runs.
+    '''
+
+    def __init__(self, get_response):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+
+        token = start_shard_routing(request)
+        try:
+            return self.get_response(request)
+        finally:
+            stop_shard_routing(token)
+
+
+class HealthCheckMiddleware:
+    '''
+    Answer the liveness and readiness probes before the rest of the
+    chain: no host validation, sessions or database work for /live.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == settings.HEALTH_LIVE_PATH:
+            return JsonResponse({'status': 'ok'})
+
+        if request.path == settings.HEALTH_READY_PATH:
+            ready, checks = readiness()
+            return JsonResponse(
+                {'status': 'ready' if ready else 'unavailable',
+                 'checks': checks},
+                status=200 if ready else 503,
+            )
+
+        return self.get_response(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    '''
+    GZipMiddleware for the responses of at least COMPRESSION_MIN_SIZE
+    bytes whose content type compresses well, images are left alone.
+    Only in the API chain: the admin pages carry CSRF tokens (BREACH).
+    '''
+
+    def process_response(self, request, response):
+        if (
+            not response.streaming and
+            len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if not content_type.startswith(
+            tuple(settings.COMPRESSION_CONTENT_TYPES)
+        ):
+            return response
+        return super().process_response(request, response)
+
+
+class RequestSamplingMiddleware:
+    '''
+    Record REQUEST_SAMPLE_RATE of the requests with their status and
+    duration, for replay_traffic. The request only queues a few fields,
+    a thread writes them (core.recording).
+    '''
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_SAMPLE_RATE:
+            return self.get_response(request)
+
+        body = None
+        length = request.META.get('CONTENT_LENGTH') or 0
+        if (
+            request.content_type == 'application/json' and
+            0 < int(length) <= settings.REQUEST_SAMPLE_MAX_BODY
+        ):
+            # now, once the view read the stream it is gone
+            body = request.body
+
+        started_at = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        # set by the DRF authentication, the token itself is not kept
+        user = getattr(request, 'user', None)
+        writer().put({
+            'time': started_at,
+            'method': request.method,
+            'path': request.path,
+            'query': {
+                key: values[0] if len(values) == 1 else values
+                for key, values in request.GET.lists()
+            },
+            'body': body,
+            'user': user.id if user and user.is_authenticated else None,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+        })
+        return response
+
+
+class PathRoutedMiddleware:
+    '''
+    Run LEAN_MIDDLEWARE for the paths under LEAN_MIDDLEWARE_PATHS and
+    FULL_MIDDLEWARE for the others. The token authenticated API needs no
+    sessions, CSRF, messages or request.user, the admin needs them all.
+    Both chains are built once, like Django builds MIDDLEWARE, and the
+    process_view, process_template_response and process_exception hooks
+    of the chain taken run as usual.
+    '''
+
+    def __init__(self, get_response):
+        self.lean_paths = tuple(settings.LEAN_MIDDLEWARE_PATHS)
+        self.lean = self._chain(settings.LEAN_MIDDLEWARE, get_response)
+        self.full = self._chain(settings.FULL_MIDDLEWARE, get_response)
+
+    def _chain(self, middleware_paths, get_response):
+        '''the handler and the hooks of the middleware, in Django's order'''
+        handler = convert_exception_to_response(get_response)
+        view_hooks = []
+        template_response_hooks = []
+        exception_hooks = []
+        for middleware_path in reversed(middleware_paths):
+            try:
+                middleware = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                view_hooks.insert(0, middleware.process_view)
+            # these two run from the innermost middleware out
+            if hasattr(middleware, 'process_template_response'):
+                template_response_hooks.append(
+                    middleware.process_template_response
+                )
+            if hasattr(middleware, 'process_exception'):
+                exception_hooks.append(middleware.process_exception)
+            handler = convert_exception_to_response(middleware)
+        return MiddlewareChain(
+            handler, view_hooks, template_response_hooks, exception_hooks
+        )
+
+    def _route(self, request):
+        if request.path_info.startswith(self.lean_paths):
+            return self.lean
+        return self.full
+
+    def __call__(self, request):
+        return self._route(request).handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in self._route(request).view_hooks:
+            response = process_view(request, view_func, view_args,
+                                    view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        for process_template_response in (
+            self._route(request).template_response_hooks
+        ):
+            response = process_template_response(request, response)
+            if response is None:
+                raise ValueError(
+                    f'{process_template_response.__self__.__class__.__name__}'
+                    f'.process_template_response didn\'t return an '
+                    f'HttpResponse object. It returned None instead.'
+                )
+        return response
+
+    def process_exception(self, request, exception):
+        for process_exception in self._route(request).exception_hooks:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
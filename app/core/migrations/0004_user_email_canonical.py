@@ -0,0 +1,70 @@
+from django.db import migrations, transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Lower, Trim
+
+BATCH_SIZE = 1000
+
+
+def canonical_email():
+    return Lower(Trim('email'))
+
+
+def deduplicate_emails(apps, schema_editor):
+    '''
+    Emails differing only by case belong to one person. The account used
+    last keeps the address, the others are deactivated and renamed, so
+    none of their rows are lost.
+    '''
+    User = apps.get_model('core', 'User')
+    users = User.objects.using(schema_editor.connection.alias)
+
+    duplicated = list(
+        users.annotate(canonical=canonical_email())
+        .values('canonical')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('canonical', flat=True)
+    )
+    for canonical in duplicated:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            accounts = list(
+                users.select_for_update()
+                .annotate(canonical=canonical_email())
+                .filter(canonical=canonical)
+                .order_by(F('last_login').desc(nulls_last=True), 'id')
+            )
+            local, _, domain = canonical.rpartition('@')
+            for user in accounts[1:]:
+                user.email = f'{local}+duplicate-{user.id}@{domain}'
+                user.is_active = False
+                user.save(update_fields=['email', 'is_active'])
+
+
+def lowercase_emails(apps, schema_editor):
+    '''store the canonical form, a transaction per batch of ids'''
+    User = apps.get_model('core', 'User')
+    users = User.objects.using(schema_editor.connection.alias)
+
+    last_id = users.aggregate(last_id=Max('id'))['last_id'] or 0
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            users.filter(
+                id__gte=start, id__lt=start + BATCH_SIZE
+            ).exclude(
+                email=canonical_email()
+            ).update(email=canonical_email())
+
+
+class Migration(migrations.Migration):
+
+    # batches commit on their own, a big users table isn't locked at once
+    atomic = False
+
+    dependencies = [
+        ('core', '0003_user_shard'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_emails, migrations.RunPython.noop),
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Django's istartswith on PostgreSQL is UPPER(column::text) LIKE 'X%',
+# these expression indexes serve it whatever the database collation
+INDEXES = [
+    ('core_recipe_title_prefix', 'core_recipe', 'title'),
+    ('core_tag_name_prefix', 'core_tag', 'name'),
+    ('core_ingredient_name_prefix', 'core_ingredient', 'name'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+            f'ON {table} (UPPER({column}::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0004_user_email_canonical'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# The autocomplete of users with too many names to cache runs
+# user_id = X AND UPPER(name::text) LIKE 'PREFIX%' (recipe.autocomplete)
+INDEXES = [
+    ('core_tag_user_name_prefix', 'core_tag'),
+    ('core_ingredient_user_name_prefix', 'core_ingredient'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+            f'ON {table} (user_id, UPPER(name::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_recipe_range_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
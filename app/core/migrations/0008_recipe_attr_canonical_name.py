@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_autocomplete_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='canonical_name',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='canonical_name',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'canonical_name'), name='core_ingredient_user_canonical_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'canonical_name'), name='core_tag_user_canonical_name_uniq'),
+        ),
+    ]
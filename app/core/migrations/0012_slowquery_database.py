@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_storedfile'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='slowquery',
+            name='params',
+        ),
+        migrations.AddField(
+            model_name='slowquery',
+            name='database',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
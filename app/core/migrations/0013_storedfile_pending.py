@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_slowquery_database'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedfile',
+            name='pending',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storedfile',
+            name='stored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -8,6 +8,10 @@ from django.db import models
 from django.contrib.auth.models import(AbstractBaseUser, BaseUserManager, PermissionsMixin)
 
 from django.conf import settings
+from django.utils import timezone
+
+from core.db.sharding import sharding_enabled, shard_for_new_user
+from core.storage import CountedImageField, recipe_image_storage
 
 
 ### helper function
@@ -20,6 +24,16 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads', 'recipe', filename)
 
 
+def clean_name(name):
+    '''name without surrounding or repeated spaces'''
+    return ' '.join(name.split())
+
+
+def canonical_name(name):
+    '''the spelling shared by names differing only by case and spaces'''
+    return clean_name(name).lower()
+
+
 
 class UserManager(BaseUserManager):
     """gerenciador de usuarios"""
@@ -32,8 +46,23 @@ class UserManager(BaseUserManager):
         user.set_password(password)
         user.save(using=self._db)
 
+        if sharding_enabled():
+            user.shard = shard_for_new_user(user.id)
+            user.save(using=self._db, update_fields=['shard'])
+
         return user
 
+    @classmethod
+    def normalize_email(cls, email):
+        """forma canonica do email, comparado sem diferenciar maiusculas"""
+        return (email or '').strip().lower()
+
+    def get_by_natural_key(self, username):
+        # the unique index on email serves the canonical form directly
+        return self.get(**{
+            self.model.USERNAME_FIELD: self.normalize_email(username)
+        })
+
     def create_superuser(self, email, password):
         """Função de criar super usuario"""
         user = self.create_user(email, password)
@@ -50,16 +79,26 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length = 255)
     is_active = models.BooleanField(default = True)
     is_staff = models.BooleanField(default = False)
+    # shard holding the user's recipes, empty for the users created
+    # before sharding: their rows stay on default (shard_for_user)
+    shard = models.CharField(max_length=50, blank=True)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+    def save(self, *args, **kwargs):
+        # emails are stored in canonical form, whichever path sets them
+        self.email = UserManager.normalize_email(self.email)
+        super().save(*args, **kwargs)
+
 class Recipe(models.Model):
     '''Recipe object'''
+    # users and their rows may live on different databases (sharding)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
 
     title = models.CharField(max_length=255)
@@ -69,29 +108,160 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # counts the references of the content addressed files
+    image = CountedImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage,
+    )
+
+    class Meta:
+        # the range filters and orderings of the recipe list, the id
+        # orders equal values so the rows come sorted from the index
+        indexes = [
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='core_recipe_user_time_idx',
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='core_recipe_user_price_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
-class Tag(models.Model):
-    '''Tag for filtering recipes'''
+class RecipeAttr(models.Model):
+    '''named item of a user attached to recipes, Tag and Ingredient'''
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    # NULL on the rows saved before it existed, until the
+    # merge_duplicate_names command fills it
+    canonical_name = models.CharField(
+        max_length=255, null=True, editable=False
     )
 
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'canonical_name'],
+                name='core_%(class)s_user_canonical_name_uniq',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.name = clean_name(self.name)
+        self.canonical_name = canonical_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'canonical_name'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
-class Ingredient(models.Model):
+
+class Tag(RecipeAttr):
+    '''Tag for filtering recipes'''
+
+
+class Ingredient(RecipeAttr):
     '''ingredient for recipes'''
-    name = models.CharField(max_length=255)
-    user = models.ForeignKey(
+
+class SlowQuery(models.Model):
+    '''SQL statement that took longer than SLOW_QUERY_THRESHOLD_MS'''
+    created_at = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.FloatField()
+    view = models.CharField(max_length=255, blank=True)
+    method = models.CharField(max_length=10, blank=True)
+    path = models.CharField(max_length=255, blank=True)
+    # alias of the connection, replicas and shards are wrapped too
+    database = models.CharField(max_length=100, blank=True)
+    # no parameters: token keys, password hashes and emails end up there
+    sql = models.TextField()
+    plan = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f'{self.view or self.path} ({self.duration_ms:.1f} ms)'
+
+
+class UserDeletion(models.Model):
+    '''User deleted in the background, see core.deletion'''
+    # NULL once the user row itself is gone
+    user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.SET_NULL,
+        null=True,
+    )
+    email = models.EmailField(max_length=255)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # worker holding the deletion until then, it renews it every batch
+    locked_until = models.DateTimeField(null=True)
+    deleted_rows = models.PositiveBigIntegerField(default=0)
+    deleted_files = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.email
+
+
+class Job(models.Model):
+    '''Background job run by the run_worker command, see core.jobs'''
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
     )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # a running job whose worker stopped renewing this is run again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # the claim query of the workers
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'],
+                name='core_job_status_run_after_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id}'
+
+
+class StoredFile(models.Model):
+    '''file of ContentAddressedStorage, with the rows using it'''
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    # committed rows using the file, counted on their commit
+    references = models.PositiveIntegerField(default=0)
+    # saved by the storage for rows not committed yet, see image_saved
+    pending = models.PositiveIntegerField(default=0)
+    stored_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
@@ -0,0 +1,139 @@
+"""
+Readiness of a worker: dependency checks and warm up
+"""
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, DatabaseError
+from django.urls import get_resolver, URLPattern, URLResolver
+
+from core.db import used_databases
+
+logger = logging.getLogger(__name__)
+
+_warmed_up = threading.Event()
+_executor = futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix='readiness'
+)
+_last_result = None
+_last_result_lock = threading.Lock()
+
+
+def check_database(alias):
+    '''run a trivial query, on a connection of its own'''
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        # check threads never serve requests, don't keep the connection
+        connection.close()
+
+
+def check_cache(alias):
+    cache = caches[alias]
+    cache.set('readiness-check', 1, 5)
+    if cache.get('readiness-check') != 1:
+        raise RuntimeError('value not stored')
+
+
+def check_media():
+    if not os.access(settings.MEDIA_ROOT, os.W_OK):
+        raise RuntimeError(f'{settings.MEDIA_ROOT} is not writable')
+
+
+def dependency_checks():
+    '''name -> callable raising when the dependency is unavailable'''
+    checks = {
+        f'database:{alias}': (check_database, alias)
+        for alias in used_databases()
+    }
+    checks.update({
+        f'cache:{alias}': (check_cache, alias) for alias in settings.CACHES
+    })
+    checks['media'] = (check_media,)
+    return checks
+
+
+def run_checks(timeout):
+    '''run every check in parallel, name -> "ok" or the error'''
+    pending = {
+        _executor.submit(*check): name
+        for name, check in dependency_checks().items()
+    }
+    done, not_done = futures.wait(pending, timeout=timeout)
+
+    results = {pending[future]: 'timeout' for future in not_done}
+    for future in done:
+        error = future.exception()
+        results[pending[future]] = 'ok' if error is None else str(error)
+    return results
+
+
+def readiness():
+    '''(ready, check results), cached for READINESS_CACHE_SECONDS'''
+    global _last_result
+
+    if not _warmed_up.is_set():
+        return False, {'warm_up': 'pending'}
+
+    with _last_result_lock:
+        now = time.monotonic()
+        if (
+            _last_result is None or
+            now - _last_result[0] > settings.READINESS_CACHE_SECONDS
+        ):
+            results = run_checks(settings.READINESS_TIMEOUT)
+            _last_result = (now, results)
+        results = _last_result[1]
+
+    return all(value == 'ok' for value in results.values()), results
+
+
+def _views(patterns):
+    '''every class based view reachable from the url patterns'''
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            view_class = getattr(pattern.callback, 'cls', None)
+            if view_class is not None:
+                yield view_class
+
+
+def connect_databases():
+    '''open the persistent connections of the current thread'''
+    for alias in used_databases():
+        connections[alias].ensure_connection()
+
+
+def warm_up(connect=True):
+    '''
+    Do the one time work of the first requests before reporting ready:
+    url resolver, serializer field introspection, caches and, unless
+    the process is about to fork, the database connections.
+    '''
+    resolver = get_resolver()
+    resolver.reverse_dict  # builds the reverse lookup tables
+
+    for view_class in set(_views(resolver.url_patterns)):
+        serializer_class = getattr(view_class, 'serializer_class', None)
+        if serializer_class is not None:
+            serializer_class().fields
+
+    for alias in settings.CACHES:
+        caches[alias].get('warm-up')
+
+    if connect:
+        try:
+            connect_databases()
+        except DatabaseError:
+            # the readiness checks report it until the database is back
+            logger.exception('could not pre-connect the databases')
+
+    _warmed_up.set()
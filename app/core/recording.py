@@ -0,0 +1,199 @@
+"""
+Sampled API requests written to rotating JSONL files
+
+RequestSamplingMiddleware (core.middleware) queues a few fields per
+sampled request, a thread of the process does the rest: redacting,
+serializing and writing. Each process writes its own files, named by its
+host and pid, so uwsgi workers never share one. The lines are read back
+by the replay_traffic command.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REDACTED = '[redacted]'
+# keys of the query and JSON bodies never written as they are
+SENSITIVE_KEY = re.compile(r'pass|token|secret|key|auth', re.IGNORECASE)
+
+# lines written together at most, between flushes
+BATCH_SIZE = 1000
+
+
+def redact(value):
+    '''value with the sensitive keys of its dicts, at any depth, hidden'''
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if SENSITIVE_KEY.search(str(key)) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def record_line(entry):
+    '''the JSON line of a queued entry, see replay_traffic'''
+    body = entry.pop('body', None)
+    if body is not None:
+        try:
+            entry['body'] = redact(json.loads(body))
+        except ValueError:
+            pass
+    entry['query'] = redact(entry.get('query') or {})
+    return json.dumps(entry, separators=(',', ':')) + '\n'
+
+
+class RecordWriter:
+    '''a queue and the thread writing it to the files of this process'''
+
+    def __init__(self, directory, max_bytes, max_files, queue_size):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pid = os.getpid()
+        self.prefix = f'requests-{socket.gethostname()}-{self.pid}'
+        self.dropped = 0
+        self.stopped = False
+        self.file = None
+        self.path = None
+        self.thread = threading.Thread(
+            target=self._run, name='request-recorder', daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        # the lines still queued when the worker exits
+        atexit.register(self.stop)
+
+    def put(self, entry):
+        '''queue entry, dropped rather than wait if the writer lags'''
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, timeout=5):
+        '''write what is queued and stop the thread'''
+        if self.stopped:
+            return
+        self.stopped = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(
+            self.directory, f'{self.prefix}-{time.time_ns()}.jsonl'
+        )
+        self.file = open(self.path, 'a')
+        self._prune()
+
+    def _prune(self):
+        '''delete the oldest files of every process beyond max_files'''
+        paths = glob.glob(os.path.join(self.directory, 'requests-*.jsonl'))
+        if len(paths) <= self.max_files:
+            return
+        dated = []
+        for path in paths:
+            try:
+                dated.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                # pruned by another process meanwhile
+                pass
+        dated.sort()
+        for _, path in dated[:len(dated) - self.max_files]:
+            if path == self.path:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _write(self, entries):
+        if self.file is None or self.file.tell() >= self.max_bytes:
+            if self.file is not None:
+                self.file.close()
+            self._open()
+        self.file.write(''.join(record_line(entry) for entry in entries))
+        self.file.flush()
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            logger.warning('%d sampled requests dropped, the writer lagged',
+                           dropped)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            entries = [entry]
+            while len(entries) < BATCH_SIZE:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                entries.append(entry)
+            try:
+                self._write(entries)
+            except (OSError, TypeError, ValueError):
+                # a lost sample must not stop the recording
+                logger.exception('could not write the sampled requests')
+        if self.file is not None:
+            self.file.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def writer():
+    '''
+    The writer of this process. Started on first use: uwsgi forks the
+    workers from a master that loaded the app, threads don't follow.
+    '''
+    global _writer
+    current = _writer
+    if current is None or current.pid != os.getpid() or current.stopped:
+        with _writer_lock:
+            current = _writer
+            if (
+                current is None or current.pid != os.getpid() or
+                current.stopped
+            ):
+                current = RecordWriter(
+                    settings.REQUEST_SAMPLE_DIR,
+                    settings.REQUEST_SAMPLE_MAX_BYTES,
+                    settings.REQUEST_SAMPLE_MAX_FILES,
+                    settings.REQUEST_SAMPLE_QUEUE_SIZE,
+                )
+                current.start()
+                _writer = current
+    return current
+
+
+def stop_writer():
+    '''flush and stop the writer of this process, if it runs'''
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer.pid == os.getpid():
+            _writer.stop()
+        _writer = None
@@ -0,0 +1,132 @@
+"""
+OpenAPI schema generated once and served pre-compressed
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from drf_spectacular.views import SpectacularAPIView
+
+
+class RenderedSchema:
+    '''schema bytes for one format and language, with its gzip variant'''
+
+    def __init__(self, body, gzipped=None):
+        self.body = body
+        self.gzipped = gzipped or gzip.compress(body, compresslevel=9)
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def schema_language():
+    '''
+    The active language if LANGUAGES has it (?lang= of the request), else
+    LANGUAGE_CODE: only those get a schema, in memory and on disk.
+    '''
+    try:
+        return translation.get_supported_language_variant(
+            translation.get_language()
+        )
+    except LookupError:
+        return translation.get_supported_language_variant(
+            settings.LANGUAGE_CODE
+        )
+
+
+def _file_name(media_type, language):
+    slug = re.sub(r'[^a-z0-9]+', '-', media_type.lower())
+    return f'schema-{slug}-{language or "default"}'
+
+
+def _read_cache_file(name):
+    directory = settings.SCHEMA_CACHE_DIR
+    if not directory:
+        return None
+    path = os.path.join(directory, name)
+    try:
+        with open(path, 'rb') as body, open(f'{path}.gz', 'rb') as gzipped:
+            return RenderedSchema(body.read(), gzipped.read())
+    except FileNotFoundError:
+        return None
+
+
+def _write_cache_file(name, schema):
+    '''write atomically, workers may read it at the same time'''
+    directory = settings.SCHEMA_CACHE_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for suffix, content in (('', schema.body), ('.gz', schema.gzipped)):
+        path = os.path.join(directory, name + suffix)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    '''
+    Generating the schema introspects every view and serializer. Do it
+    once per format and language: read it from SCHEMA_CACHE_DIR (see the
+    build_schema command) or generate it on the first request, then keep
+    it in the worker. Responses carry an ETag and are gzipped if the
+    client accepts it.
+    '''
+
+    _rendered = {}
+    _lock = threading.Lock()
+
+    def render_schema(self, renderer):
+        '''the schema rendered by renderer, not tied to any request'''
+        generator = self.generator_class(
+            urlconf=self.urlconf, api_version=self.api_version
+        )
+        data = generator.get_schema(request=None, public=self.serve_public)
+        return RenderedSchema(renderer.render(data, renderer.media_type, {}))
+
+    def get_rendered_schema(self, renderer):
+        language = schema_language()
+        key = (renderer.media_type, language)
+        schema = self._rendered.get(key)
+        if schema is not None:
+            return schema
+
+        with self._lock:
+            if key not in self._rendered:
+                name = _file_name(*key)
+                schema = _read_cache_file(name)
+                if schema is None:
+                    with translation.override(language):
+                        schema = self.render_schema(renderer)
+                    _write_cache_file(name, schema)
+                self._rendered[key] = schema
+            return self._rendered[key]
+
+    def _get_schema_response(self, request):
+        # a non public schema depends on the permissions of the user
+        if not settings.SCHEMA_CACHE or not self.serve_public:
+            return super()._get_schema_response(request)
+
+        renderer = request.accepted_renderer
+        schema = self.get_rendered_schema(renderer)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+
+        if request.META.get('HTTP_IF_NONE_MATCH') == schema.etag:
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(schema.gzipped, content_type=content_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(schema.body, content_type=content_type)
+
+        response['ETag'] = schema.etag
+        response['Cache-Control'] = settings.SCHEMA_CACHE_CONTROL
+        patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+        return response
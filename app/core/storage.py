@@ -0,0 +1,253 @@
+"""
+Content addressed storage for the recipe images
+
+Each distinct file is stored once, named by the SHA-256 of its content,
+however many recipes use it. StoredFile counts the references: a recipe
+row adds one when its transaction commits, deleting removes one and the
+file goes with the last of them. Saving only marks the file pending, so
+it is not deleted under a row still committing, and a row rolled back
+counts nothing. collect_orphaned_media recounts them from the rows.
+Names never change content, so the files can be cached forever.
+
+The static files get hashed names too, and gzip variants written once
+by collectstatic (CompressedManifestStaticFilesStorage).
+"""
+import gzip
+import hashlib
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.fields.files import ImageFieldFile
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+
+def content_hash(content):
+    '''SHA-256 of content, computed by the upload handlers if they could'''
+    digest = getattr(content, 'content_hash', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return digest
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''FileSystemStorage keeping one file per content'''
+
+    def hashed_name(self, name, digest):
+        '''the directory of name, two levels of fan out, the hash'''
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}'
+        )
+
+    def save(self, name, content, max_length=None):
+        # models import this module, see recipe_image_storage
+        from core.models import StoredFile
+
+        name = self.hashed_name(name, content_hash(content))
+        with transaction.atomic(using='default'):
+            # the lock keeps a delete of the last reference from
+            # removing the file between the check and the mark
+            stored, _ = StoredFile.objects.using('default') \
+                .select_for_update().get_or_create(
+                    name=name, defaults={'size': content.size},
+                )
+            if not self.exists(name):
+                name = self._save(name, content)
+            # counted by retain once the row using it commits
+            StoredFile.objects.using('default').filter(id=stored.id) \
+                .update(pending=F('pending') + 1, stored_at=timezone.now())
+        return name
+
+    def delete(self, name):
+        from core.models import StoredFile
+
+        with transaction.atomic(using='default'):
+            stored = StoredFile.objects.using('default') \
+                .select_for_update().filter(name=name).first()
+            if stored is None:
+                # saved before content addressing, not shared
+                return super().delete(name)
+            if stored.references > 1:
+                StoredFile.objects.using('default').filter(id=stored.id) \
+                    .update(references=F('references') - 1)
+                return
+            if stored.pending:
+                # a row being committed uses it
+                StoredFile.objects.using('default').filter(id=stored.id) \
+                    .update(references=0)
+                return
+            stored.delete()
+            super().delete(name)
+
+
+class CountedFieldFile(ImageFieldFile):
+    '''notes on its row that a file was stored, see image_saved'''
+
+    def save(self, name, content, save=True):
+        self.instance._image_uploaded = True
+        super().save(name, content, save)
+
+
+class CountedImageField(models.ImageField):
+    '''ImageField whose rows count their ContentAddressedStorage files'''
+    attr_class = CountedFieldFile
+
+
+def recipe_image_storage():
+    '''storage of Recipe.image, CONTENT_ADDRESSED_MEDIA picks the mode'''
+    if settings.CONTENT_ADDRESSED_MEDIA:
+        return ContentAddressedStorage()
+    return default_storage
+
+
+def retain(names, stored=False):
+    '''
+    Count references to stored files from rows, once committed. stored:
+    the files were saved through the storage for them and are no longer
+    pending, otherwise bulk copies or names assigned directly.
+    '''
+    from core.models import StoredFile
+
+    for name, count in Counter(filter(None, names)).items():
+        changes = {'references': F('references') + count}
+        if stored:
+            changes['pending'] = Greatest(F('pending') - count, Value(0))
+        StoredFile.objects.using('default').filter(name=name).update(
+            **changes
+        )
+
+
+def _storage(sender):
+    '''the image storage of sender if it counts references'''
+    storage = sender._meta.get_field('image').storage
+    if isinstance(storage, ContentAddressedStorage):
+        return storage
+    return None
+
+
+def _image_name(instance):
+    # a name until the attribute is accessed, missing when deferred
+    image = instance.__dict__.get('image')
+    return getattr(image, 'name', image) or None
+
+
+def _release_on_commit(storage, name, using):
+    if name:
+        transaction.on_commit(lambda: storage.delete(name), using=using)
+
+
+def _retain_on_commit(name, stored, using):
+    if name:
+        transaction.on_commit(lambda: retain([name], stored), using=using)
+
+
+def image_loaded(sender, instance, **kwargs):
+    '''post_init receiver of Recipe, remembers the stored image'''
+    instance._stored_image = _image_name(instance)
+
+
+def image_saved(sender, instance, **kwargs):
+    '''post_save receiver of Recipe, releases a replaced image'''
+    storage = _storage(sender)
+    name = _image_name(instance)
+    uploaded = instance.__dict__.pop('_image_uploaded', False)
+    if storage is not None and 'image' in instance.__dict__ and (
+        uploaded or instance._stored_image != name
+    ):
+        # the new image counted before the old one is released
+        _retain_on_commit(name, uploaded, instance._state.db)
+        _release_on_commit(
+            storage, instance._stored_image, instance._state.db
+        )
+    instance._stored_image = name
+
+
+def image_deleted(sender, instance, **kwargs):
+    '''post_delete receiver of Recipe'''
+    storage = _storage(sender)
+    if storage is not None:
+        _release_on_commit(
+            storage, _image_name(instance), instance._state.db
+        )
+
+
+class HashingUploadMixin:
+    '''hash the uploaded files while they stream in'''
+
+    def new_file(self, *args, **kwargs):
+        # before, the memory handler raises StopFutureHandlers
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # the memory handler passes files too big for it on, untouched
+        if getattr(self, 'activated', True):
+            self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+    HashingUploadMixin, MemoryFileUploadHandler
+):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(
+    HashingUploadMixin, TemporaryFileUploadHandler
+):
+    pass
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''
+    Static files under hashed names, each compressible one with a .gz
+    next to it for the gzip_static of the proxy.
+    '''
+    compressed_extensions = (
+        '.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml',
+        '.ttf', '.otf', '.eot',
+    )
+
+    def compress(self, name):
+        '''write name.gz, unless the file is too small to gain from it'''
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+        if len(content) < settings.COMPRESSION_MIN_SIZE:
+            return False
+        # mtime 0: the same bytes for the same file on every run
+        gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(gzipped) >= len(content):
+            return False
+        with open(f'{path}.gz', 'wb') as target:
+            target.write(gzipped)
+        return True
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # the copies under the original names are served too
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.lower().endswith(self.compressed_extensions):
+                self.compress(name)
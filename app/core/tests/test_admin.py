@@ -2,11 +2,17 @@
 test de funções de admin, para pagina web admin na web
 """
 
-from django.test import TestCase
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
 from django.urls import reverse
 from django.test import Client
 
+from core.models import Recipe, Tag, UserDeletion
+
 class AdminSiteTests(TestCase):
     """testes para o Django Admin"""
 
@@ -49,3 +55,90 @@ class AdminSiteTests(TestCase):
 
         self.assertEqual(res.status_code, 200)
 
+    def test_delete_user_in_background(self):
+        '''test deleting a user only disables it and queues the rows'''
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(UserDeletion.objects.filter(user=self.user).exists())
+
+
+class LargeTableAdminTests(TestCase):
+    """testes para o admin das tabelas grandes"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123'
+        )
+        self.client.force_login(self.admin_user)
+        self.tag = Tag.objects.create(user=self.admin_user, name='Vegan')
+        self.recipe = Recipe.objects.create(
+            user=self.admin_user, title='Soup', time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        self.recipe.tags.add(self.tag)
+
+    def test_recipe_change_page_uses_autocomplete(self):
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'admin-autocomplete')
+        self.assertContains(res, 'vForeignKeyRawIdAdminField')
+
+    def test_search_by_prefix(self):
+        Tag.objects.create(user=self.admin_user, name='Dessert')
+        url = reverse('admin:core_tag_changelist')
+
+        res = self.client.get(url, {'q': 'veg'})
+
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Dessert')
+
+    @patch('core.admin.estimated_count', return_value=5000000)
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=1000)
+    def test_unfiltered_count_estimated(self, patched_estimate):
+        res = self.client.get(reverse('admin:core_recipe_changelist'))
+
+        self.assertEqual(res.context['cl'].result_count, 5000000)
+
+    @override_settings(ADMIN_ACTION_BATCH_SIZE=2)
+    def test_delete_in_batches(self):
+        for number in range(4):
+            Tag.objects.create(user=self.admin_user, name=f'Tag {number}')
+        url = reverse('admin:core_tag_changelist')
+
+        res = self.client.post(url, {
+            'action': 'delete_in_batches',
+            'select_across': 1,
+            '_selected_action': [self.tag.id],
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(self.recipe.tags.exists())
+
+
+class JobAdminTests(TestCase):
+    """testes para o admin dos jobs"""
+
+    def test_retry_needs_change_permission(self):
+        staff = get_user_model().objects.create_user(
+            email='staff@example.com', password='testpass123', is_staff=True
+        )
+        staff.user_permissions.add(
+            Permission.objects.get(codename='view_job')
+        )
+        self.client.force_login(staff)
+
+        res = self.client.get(reverse('admin:core_job_changelist'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('retry_jobs', res.context['cl'].model_admin
+                         .get_actions(res.wsgi_request))
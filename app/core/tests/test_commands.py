@@ -2,12 +2,14 @@
 test custom django management commands
 '''
 
+from io import StringIO
 from unittest.mock import patch  # patch sobrescreve o codigo de teste
 
 from psycopg2 import OperationalError as Psycopg2Error
 
 # helper comand function from python, that allow to call comands by the name
 from django.core.management import call_command
+from django.core.management.base import CommandError
 
 
 # outro tipo gerador de erro, dependendo do ponto de conexão do banco de dados
@@ -16,6 +18,8 @@ from django.db.utils import OperationalError
 # teste simples sem conexão do banco de dados.
 from django.test import SimpleTestCase
 
+from core.management.commands.profile_startup import parse_importtime
+
 
 # para fazer o mock, do teste precisamos adicionar o @patch() antes
 # da classe para substituir a funcionalidade de conexão do banco por exemplo
@@ -49,3 +53,53 @@ class CommandTests(SimpleTestCase):
         self.assertEqual(patched_check.call_count, 6)
         # pode chamar o banco varias vezes
         patched_check.assert_called_with(databases=['default'])
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff(self, patched_sleep, patched_check):
+        '''o tempo de espera dobra a cada tentativa ate o maximo'''
+        patched_check.side_effect = [OperationalError] * 4 + [True]
+
+        call_command('wait_for_db', '--initial-delay=1', '--max-delay=3')
+
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(delays, [1, 2, 3, 3])
+
+    @patch('time.monotonic')
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(
+        self, patched_sleep, patched_monotonic, patched_check
+    ):
+        '''desiste depois do timeout'''
+        patched_check.side_effect = OperationalError
+        patched_monotonic.side_effect = [0, 5, 11]
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', '--timeout=10')
+
+        self.assertEqual(patched_check.call_count, 2)
+
+
+class ProfileStartupTests(SimpleTestCase):
+    """Test the startup profiling command"""
+
+    def test_parse_importtime(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   yaml.reader\n'
+            'import time:       300 |        420 | yaml\n'
+        )
+
+        imports = parse_importtime(output)
+
+        self.assertEqual(imports, [
+            ('yaml.reader', 120, 120, 1),
+            ('yaml', 300, 420, 0),
+        ])
+
+    def test_schema_machinery_not_imported(self):
+        out = StringIO()
+
+        call_command('profile_startup', '--limit', '3', stdout=out)
+
+        self.assertIn('app registry', out.getvalue())
+        self.assertIn('not imported at startup', out.getvalue())
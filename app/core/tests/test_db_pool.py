@@ -0,0 +1,103 @@
+"""
+tests for the health checked, bounded connections
+"""
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection, connections
+from django.db.utils import OperationalError
+from django.test import TransactionTestCase
+
+from core.db.pool import PooledConnectionMixin
+
+
+def make_wrapper(alias, **settings):
+    '''new connection to the test database using the pooled mixin'''
+    default = connections['default']
+    wrapper_class = type(
+        'PooledWrapper', (PooledConnectionMixin, default.__class__), {}
+    )
+    settings_dict = {**default.settings_dict, **settings}
+    return wrapper_class(settings_dict, alias)
+
+
+# the mixin extends the PostgreSQL backend (core.db.postgresql)
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class PooledConnectionTests(TransactionTestCase):
+    '''test connection reuse'''
+
+    def test_healthy_connection_reused(self):
+        '''a working connection is pinged once per request and kept'''
+        wrapper = make_wrapper(
+            'pool-reuse', CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True
+        )
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable', return_value=True) as ping:
+            wrapper.ensure_connection()
+            wrapper.ensure_connection()
+
+        ping.assert_called_once()
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+    def test_broken_connection_replaced(self):
+        '''a connection failing the health check is reopened'''
+        wrapper = make_wrapper(
+            'pool-broken', CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True
+        )
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable', return_value=False):
+            wrapper.ensure_connection()
+
+        self.assertIsNotNone(wrapper.connection)
+        self.assertIsNot(wrapper.connection, raw)
+        wrapper.close()
+
+    def test_pool_bound(self):
+        '''POOL_MAX_CONNECTIONS limits open connections per alias'''
+        first = make_wrapper(
+            'pool-bound', POOL_MAX_CONNECTIONS=1, POOL_TIMEOUT=0.01
+        )
+        second = make_wrapper(
+            'pool-bound', POOL_MAX_CONNECTIONS=1, POOL_TIMEOUT=0.01
+        )
+        first.ensure_connection()
+
+        with self.assertRaises(OperationalError):
+            second.ensure_connection()
+
+        first.close()
+        second.ensure_connection()
+        self.assertIsNotNone(second.connection)
+        second.close()
+
+    def test_idle_connection_frees_slot(self):
+        '''a connection kept between requests holds no slot'''
+        first = make_wrapper(
+            'pool-idle', CONN_MAX_AGE=60, POOL_MAX_CONNECTIONS=1,
+            POOL_TIMEOUT=0.01,
+        )
+        second = make_wrapper(
+            'pool-idle', CONN_MAX_AGE=60, POOL_MAX_CONNECTIONS=1,
+            POOL_TIMEOUT=0.01,
+        )
+        first.ensure_connection()
+        raw = first.connection
+        # end of the request
+        first.close_if_unusable_or_obsolete()
+
+        second.ensure_connection()
+        with self.assertRaises(OperationalError):
+            first.ensure_connection()
+        second.close_if_unusable_or_obsolete()
+
+        first.ensure_connection()
+        self.assertIs(first.connection, raw)
+        first.close()
+        second.close()
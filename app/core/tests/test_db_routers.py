@@ -0,0 +1,303 @@
+"""
+tests for the database routers
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    RequestFactory,
+    override_settings,
+)
+from django.urls import reverse
+
+from core import models
+from core.db.routers import (
+    ReplicaRouter,
+    ShardRouter,
+    start_replica_reads,
+    stop_replica_reads,
+)
+from core.db.sharding import (
+    move_user,
+    start_shard_routing,
+    stop_shard_routing,
+)
+from core.middleware import ReplicaRoutingMiddleware
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+    '''test routing reads to the replicas'''
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_outside_requests_use_primary(self):
+        '''commands and shell sessions are never routed'''
+        self.assertIsNone(self.router.db_for_read(models.Recipe))
+
+    def test_reads_use_replica(self):
+        '''reads in a replica context go to a replica'''
+        token = start_replica_reads()
+        try:
+            db = self.router.db_for_read(models.Recipe)
+        finally:
+            stop_replica_reads(token)
+
+        self.assertEqual(db, 'replica_1')
+
+    def test_reads_after_write_use_primary(self):
+        '''a write pins the rest of the request to the primary'''
+        token = start_replica_reads()
+        try:
+            self.router.db_for_write(models.Recipe)
+            db = self.router.db_for_read(models.Recipe)
+        finally:
+            state = stop_replica_reads(token)
+
+        self.assertIsNone(db)
+        self.assertTrue(state.wrote)
+
+    def test_replica_instance_saved_on_primary(self):
+        '''objects loaded from a replica are written to the primary'''
+        recipe = models.Recipe()
+        recipe._state.db = 'replica_1'
+
+        db = self.router.db_for_write(models.Recipe, instance=recipe)
+
+        self.assertEqual(db, 'default')
+
+    def test_no_migrations_on_replica(self):
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+    '''test read your writes stickiness between requests'''
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.routed = []
+
+        def get_response(request):
+            # as DRF does once it authenticated the token
+            if self.user is not None:
+                request.user = self.user
+            if request.method == 'POST':
+                self.router.db_for_write(models.Recipe)
+            self.routed.append(self.router.db_for_read(models.Recipe))
+            return None
+
+        self.user = None
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+        self.middleware.cache.clear()
+
+    def _request(self, method, token):
+        request = getattr(self.factory, method)(
+            '/api/recipe/recipe/', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.middleware(request)
+        return self.routed[-1]
+
+    def test_safe_request_reads_replica(self):
+        self.assertEqual(self._request('get', 'abc'), 'replica_1')
+
+    def test_read_after_own_write_uses_primary(self):
+        '''the writer is pinned, other clients are not'''
+        self.assertIsNone(self._request('post', 'abc'))
+
+        self.assertIsNone(self._request('get', 'abc'))
+        self.assertEqual(self._request('get', 'other'), 'replica_1')
+
+    def test_user_pinned_whatever_its_token(self):
+        '''the writer is known by its user once authenticated'''
+        self.user = get_user_model()(id=7)
+        self._request('post', 'abc')
+
+        self.assertIsNone(self._request('get', 'new-token'))
+        self.user = get_user_model()(id=8)
+        self.assertEqual(self._request('get', 'other'), 'replica_1')
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_PIN_SECONDS=60)
+class ReplicaReadYourWritesTests(TestCase):
+    '''
+    test a new client reads its writes: replica_1 mirrors default on
+    its own connection, it doesn't see the rows of the test transaction
+    '''
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        caches['node'].clear()
+
+    def test_register_token_then_read(self):
+        self.client.post(reverse('user:create'), {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+            'name': 'User',
+        })
+        res = self.client.post(reverse('user:token'), {
+            'email': 'user@example.com', 'password': 'testpass123',
+        })
+        auth = f'Token {res.json()["token"]}'
+
+        res = self.client.get(reverse('user:me'), HTTP_AUTHORIZATION=auth)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['email'], 'user@example.com')
+
+        # unpinned, the lagging replica doesn't know the token yet
+        caches['node'].clear()
+        res = self.client.get(reverse('user:me'), HTTP_AUTHORIZATION=auth)
+        self.assertEqual(res.status_code, 401)
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard_1'])
+class ShardRouterTests(SimpleTestCase):
+    '''test routing user owned rows to the user's shard'''
+
+    def setUp(self):
+        self.router = ShardRouter()
+        self.user = get_user_model()(id=3, shard='shard_1')
+
+    def test_route_on_instance(self):
+        '''rows of a new recipe follow its user'''
+        recipe = models.Recipe(user=self.user)
+
+        self.assertEqual(
+            self.router.db_for_write(models.Recipe, instance=recipe),
+            'shard_1',
+        )
+
+    def test_related_manager_of_user(self):
+        '''user.recipe_set reads from the user's shard'''
+        self.assertEqual(
+            self.router.db_for_read(models.Recipe, instance=self.user),
+            'shard_1',
+        )
+
+    def test_route_on_request_user(self):
+        '''querysets without hints use the authenticated user'''
+        request = RequestFactory().get('/api/recipe/tags/')
+        request.user = self.user
+        token = start_shard_routing(request)
+        try:
+            db = self.router.db_for_read(models.Tag)
+        finally:
+            stop_shard_routing(token)
+
+        self.assertEqual(db, 'shard_1')
+
+    def test_users_not_sharded(self):
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_user_created_before_sharding_on_default(self):
+        user = get_user_model()(id=4)
+        recipe = models.Recipe(user=user)
+
+        self.assertEqual(
+            self.router.db_for_write(models.Recipe, instance=recipe),
+            'default',
+        )
+
+    @override_settings(SHARD_DATABASES=[])
+    def test_disabled(self):
+        recipe = models.Recipe(user=self.user)
+
+        self.assertIsNone(
+            self.router.db_for_write(models.Recipe, instance=recipe)
+        )
+
+
+class ShardPlacementTests(TestCase):
+    '''test placing new users'''
+
+    @override_settings(SHARD_DATABASES=['default'])
+    def test_new_user_gets_shard(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+
+        user.refresh_from_db()
+        self.assertEqual(user.shard, 'default')
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard_1'])
+class MoveUserTests(TestCase):
+    '''test moving users between two real databases'''
+    databases = {'default', 'shard_1'}
+
+    def _user(self, email, recipes=2):
+        '''a user on default with tagged recipes'''
+        user = get_user_model().objects.create_user(email, 'testpass123')
+        user.shard = 'default'
+        user.save(update_fields=['shard'])
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        ingredient = models.Ingredient.objects.create(user=user, name='Salt')
+        for index in range(recipes):
+            recipe = models.Recipe.objects.create(
+                user=user, title=f'Recipe {index}', time_minutes=5,
+                price='1.00',
+            )
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        return user
+
+    def _ids(self, model, using, user):
+        return sorted(model.objects.using(using).filter(
+            user=user
+        ).values_list('id', flat=True))
+
+    def test_move_user(self):
+        user = self._user('user@example.com')
+        other = self._user('other@example.com')
+        recipe_ids = self._ids(models.Recipe, 'default', user)
+        tag_ids = self._ids(models.Tag, 'default', user)
+
+        copied = move_user(user, 'shard_1')
+
+        # 2 recipes, a tag, an ingredient and 4 links
+        self.assertEqual(copied, 8)
+        self.assertEqual(self._ids(models.Recipe, 'shard_1', user),
+                         recipe_ids)
+        self.assertEqual(self._ids(models.Tag, 'shard_1', user), tag_ids)
+        links = models.Recipe.tags.through.objects.using('shard_1')
+        self.assertEqual(
+            sorted(links.values_list('recipe_id', 'tag_id')),
+            [(recipe_id, tag_ids[0]) for recipe_id in recipe_ids],
+        )
+        self.assertEqual(
+            models.Recipe.ingredients.through.objects.using(
+                'shard_1'
+            ).count(), 2,
+        )
+        for model in (models.Recipe, models.Tag, models.Ingredient):
+            self.assertEqual(self._ids(model, 'default', user), [])
+        self.assertFalse(models.Recipe.tags.through.objects.using(
+            'default'
+        ).filter(recipe_id__in=recipe_ids).exists())
+        user.refresh_from_db()
+        self.assertEqual(user.shard, 'shard_1')
+        # the other user stays where it was
+        self.assertEqual(len(self._ids(models.Recipe, 'default', other)), 2)
+
+    def test_rebalance_moves_users(self):
+        self._user('user@example.com', recipes=3)
+        small = self._user('other@example.com', recipes=1)
+        out = StringIO()
+
+        call_command('rebalance_shards', '--apply', stdout=out)
+
+        small.refresh_from_db()
+        self.assertEqual(small.shard, 'shard_1')
+        self.assertIn(f'moved user {small.id} default -> shard_1',
+                      out.getvalue())
+        self.assertEqual(
+            len(self._ids(models.Recipe, 'shard_1', small)), 1
+        )
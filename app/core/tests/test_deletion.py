@@ -0,0 +1,109 @@
+'''
+Tests for deleting users in the background
+'''
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.deletion import claim, request_deletion, run_deletion
+from core.models import Recipe, Tag, Ingredient, Job, UserDeletion
+
+
+class UserDeletionTests(TestCase):
+    '''Test request_deletion and process_user_deletions'''
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'
+        )
+        for user in (self.user, self.other):
+            for number in range(3):
+                recipe = Recipe.objects.create(
+                    user=user, title=f'Recipe {number}', time_minutes=5,
+                    price=Decimal('2.00'),
+                )
+                recipe.tags.add(
+                    Tag.objects.create(user=user, name=f'Tag {number}')
+                )
+                recipe.ingredients.add(Ingredient.objects.create(
+                    user=user, name=f'Ingredient {number}'
+                ))
+        self.recipe = Recipe.objects.filter(user=self.user).first()
+        # counted once the row commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.image.save('photo.jpg', ContentFile(b'jpeg'))
+
+    def test_request_disables_user(self):
+        deletion = request_deletion(self.user)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(deletion.email, 'user@example.com')
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+
+    def test_deleted_by_worker(self):
+        request_deletion(self.user)
+
+        call_command('run_worker', '--burst', '--concurrency', '1',
+                     stdout=StringIO())
+
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+    def test_command_deletes_in_batches(self):
+        image_path = self.recipe.image.path
+        request_deletion(self.user)
+        out = StringIO()
+
+        # shared images are released once the deletions commit
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_user_deletions', '--batch-size', '2',
+                         stdout=out)
+
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
+        for model in (Recipe, Tag, Ingredient):
+            self.assertFalse(model.objects.filter(user_id=self.user.id)
+                             .exists())
+            self.assertEqual(model.objects.filter(user=self.other).count(),
+                             3)
+        self.assertFalse(os.path.exists(image_path))
+        deletion = UserDeletion.objects.get()
+        self.assertIsNone(deletion.user)
+        self.assertIsNotNone(deletion.finished_at)
+        # 3 recipes, their 6 m2m rows, 3 tags and 3 ingredients
+        self.assertEqual(deletion.deleted_rows, 15)
+        self.assertEqual(deletion.deleted_files, 1)
+        self.assertIn('user@example.com: 6 rows, 1 files', out.getvalue())
+
+    def test_claimed_deletion_skipped(self):
+        deletion = request_deletion(self.user)
+
+        self.assertTrue(claim(deletion))
+        self.assertFalse(claim(deletion))
+
+    def test_run_again_after_finishing(self):
+        deletion = request_deletion(self.user)
+        run_deletion(deletion)
+
+        run_deletion(deletion)
+
+        self.assertEqual(deletion.deleted_rows, 15)
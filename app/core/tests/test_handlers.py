@@ -0,0 +1,69 @@
+"""
+tests for the pooled ASGI handler
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
+from django.test import SimpleTestCase, override_settings
+
+from core.handlers import PooledASGIHandler
+
+
+class PooledASGIHandlerTests(SimpleTestCase):
+    '''test running sync code on the pool threads'''
+
+    def setUp(self):
+        self.threads = []
+        request_started.connect(self._record_thread)
+
+    def tearDown(self):
+        request_started.disconnect(self._record_thread)
+
+    def _record_thread(self, **kwargs):
+        self.threads.append(threading.current_thread().name)
+
+    async def _get(self, handler, path):
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'host', b'testserver')],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await handler(scope, receive, send)
+        return messages[0]['status']
+
+    async def _get_twice(self, handler):
+        first = await self._get(handler, '/api/docs/')
+        second = await self._get(handler, '/api/docs/')
+        return first, second
+
+    @override_settings(ASGI_SYNC_THREADS=1)
+    def test_request_runs_on_pool_thread(self):
+        '''run like uvicorn does, in an event loop without a sync parent'''
+        handler = PooledASGIHandler()
+
+        first, second = asyncio.run(self._get_twice(handler))
+
+        self.assertEqual((first, second), (200, 200))
+        self.assertEqual(len(self.threads), 2)
+        self.assertTrue(self.threads[0].startswith('asgi-sync'))
+        # the thread outlives the request and is reused
+        self.assertEqual(self.threads[0], self.threads[1])
+
+    def test_unsupported_asgiref_refused(self):
+        '''an asgiref without the internals the handler relies on'''
+        with patch('core.handlers.SyncToAsync', object):
+            with self.assertRaises(ImproperlyConfigured):
+                PooledASGIHandler()
@@ -0,0 +1,75 @@
+"""
+tests for the calibrated password hasher
+"""
+import threading
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashers
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class CalibratedHasherTests(TestCase):
+    '''test hashes follow the configured iteration count'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+
+    def test_new_hash_uses_setting(self):
+        algorithm, iterations, _, _ = self.user.password.split('$')
+
+        self.assertEqual(algorithm, 'pbkdf2_sha256')
+        self.assertEqual(iterations, '1000')
+
+    def test_login_upgrades_hash(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            res = APIClient().post(reverse('user:token'), {
+                'email': 'user@example.com', 'password': 'testpass123',
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password.split('$')[1], '2000')
+        self.assertTrue(self.user.check_password('testpass123'))
+
+
+class HashingSlotsTests(SimpleTestCase):
+    '''test the hashes computed at once are bounded'''
+
+    def setUp(self):
+        hashers._slots = None
+        self.addCleanup(setattr, hashers, '_slots', None)
+
+    @override_settings(PASSWORD_HASH_CONCURRENCY=1,
+                       PASSWORD_HASH_ITERATIONS=1000)
+    def test_waits_for_a_slot(self):
+        hasher = get_hasher()
+        thread = threading.Thread(
+            target=hasher.encode, args=('password', hasher.salt())
+        )
+
+        with hashers.hashing_slots():
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_calibrate_command(self):
+        out = StringIO()
+
+        call_command('calibrate_hasher', '--target-ms', '1',
+                     '--min-iterations', '5000', '--rounds', '1', stdout=out)
+
+        self.assertIn('PASSWORD_HASH_ITERATIONS=', out.getvalue())
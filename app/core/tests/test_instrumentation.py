@@ -0,0 +1,83 @@
+"""
+tests for the slow query instrumentation
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+
+from core import models
+from core.instrumentation import SlowQueryRecorder, save_slow_queries
+from core.middleware import SlowQueryMiddleware
+
+
+class SlowQueryRecorderTests(TestCase):
+    '''test capturing slow queries'''
+
+    def test_capture_query_over_threshold(self):
+        '''every query is slow with a zero threshold'''
+        request = RequestFactory().get('/api/recipe/recipe/')
+        recorder = SlowQueryRecorder(0, request=request)
+
+        with connection.execute_wrapper(recorder):
+            list(get_user_model().objects.filter(email='a@example.com'))
+
+        self.assertEqual(len(recorder.entries), 1)
+        entry = recorder.entries[0]
+        self.assertNotIn('params', entry)
+        self.assertNotIn('a@example.com', entry['sql'])
+        self.assertEqual(entry['database'], 'default')
+        self.assertNotEqual(entry['plan'], '')
+        self.assertEqual(entry['path'], '/api/recipe/recipe/')
+        self.assertEqual(entry['method'], 'GET')
+
+    def test_fast_query_ignored(self):
+        '''queries under the threshold are not captured'''
+        recorder = SlowQueryRecorder(60 * 1000)
+
+        with connection.execute_wrapper(recorder):
+            get_user_model().objects.count()
+
+        self.assertEqual(recorder.entries, [])
+
+    def test_failed_explain_keeps_transaction(self):
+        '''the EXPLAIN runs in a savepoint of the caller transaction'''
+        recorder = SlowQueryRecorder(0)
+
+        with transaction.atomic():
+            plan = recorder._explain(
+                connection, 'SELECT missing FROM nowhere', []
+            )
+            # still usable, on PostgreSQL too
+            count = get_user_model().objects.count()
+
+        self.assertTrue(plan.startswith('EXPLAIN failed'))
+        self.assertEqual(count, 0)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_middleware_wraps_every_database(self):
+        '''replicas and shards are recorded, not only default'''
+        wrapped = []
+
+        def get_response(request):
+            wrapped.extend(
+                bool(conn.execute_wrappers) for conn in connections.all()
+            )
+            return HttpResponse()
+
+        SlowQueryMiddleware(get_response)(RequestFactory().get('/api/'))
+
+        self.assertEqual(wrapped, [True] * len(connections.all()))
+
+    @override_settings(SLOW_QUERY_LOG_MAX_ROWS=2)
+    def test_log_is_bounded(self):
+        '''older entries are pruned past SLOW_QUERY_LOG_MAX_ROWS'''
+        entries = [
+            {'duration_ms': i, 'sql': f'SELECT {i}'} for i in range(5)
+        ]
+        save_slow_queries(entries)
+
+        sqls = list(models.SlowQuery.objects.order_by('id').values_list(
+            'sql', flat=True
+        ))
+        self.assertEqual(sqls, ['SELECT 3', 'SELECT 4'])
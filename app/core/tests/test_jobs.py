@@ -0,0 +1,116 @@
+'''
+Tests for the background jobs
+'''
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+@jobs.job
+def record(value):
+    calls.append(value)
+
+
+@jobs.job
+def fail():
+    raise ValueError('broken')
+
+
+def not_a_job():
+    pass
+
+
+class JobTests(TestCase):
+    '''Test enqueue, claim and run'''
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_follows_transaction(self):
+        try:
+            with transaction.atomic():
+                jobs.enqueue(record, value=1)
+                raise RuntimeError('rolled back')
+        except RuntimeError:
+            pass
+
+        self.assertFalse(Job.objects.exists())
+
+    def test_enqueue_unregistered_function(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue(not_a_job)
+
+    def test_claim_and_run(self):
+        queued = jobs.enqueue(record, value=1)
+
+        job = jobs.claim('worker')
+        succeeded = jobs.run(job)
+
+        self.assertEqual(job.id, queued.id)
+        self.assertTrue(succeeded)
+        self.assertEqual(calls, [1])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_delayed_job_not_claimed(self):
+        jobs.enqueue(record, delay=60, value=1)
+
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_failure_retried_with_backoff(self):
+        jobs.enqueue(fail)
+
+        job = jobs.claim('worker')
+        jobs.run(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('ValueError: broken', job.last_error)
+
+    def test_failed_after_max_attempts(self):
+        jobs.enqueue(fail, max_attempts=1)
+
+        jobs.run(jobs.claim('worker'))
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(jobs.retry(Job.objects.all()), 1)
+        self.assertEqual(jobs.claim('worker').id, job.id)
+
+    def test_expired_lease_claimed_again(self):
+        jobs.enqueue(record, value=1)
+        job = jobs.claim('dead worker')
+        Job.objects.filter(id=job.id).update(
+            locked_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+        job = jobs.claim('worker')
+
+        self.assertEqual(job.locked_by, 'worker')
+        self.assertEqual(job.attempts, 2)
+
+    def test_worker_command_runs_due_jobs(self):
+        jobs.enqueue(record, value=1)
+        jobs.enqueue(record, value=2)
+        out = StringIO()
+
+        call_command('run_worker', '--burst', '--concurrency', '1',
+                     stdout=out)
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(
+            Job.objects.filter(status=Job.Status.DONE).count(), 2
+        )
+        self.assertIn('test_jobs.record', out.getvalue())
@@ -0,0 +1,164 @@
+'''
+Tests for the orphaned media collector
+'''
+import datetime
+import os
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.db.sharding import move_user
+from core.management.commands.collect_orphaned_media import (
+    sorted_files,
+    unreferenced,
+)
+from core.models import Recipe, StoredFile
+
+
+class CollectOrphanedMediaTests(TestCase):
+    '''Test the collect_orphaned_media command'''
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.root = media.name
+        settings = override_settings(MEDIA_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('2.00'),
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(b'used'))
+        self.used = self.recipe.image.path
+        self.orphan = self._file('uploads/recipe/old.jpg', age=48)
+        self.recent = self._file('uploads/recipe/new.jpg', age=1)
+
+    def _file(self, name, age):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'orphan')
+        mtime = time.time() - age * 3600
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_orphans_past_grace_deleted(self):
+        out = StringIO()
+
+        call_command('collect_orphaned_media', stdout=out)
+
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.recent))
+        self.assertTrue(os.path.exists(self.used))
+        self.assertIn('deleted: scanned 3 files', out.getvalue())
+        self.assertIn('1 orphans', out.getvalue())
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+
+        call_command('collect_orphaned_media', '--dry-run', stdout=out)
+
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertIn(f'would delete {self.orphan}', out.getvalue())
+
+    def test_files_sorted_like_names(self):
+        for name in ['uploads/recipe/ab/x.jpg', 'uploads/recipe/ab-x.jpg']:
+            self._file(name, age=48)
+
+        names = [name for name, _ in sorted_files(self.root, 'uploads')]
+
+        self.assertEqual(names, sorted(names))
+
+    def test_unreferenced(self):
+        files = [(name, None) for name in ['a', 'b', 'c', 'd']]
+
+        orphans = unreferenced(files, iter(['b', 'b', 'd', 'e']))
+
+        self.assertEqual([name for name, _ in orphans], ['a', 'c'])
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard_1'])
+class ReconcileStoredFilesTests(TestCase):
+    '''Test the reference counts are recounted from every database'''
+    databases = {'default', 'shard_1'}
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.root = media.name
+        settings = override_settings(MEDIA_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.old = timezone.now() - datetime.timedelta(hours=48)
+
+    def _recipe(self, email):
+        user = get_user_model().objects.create_user(email, 'testpass123')
+        user.shard = 'default'
+        user.save(update_fields=['shard'])
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('2.00'),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save('photo.jpg', ContentFile(b'shared'))
+        return recipe
+
+    def _stored(self, name, **fields):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'stored')
+        mtime = time.time() - 48 * 3600
+        os.utime(path, (mtime, mtime))
+        StoredFile.objects.create(name=name, size=6, **fields)
+        return path
+
+    def test_counts_recounted_on_every_database(self):
+        self._recipe('user@example.com')
+        moved = self._recipe('other@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            move_user(moved.user, 'shard_1')
+        shared = StoredFile.objects.get()
+        self.assertEqual(shared.references, 2)
+        StoredFile.objects.update(references=7, pending=1, stored_at=self.old)
+        dropped = self._stored('uploads/recipe/aa/aa/gone.jpg',
+                               references=1, stored_at=self.old)
+        pending = self._stored('uploads/recipe/bb/bb/new.jpg', pending=1,
+                               stored_at=timezone.now())
+        out = StringIO()
+
+        call_command('collect_orphaned_media', stdout=out)
+
+        self.assertIn('1 reference counts fixed, 1 stored files',
+                      out.getvalue())
+        shared.refresh_from_db()
+        self.assertEqual((shared.references, shared.pending), (2, 0))
+        self.assertTrue(os.path.exists(os.path.join(self.root, shared.name)))
+        self.assertFalse(os.path.exists(dropped))
+        self.assertTrue(os.path.exists(pending))
+        self.assertEqual(
+            set(StoredFile.objects.values_list('name', flat=True)),
+            {shared.name, 'uploads/recipe/bb/bb/new.jpg'},
+        )
+
+    def test_counts_raised_at_once(self):
+        recipe = self._recipe('user@example.com')
+        StoredFile.objects.update(references=0, stored_at=timezone.now())
+
+        call_command('collect_orphaned_media', '--no-reconcile',
+                     stdout=StringIO())
+        self.assertEqual(StoredFile.objects.get().references, 0)
+
+        call_command('collect_orphaned_media', stdout=StringIO())
+        self.assertEqual(StoredFile.objects.get().references, 1)
+        self.assertTrue(os.path.exists(recipe.image.path))
@@ -0,0 +1,180 @@
+"""
+tests for the path routed middleware chains
+"""
+import gzip
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.checks import check_admin_middleware
+from core.middleware import PathRoutedMiddleware
+from core.models import Tag
+
+
+class HookMiddleware:
+    '''every hook, recording the calls on the request'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_template_response(self, request, response):
+        request.hooks.append('template_response')
+        return response
+
+    def process_exception(self, request, exception):
+        request.hooks.append('exception')
+        return HttpResponse(str(exception), status=503)
+
+
+class PathRoutedMiddlewareTests(TestCase):
+    '''test the API gets the lean chain and the admin the full one'''
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_api_skips_session_and_csrf(self):
+        res = self.client.post(reverse('user:create'), {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+            'name': 'User',
+        })
+
+        self.assertEqual(res.status_code, 201)
+        self.assertNotIn('X-Frame-Options', res)
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+
+    def test_admin_runs_full_chain(self):
+        res = self.client.get(reverse('admin:login'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Frame-Options'], 'DENY')
+        self.assertTrue(hasattr(res.wsgi_request, 'user'))
+
+    def test_admin_csrf_enforced(self):
+        get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123'
+        )
+
+        res = self.client.post(reverse('admin:login'), {
+            'username': 'admin@example.com', 'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_bench_command(self):
+        out = StringIO()
+
+        call_command('bench_middleware', '--requests', '10', '--rounds', '1',
+                     stdout=out)
+
+        self.assertIn('/api/bench/', out.getvalue())
+
+
+@override_settings(
+    LEAN_MIDDLEWARE_PATHS=['/api/'],
+    LEAN_MIDDLEWARE=[],
+    FULL_MIDDLEWARE=['core.tests.test_middleware.HookMiddleware'],
+)
+class PathRoutedHooksTests(SimpleTestCase):
+    '''test the hooks of the chain taken are forwarded'''
+
+    def setUp(self):
+        self.middleware = PathRoutedMiddleware(lambda request: None)
+
+    def _request(self, path):
+        request = RequestFactory().get(path)
+        request.hooks = []
+        return request
+
+    def test_exception_hooks_of_chain(self):
+        request = self._request('/admin/')
+
+        res = self.middleware.process_exception(request, ValueError('down'))
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(request.hooks, ['exception'])
+        request = self._request('/api/recipe/')
+        self.assertIsNone(
+            self.middleware.process_exception(request, ValueError('down'))
+        )
+        self.assertEqual(request.hooks, [])
+
+    def test_template_response_hooks_of_chain(self):
+        request = self._request('/admin/')
+        response = HttpResponse()
+
+        res = self.middleware.process_template_response(request, response)
+
+        self.assertIs(res, response)
+        self.assertEqual(request.hooks, ['template_response'])
+
+
+class AdminMiddlewareCheckTests(SimpleTestCase):
+    '''test the admin middleware are looked for in FULL_MIDDLEWARE'''
+
+    def test_settings_pass(self):
+        self.assertEqual(check_admin_middleware(), [])
+
+    @override_settings(FULL_MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ])
+    def test_missing_middleware_reported(self):
+        errors = check_admin_middleware()
+
+        self.assertEqual([error.id for error in errors], ['core.E002'])
+        self.assertIn('FULL_MIDDLEWARE', errors[0].msg)
+
+
+class CompressionMiddlewareTests(TestCase):
+    '''test the API responses are gzipped above the threshold'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Tag.objects.bulk_create([
+            Tag(user=self.user, name=f'Tag number {i}') for i in range(100)
+        ])
+
+    def test_large_response_gzipped(self):
+        res = self.client.get(
+            reverse('recipe:tag-list'), HTTP_ACCEPT_ENCODING='gzip, br'
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(res.content))), 100)
+
+    def test_not_gzipped_unless_accepted(self):
+        res = self.client.get(reverse('recipe:tag-list'))
+
+        self.assertNotIn('Content-Encoding', res)
+        self.assertEqual(len(res.json()), 100)
+
+    def test_small_response_not_gzipped(self):
+        Tag.objects.all().delete()
+
+        res = self.client.get(
+            reverse('recipe:tag-list'), HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertNotIn('Content-Encoding', res)
@@ -1,11 +1,16 @@
 """
 Tests for models
 """
+from importlib import import_module
+from types import SimpleNamespace
 from unittest.mock import patch
 from decimal import Decimal
 
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from core import models
 
@@ -32,8 +37,8 @@ class ModelTests(TestCase):
         ''' test if its a valid email '''
         sample_emails = [
             ['test1@EXAMPLE.com', 'test1@example.com'],
-            ['Test2@Example.com', 'Test2@example.com'],
-            ['TEST3@EXAMPLE.com', 'TEST3@example.com'],
+            ['Test2@Example.com', 'test2@example.com'],
+            ['TEST3@EXAMPLE.com', 'test3@example.com'],
             ['test4@example.COM', 'test4@example.com'],
         ]
         for email, expected in sample_emails:
@@ -100,4 +105,31 @@ class ModelTests(TestCase):
         # this is the function that will receive the image pathfile
         file_path =models.recipe_image_file_path(None, 'example.jpg')
 
-        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
\ No newline at end of file
+        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+
+    def test_email_canonical_migration(self):
+        '''test duplicated emails are resolved before being lowercased'''
+        migration = import_module('core.migrations.0004_user_email_canonical')
+        users = get_user_model().objects
+        old = create_user('old@example.com')
+        used = create_user('used@example.com')
+        other = create_user('other@example.com')
+        # stored as typed before the canonical form
+        users.filter(pk=old.pk).update(email='Same@Example.com')
+        users.filter(pk=used.pk).update(
+            email='same@example.com', last_login=timezone.now()
+        )
+        users.filter(pk=other.pk).update(email='Other@Example.com')
+
+        schema_editor = SimpleNamespace(connection=connection)
+        migration.deduplicate_emails(apps, schema_editor)
+        migration.lowercase_emails(apps, schema_editor)
+
+        used.refresh_from_db()
+        old.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(used.email, 'same@example.com')
+        self.assertEqual(old.email, f'same+duplicate-{old.pk}@example.com')
+        self.assertFalse(old.is_active)
+        self.assertEqual(other.email, 'other@example.com')
+        self.assertTrue(other.is_active)
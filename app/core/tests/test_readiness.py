@@ -0,0 +1,46 @@
+"""
+tests for the health probes
+"""
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from core import readiness
+
+
+@override_settings(READINESS_CACHE_SECONDS=0)
+class HealthCheckTests(TestCase):
+    '''test the liveness and readiness endpoints'''
+
+    def tearDown(self):
+        readiness._warmed_up.clear()
+
+    def test_live(self):
+        res = self.client.get('/health/live')
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_not_ready_before_warm_up(self):
+        res = self.client.get('/health/ready')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks'], {'warm_up': 'pending'})
+
+    @patch('core.readiness.check_media')
+    def test_ready_after_warm_up(self, patched_media):
+        readiness.warm_up(connect=False)
+
+        res = self.client.get('/health/ready')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['checks']['database:default'], 'ok')
+
+    @patch('core.readiness.check_media')
+    def test_failed_dependency_not_ready(self, patched_media):
+        patched_media.side_effect = RuntimeError('not writable')
+        readiness.warm_up(connect=False)
+
+        res = self.client.get('/health/ready')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['media'], 'not writable')
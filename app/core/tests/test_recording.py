@@ -0,0 +1,125 @@
+"""
+tests for the sampled request recording
+"""
+import glob
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.recording import RecordWriter, redact, stop_writer
+
+
+def read_lines(directory):
+    lines = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        with open(path) as records:
+            lines.extend(json.loads(line) for line in records)
+    return lines
+
+
+class RequestSamplingMiddlewareTests(TestCase):
+    '''test the sampled requests are written, their secrets hidden'''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.client = APIClient()
+
+    def _records(self):
+        stop_writer()
+        return read_lines(self.directory)
+
+    def test_requests_recorded(self):
+        with self.settings(REQUEST_SAMPLE_RATE=1,
+                           REQUEST_SAMPLE_DIR=self.directory):
+            self.client.post(reverse('user:create'), {
+                'email': 'user@example.com',
+                'password': 'testpass123',
+                'name': 'User',
+            }, format='json')
+            user = get_user_model().objects.get()
+            self.client.force_authenticate(user)
+            self.client.get(reverse('recipe:tag-list'),
+                            {'assigned_only': 1, 'token': 'abc'})
+            records = self._records()
+
+        create, tags = records
+        self.assertEqual(create['method'], 'POST')
+        self.assertEqual(create['path'], reverse('user:create'))
+        self.assertEqual(create['status'], 201)
+        self.assertEqual(create['body']['email'], 'user@example.com')
+        self.assertEqual(create['body']['password'], '[redacted]')
+        self.assertIsNone(create['user'])
+        self.assertEqual(tags['user'], user.id)
+        self.assertEqual(tags['query'],
+                         {'assigned_only': '1', 'token': '[redacted]'})
+        self.assertGreater(tags['duration_ms'], 0)
+        self.assertNotIn('body', tags)
+
+    @override_settings(REQUEST_SAMPLE_RATE=0)
+    def test_nothing_recorded_when_disabled(self):
+        with self.settings(REQUEST_SAMPLE_DIR=self.directory):
+            self.client.get(reverse('recipe:tag-list'))
+
+        self.assertEqual(self._records(), [])
+
+
+class RecordWriterTests(TestCase):
+    '''test the files rotate and the request never waits on them'''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_files_rotated_and_pruned(self):
+        writer = RecordWriter(self.directory, max_bytes=100, max_files=3,
+                              queue_size=100)
+        for index in range(20):
+            # a batch each, the thread is not needed
+            writer._write([{'path': f'/api/{index}/', 'body': b'{"a": 1}'}])
+        writer.file.close()
+
+        files = glob.glob(os.path.join(self.directory, '*.jsonl'))
+        self.assertEqual(len(files), 3)
+        self.assertIn(writer.path, files)
+        with open(writer.path) as records:
+            last = [json.loads(line) for line in records][-1]
+        self.assertEqual(last, {
+            'path': '/api/19/', 'query': {}, 'body': {'a': 1},
+        })
+
+    def test_queued_lines_written_on_stop(self):
+        writer = RecordWriter(self.directory, max_bytes=2 ** 20,
+                              max_files=3, queue_size=100)
+        writer.start()
+        for index in range(10):
+            writer.put({'path': f'/api/{index}/'})
+        writer.stop()
+
+        self.assertFalse(writer.thread.is_alive())
+        self.assertEqual(len(read_lines(self.directory)), 10)
+
+    def test_full_queue_drops(self):
+        writer = RecordWriter(self.directory, max_bytes=100, max_files=3,
+                              queue_size=1)
+
+        writer.put({'path': '/api/'})
+        writer.put({'path': '/api/'})
+
+        self.assertEqual(writer.dropped, 1)
+
+    def test_redact(self):
+        self.assertEqual(
+            redact({'user': {'Password': 'x', 'name': 'y'},
+                    'items': [{'api_key': 'z'}]}),
+            {'user': {'Password': '[redacted]', 'name': 'y'},
+             'items': [{'api_key': '[redacted]'}]},
+        )
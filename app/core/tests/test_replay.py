@@ -0,0 +1,82 @@
+"""
+tests for the replay_traffic command
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase
+
+from core.models import Tag
+
+
+class ReplayTrafficTests(LiveServerTestCase):
+    '''test recorded requests are replayed against a running server'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        records = tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', delete=False
+        )
+        self.addCleanup(os.remove, records.name)
+        self.file = records.name
+        self.records = records
+
+    def _write(self, *records):
+        with self.records:
+            for record in records:
+                self.records.write(json.dumps(record) + '\n')
+
+    def _replay(self, *args):
+        out = StringIO()
+        call_command(
+            'replay_traffic', self.file, '--url', self.live_server_url,
+            *args, stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_report_per_route(self):
+        self._write(*[
+            {'method': 'GET', 'path': '/api/recipe/tags/',
+             'query': {'assigned_only': 0}, 'user': self.user.id,
+             'time': index * 0.01}
+            for index in range(6)
+        ], {
+            'method': 'POST', 'path': '/api/recipe/recipe/',
+            'body': {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'},
+        })
+
+        out = self._replay('--concurrency', '2', '--speed', '10')
+
+        self.assertIn('7 requests in', out)
+        self.assertIn('14.3% errors', out)
+        tags = next(line for line in out.splitlines()
+                    if line.startswith('GET recipe:tag-list'))
+        self.assertEqual(tags.split()[2], '6')
+        # anonymous, refused
+        recipe = next(line for line in out.splitlines()
+                      if line.startswith('POST recipe:recipe-list'))
+        self.assertTrue(recipe.endswith('100.0%   0.0%'))
+
+    def test_users_created_on_request(self):
+        self._write({'path': '/api/recipe/tags/', 'user': 'new@example.com'})
+
+        out = self._replay('--create-users', '--rate', '50')
+
+        self.assertIn('0.0% errors', out)
+        self.assertTrue(get_user_model().objects.filter(
+            email='new@example.com'
+        ).exists())
+
+    def test_bad_line_rejected(self):
+        self._write({'method': 'GET'})
+
+        with self.assertRaisesMessage(CommandError, ':1: no path'):
+            self._replay()
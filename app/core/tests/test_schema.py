@@ -0,0 +1,87 @@
+"""
+tests for the cached schema endpoint
+"""
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.schema import CachedSpectacularAPIView
+
+SCHEMA_URL = reverse('api_schema')
+
+
+class CachedSchemaTests(TestCase):
+    '''test the schema is rendered once and served with validators'''
+
+    def setUp(self):
+        CachedSpectacularAPIView._rendered.clear()
+
+    def tearDown(self):
+        CachedSpectacularAPIView._rendered.clear()
+
+    def test_etag_and_not_modified(self):
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'openapi', res.content)
+        self.assertIn('ETag', res)
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+
+    def test_gzip_when_accepted(self):
+        plain = self.client.get(SCHEMA_URL)
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_json_format(self):
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('openapi', json.loads(res.content))
+
+    @override_settings(SCHEMA_CACHE=False)
+    def test_cache_disabled(self):
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('ETag', res)
+
+    def test_build_schema_files_are_served(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(SCHEMA_CACHE_DIR=directory):
+                call_command('build_schema', stdout=StringIO())
+                # the view must serve the files, not render it again
+                for name in os.listdir(directory):
+                    with open(os.path.join(directory, name), 'wb') as file:
+                        file.write(b'prebuilt')
+
+                res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.content, b'prebuilt')
+
+    def test_unknown_language_falls_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(SCHEMA_CACHE_DIR=directory):
+                self.client.get(SCHEMA_URL, {'format': 'json'})
+                files = sorted(os.listdir(directory))
+                for lang in ('abc1', 'abc2', 'x/../y'):
+                    res = self.client.get(
+                        SCHEMA_URL, {'format': 'json', 'lang': lang}
+                    )
+                    self.assertEqual(res.status_code, 200)
+
+                self.assertEqual(sorted(os.listdir(directory)), files)
+
+        self.assertEqual(len(CachedSpectacularAPIView._rendered), 1)
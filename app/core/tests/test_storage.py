@@ -0,0 +1,197 @@
+'''
+Tests for the content addressed image storage
+'''
+import gzip
+import hashlib
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from PIL import Image
+
+from core.models import Recipe, StoredFile
+from core.storage import (
+    CompressedManifestStaticFilesStorage,
+    ContentAddressedStorage,
+    retain,
+)
+
+
+class ContentAddressedStorageTests(TestCase):
+    '''Test storing each content once'''
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = ContentAddressedStorage(location=media.name)
+
+    def test_same_content_stored_once(self):
+        first = self.storage.save('uploads/a.JPG', ContentFile(b'photo'))
+        second = self.storage.save('uploads/b.jpg', ContentFile(b'photo'))
+
+        digest = hashlib.sha256(b'photo').hexdigest()
+        self.assertEqual(first, second)
+        self.assertEqual(
+            first, f'uploads/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        )
+        # counted when the rows using it commit
+        stored = StoredFile.objects.get(name=first)
+        self.assertEqual((stored.references, stored.pending), (0, 2))
+
+        retain([first, second], stored=True)
+        stored.refresh_from_db()
+        self.assertEqual((stored.references, stored.pending), (2, 0))
+
+    def test_file_deleted_with_last_reference(self):
+        name = self.storage.save('uploads/a.jpg', ContentFile(b'photo'))
+        self.storage.save('uploads/b.jpg', ContentFile(b'photo'))
+        retain([name, name], stored=True)
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_pending_file_kept(self):
+        '''the last reference released while another row commits'''
+        name = self.storage.save('uploads/a.jpg', ContentFile(b'photo'))
+        retain([name], stored=True)
+        self.storage.save('uploads/b.jpg', ContentFile(b'photo'))
+
+        self.storage.delete(name)
+
+        self.assertTrue(self.storage.exists(name))
+        retain([name], stored=True)
+        stored = StoredFile.objects.get()
+        self.assertEqual((stored.references, stored.pending), (1, 0))
+
+
+class RecipeImageReferenceTests(TestCase):
+    '''Test recipes counting their images'''
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _recipe(self):
+        return Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+
+    def _upload(self, recipe, color):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10), color).save(image_file, 'JPEG')
+            image_file.seek(0)
+            url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+            return self.client.post(url, {'image': image_file},
+                                    format='multipart')
+
+    def test_uploads_of_same_image_share_file(self):
+        first, second = self._recipe(), self._recipe()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(first, 'red')
+            self._upload(second, 'red')
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(StoredFile.objects.get().references, 2)
+        with first.image.open('rb') as stored:
+            digest = hashlib.sha256(stored.read()).hexdigest()
+        self.assertIn(digest, first.image.name)
+
+    def test_replaced_and_deleted_images_released(self):
+        recipe = self._recipe()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(recipe, 'red')
+        recipe.refresh_from_db()
+        red = recipe.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(recipe, 'blue')
+        recipe.refresh_from_db()
+        self.assertFalse(os.path.exists(red))
+        self.assertTrue(os.path.exists(recipe.image.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_rolled_back_row_counts_nothing(self):
+        recipe = self._recipe()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    recipe.image.save('photo.jpg', ContentFile(b'jpeg'))
+                    raise DatabaseError('lost')
+            except DatabaseError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertFalse(StoredFile.objects.filter(references__gt=0).exists())
+
+
+class CompressedStaticFilesTests(TestCase):
+    '''test collectstatic writes hashed names and gzip variants'''
+
+    def setUp(self):
+        self.source = tempfile.TemporaryDirectory()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.source.cleanup)
+        self.addCleanup(self.root.cleanup)
+        self.css = 'body { color: red; }\n' * 200
+        for name, content in (('app.css', self.css), ('tiny.js', 'x = 1')):
+            with open(os.path.join(self.source.name, name), 'w') as file:
+                file.write(content)
+
+    def test_collectstatic(self):
+        with self.settings(
+            STATICFILES_DIRS=[self.source.name],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder',
+            ],
+            STATIC_ROOT=self.root.name,
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'
+            ),
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            storage = CompressedManifestStaticFilesStorage()
+            hashed = storage.stored_name('app.css')
+
+        self.assertRegex(hashed, r'^app\.[0-9a-f]{12}\.css$')
+        for name in (hashed, 'app.css'):
+            with gzip.open(storage.path(name + '.gz'), 'rt') as file:
+                self.assertEqual(file.read(), self.css)
+        # too small to gain anything
+        self.assertFalse(os.path.exists(storage.path('tiny.js.gz')))
+
+    def test_not_collected_name_rejected(self):
+        '''a name missing from the manifest fails, never served unhashed'''
+        with self.settings(STATIC_ROOT=self.root.name, DEBUG=False):
+            storage = CompressedManifestStaticFilesStorage()
+
+            with self.assertRaises(ValueError):
+                storage.url('admin/css/base.css')
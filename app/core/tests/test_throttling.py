@@ -0,0 +1,112 @@
+"""
+tests for the shared token bucket throttle
+"""
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import SharedBuckets, parse_rate
+
+
+class SharedBucketsTests(SimpleTestCase):
+    '''test the buckets in the mapped file'''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'buckets')
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/min'), (120, 2))
+        self.assertEqual(parse_rate('10/s'), (10, 10))
+
+    def test_burst_then_refill(self):
+        buckets = SharedBuckets(self.path, 64)
+
+        allowed = [buckets.consume('key', 3, 1, now=100) for _ in range(3)]
+        denied = buckets.consume('key', 3, 1, now=100)
+
+        self.assertEqual(allowed, [0, 0, 0])
+        self.assertAlmostEqual(denied, 1)
+        self.assertEqual(buckets.consume('key', 3, 1, now=101), 0)
+
+    def test_keys_are_independent(self):
+        buckets = SharedBuckets(self.path, 64)
+
+        buckets.consume('a', 1, 1, now=100)
+
+        self.assertEqual(buckets.consume('b', 1, 1, now=100), 0)
+        self.assertGreater(buckets.consume('a', 1, 1, now=100), 0)
+
+    def test_shared_between_processes(self):
+        buckets = SharedBuckets(self.path, 64)
+        buckets.consume('key', 2, 1, now=100)
+
+        pid = os.fork()
+        if pid == 0:
+            # the other worker takes the last token
+            os._exit(SharedBuckets(self.path, 64).consume(
+                'key', 2, 1, now=100
+            ) != 0)
+        _, status_code = os.waitpid(pid, 0)
+
+        self.assertEqual(os.waitstatus_to_exitcode(status_code), 0)
+        self.assertGreater(buckets.consume('key', 2, 1, now=100), 0)
+
+    def test_full_group_evicts_oldest(self):
+        buckets = SharedBuckets(self.path, 4)
+
+        for second, key in enumerate('abcde'):
+            buckets.consume(key, 1, 0.001, now=100 + second)
+
+        # "a" lost its slot, it starts with a full bucket again
+        self.assertEqual(buckets.consume('a', 1, 0.001, now=106), 0)
+
+
+class ThrottleApiTests(TestCase):
+    '''test the throttle on the recipe endpoints'''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(
+            THROTTLE_FILE=os.path.join(directory.name, 'buckets'),
+            REST_FRAMEWORK={
+                'DEFAULT_THROTTLE_CLASSES': [
+                    'core.throttling.SharedTokenBucketThrottle',
+                ],
+                'DEFAULT_THROTTLE_RATES': {'user': '3/min', 'upload': '1/min'},
+            },
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_user_rate(self):
+        url = reverse('recipe:recipe-list')
+        codes = [self.client.get(url).status_code for _ in range(4)]
+
+        self.assertEqual(codes, [200, 200, 200, 429])
+
+    def test_action_scope_is_stricter(self):
+        url = reverse('recipe:recipe-upload-image', args=[1])
+
+        self.client.post(url, {})
+        res = self.client.post(url, {})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        # the other endpoints keep their own bucket
+        res = self.client.get(reverse('recipe:recipe-list'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,154 @@
+"""
+Token bucket throttling shared by the worker processes of a node
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# key hash, tokens left, time of the last update
+SLOT = struct.Struct('=Qdd')
+# a key lives in one of the WAYS slots of its group
+WAYS = 4
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    '''"100/min" -> (100 tokens, 100 / 60 tokens per second)'''
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class SharedBuckets:
+    '''
+    Token buckets in a file mapped by every worker. The table is split in
+    groups of WAYS slots, a key hashes to a group and, when the group is
+    full, takes the slot updated longest ago. A group is locked with a
+    record lock on its bytes, so workers only wait on the same group.
+    '''
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.groups = max(1, slots // WAYS)
+        self.size = self.groups * WAYS * SLOT.size
+        self._fd = None
+        self._map = None
+        self._open_lock = threading.Lock()
+        # record locks belong to the process, threads need their own
+        self._thread_locks = [threading.Lock() for _ in range(64)]
+
+    def _open(self):
+        with self._open_lock:
+            if self._map is None:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                if os.fstat(fd).st_size != self.size:
+                    os.ftruncate(fd, self.size)
+                self._map = mmap.mmap(fd, self.size)
+                self._fd = fd
+        return self._map
+
+    def consume(self, key, capacity, refill, now=None):
+        '''take a token, 0 when allowed, else seconds until the next one'''
+        now = time.time() if now is None else now
+        digest = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little'
+        ) or 1
+        group = digest % self.groups
+        start = group * WAYS * SLOT.size
+        length = WAYS * SLOT.size
+        buffer = self._map if self._map is not None else self._open()
+
+        with self._thread_locks[group % len(self._thread_locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                slots = [
+                    SLOT.unpack_from(buffer, start + way * SLOT.size)
+                    for way in range(WAYS)
+                ]
+                way = next(
+                    (way for way, slot in enumerate(slots)
+                     if slot[0] == digest),
+                    None
+                )
+                if way is None:
+                    way = min(range(WAYS), key=lambda way: slots[way][2])
+                    tokens = capacity
+                else:
+                    _, tokens, last = slots[way]
+                    if 0 <= tokens <= capacity and last <= now:
+                        tokens = min(capacity, tokens + (now - last) * refill)
+                    else:
+                        # clock went back or the rate changed, start over
+                        tokens = capacity
+
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0
+                else:
+                    wait = (1 - tokens) / refill
+                SLOT.pack_into(
+                    buffer, start + way * SLOT.size, digest, tokens, now
+                )
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+        return wait
+
+
+def shared_buckets():
+    '''the buckets of THROTTLE_FILE, opened once per process'''
+    key = (settings.THROTTLE_FILE, settings.THROTTLE_SLOTS)
+    buckets = _buckets.get(key)
+    if buckets is None:
+        with _buckets_lock:
+            buckets = _buckets.setdefault(key, SharedBuckets(*key))
+    return buckets
+
+
+class SharedTokenBucketThrottle(BaseThrottle):
+    '''
+    A bucket per user, or client address, and endpoint. Actions listed in
+    the throttle_scopes of a view use the rate of that scope, the others
+    the "user" or "anon" rate of DEFAULT_THROTTLE_RATES.
+    '''
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None)
+        )
+        if scope:
+            return scope
+        if request.user and request.user.is_authenticated:
+            return 'user'
+        return 'anon'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = f'user-{request.user.pk}'
+        else:
+            ident = self.get_ident(request)
+        endpoint = getattr(view, 'basename', None) or type(view).__name__
+        action = getattr(view, 'action', None) or request.method
+        key = f'{scope}:{endpoint}.{action}:{ident}'
+
+        self.wait_seconds = shared_buckets().consume(key, *parse_rate(rate))
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
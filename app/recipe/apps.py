@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class RecipeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from core.models import Ingredient, Tag
+        from recipe.autocomplete import names_changed
+
+        for model in (Tag, Ingredient):
+            post_save.connect(names_changed, sender=model)
+            post_delete.connect(names_changed, sender=model)
@@ -0,0 +1,177 @@
+"""
+Autocomplete over the tag and ingredient names of a user
+"""
+import bisect
+import difflib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.functions import Upper
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+# set while the caller invalidates the names itself, see names_unchanged
+_names_muted = ContextVar('names_muted', default=False)
+
+
+class NameIndex:
+    '''the names of one user, sorted by their lowercase form'''
+
+    def __init__(self, rows, version):
+        self.entries = sorted((name.lower(), pk, name) for pk, name in rows)
+        self.keys = [entry[0] for entry in self.entries]
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def prefix(self, query, limit):
+        start = bisect.bisect_left(self.keys, query)
+        matches = []
+        for key, pk, name in self.entries[start:start + limit]:
+            if not key.startswith(query):
+                break
+            matches.append({'id': pk, 'name': name})
+        return matches
+
+    def fuzzy(self, query, limit, found):
+        '''names containing query, then the close ones (typos)'''
+        seen = {match['id'] for match in found}
+        matches = []
+        for key, pk, name in self.entries:
+            if pk not in seen and query in key:
+                matches.append({'id': pk, 'name': name})
+                seen.add(pk)
+        close = difflib.get_close_matches(query, self.keys, n=limit)
+        for key in close:
+            position = bisect.bisect_left(self.keys, key)
+            _, pk, name = self.entries[position]
+            if pk not in seen:
+                matches.append({'id': pk, 'name': name})
+                seen.add(pk)
+        return matches[:limit]
+
+
+class TooManyNames:
+    '''
+    Cached in place of the NameIndex of a user with more than
+    AUTOCOMPLETE_CACHE_MAX_NAMES names, so they are not counted again on
+    every keystroke while unchanged.
+    '''
+
+    def __init__(self, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+
+def _version_key(model, user_id):
+    return f'autocomplete:{model._meta.label_lower}:{user_id}'
+
+
+def invalidate_names(model, user_id):
+    '''
+    Drop the cached names of a user, here and, through the version in
+    AUTOCOMPLETE_VERSION_CACHE, in the other workers of the node.
+    '''
+    with _indexes_lock:
+        _indexes.pop((model._meta.label_lower, user_id), None)
+    caches[settings.AUTOCOMPLETE_VERSION_CACHE].set(
+        _version_key(model, user_id), time.time_ns(), None
+    )
+
+
+def invalidate_names_on_commit(model, user_id, using):
+    '''
+    invalidate_names once the transaction of using commits: before, a
+    worker could cache the names again from the rows not yet changed
+    '''
+    transaction.on_commit(partial(invalidate_names, model, user_id),
+                          using=using)
+
+
+def names_changed(sender, instance, **kwargs):
+    '''post_save and post_delete receiver of Tag and Ingredient'''
+    if _names_muted.get():
+        return
+    invalidate_names_on_commit(sender, instance.user_id, instance._state.db)
+
+
+@contextmanager
+def names_unchanged():
+    '''
+    Skip names_changed in this thread or task, for the bulk writes that
+    invalidate once for all their rows. Disconnecting the receiver would
+    skip it for the concurrent requests of the process as well.
+    '''
+    token = _names_muted.set(True)
+    try:
+        yield
+    finally:
+        _names_muted.reset(token)
+
+
+def name_index(queryset, user_id):
+    '''
+    The cached NameIndex of the names in queryset, loaded when missing,
+    changed or older than AUTOCOMPLETE_CACHE_SECONDS. None when the user
+    has too many names to keep in memory, cached as TooManyNames.
+    '''
+    model = queryset.model
+    key = (model._meta.label_lower, user_id)
+    version = caches[settings.AUTOCOMPLETE_VERSION_CACHE].get(
+        _version_key(model, user_id)
+    )
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if (
+            index is not None and index.version == version and
+            time.monotonic() - index.loaded_at <
+            settings.AUTOCOMPLETE_CACHE_SECONDS
+        ):
+            _indexes.move_to_end(key)
+            return index if isinstance(index, NameIndex) else None
+
+    max_names = settings.AUTOCOMPLETE_CACHE_MAX_NAMES
+    if queryset[max_names:max_names + 1].exists():
+        index = TooManyNames(version)
+    else:
+        index = NameIndex(queryset.values_list('id', 'name'), version)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > settings.AUTOCOMPLETE_CACHE_USERS:
+            _indexes.popitem(last=False)
+    return index if isinstance(index, NameIndex) else None
+
+
+def query_names(queryset, query, limit, fuzzy):
+    '''the database path, for users with too many names to cache'''
+    matches = list(
+        queryset.filter(name__istartswith=query)
+        .order_by(Upper('name'), 'id')
+        .values('id', 'name')[:limit]
+    )
+    if fuzzy and len(matches) < limit:
+        matches += queryset.filter(name__icontains=query).exclude(
+            id__in=[match['id'] for match in matches]
+        ).order_by(Upper('name'), 'id').values('id', 'name')[
+            :limit - len(matches)
+        ]
+    return matches
+
+
+def autocomplete(queryset, user_id, query, limit, fuzzy=False):
+    '''up to limit {id, name} of the names starting with query'''
+    query = query.strip().lower()
+    index = name_index(queryset, user_id)
+    if index is None:
+        return query_names(queryset, query, limit, fuzzy)
+
+    matches = index.prefix(query, limit)
+    if fuzzy and query and len(matches) < limit:
+        matches += index.fuzzy(query, limit - len(matches), matches)
+    return matches
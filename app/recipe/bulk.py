@@ -0,0 +1,67 @@
+"""
+Bulk delete and rename of the tags and ingredients of a user
+
+Each runs a fixed number of set based statements whatever the number of
+ids, instead of a request, a transaction and a cascade per row.
+"""
+from django.db import router, transaction
+from django.db.models import Case, Value, When
+
+from core.models import canonical_name, clean_name
+from recipe.autocomplete import invalidate_names_on_commit, names_unchanged
+
+
+def user_rows(model, user):
+    '''rows of user, on the database writes of model go to'''
+    using = router.db_for_write(model)
+    return model.objects.using(using).filter(user=user)
+
+
+def bulk_delete(model, user, ids):
+    '''
+    Delete the rows ids of user and their recipe links, a SELECT of the
+    ids and a DELETE per table. Returns the rows deleted, unknown ids are
+    ignored.
+    '''
+    rows = user_rows(model, user).filter(id__in=ids)
+    with transaction.atomic(using=rows.db), names_unchanged():
+        # the autocomplete invalidation is done once, not per row
+        _, deleted = rows.delete()
+        invalidate_names_on_commit(model, user.id, rows.db)
+    return deleted.get(model._meta.label, 0)
+
+
+def bulk_rename(model, user, names):
+    '''
+    Rename the rows of user from names, {id: name}, one UPDATE. Returns
+    the rows renamed. Call it in a transaction to undo partial renames.
+    '''
+    names = {pk: clean_name(name) for pk, name in names.items()}
+    rows = user_rows(model, user).filter(id__in=names)
+    renamed = rows.update(
+        name=Case(*[
+            When(id=pk, then=Value(name)) for pk, name in names.items()
+        ]),
+        canonical_name=Case(*[
+            When(id=pk, then=Value(canonical_name(name)))
+            for pk, name in names.items()
+        ]),
+    )
+    invalidate_names_on_commit(model, user.id, rows.db)
+    return renamed
+
+
+def rename_conflicts(model, user, names):
+    '''the names of names, {id: name}, held by other rows or repeated'''
+    canonical = {}
+    conflicts = set()
+    for pk, name in names.items():
+        key = canonical_name(name)
+        if key in canonical:
+            conflicts.add(name)
+        canonical[key] = name
+    taken = user_rows(model, user).filter(
+        canonical_name__in=canonical
+    ).exclude(id__in=names).values_list('canonical_name', flat=True)
+    conflicts.update(canonical[key] for key in taken)
+    return sorted(conflicts)
@@ -0,0 +1,38 @@
+"""
+comando django para juntar tags e ingredientes duplicados
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from core.models import Tag, Ingredient
+from recipe.merge import merge_duplicates
+
+
+class Command(BaseCommand):
+    '''Merge the tags and ingredients differing only by case and spaces'''
+
+    help = (
+        'Fill the canonical name of the tags and ingredients saved before '
+        'it existed, merging those sharing it into one and moving their '
+        'recipes. Run once after migrating, it can run while serving.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.MERGE_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        for using in settings.SHARD_DATABASES or ['default']:
+            for model in (Tag, Ingredient):
+                try:
+                    merged = merge_duplicates(
+                        model, using=using, batch_size=options['batch_size']
+                    )
+                except IntegrityError as exc:
+                    raise CommandError(f'{using}: {exc}')
+                self.stdout.write(
+                    f'{using}: merged {merged} '
+                    f'{model._meta.verbose_name_plural}'
+                )
@@ -0,0 +1,114 @@
+"""
+Merge of the tags and ingredients of a user into one of them
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Min
+
+from core.models import Recipe, canonical_name
+
+# rounds a canonical name may fail to be saved before merge_duplicates
+# gives up, a request saving it meanwhile only takes one
+MAX_SAVE_ROUNDS = 3
+
+
+def recipe_links(model):
+    '''the recipe m2m through model of model and its column to model'''
+    for field in Recipe._meta.many_to_many:
+        if field.related_model is model:
+            return field.remote_field.through, field.m2m_reverse_name()
+    raise ValueError(f'{model.__name__} is not attached to recipes')
+
+
+def merge(keep, duplicate_ids, batch_size=None):
+    '''
+    Move the recipes of the rows duplicate_ids, of the same user, to keep
+    and delete them. The through rows are repointed with set based
+    updates, a transaction per batch of recipes. Returns the rows merged.
+    '''
+    model = type(keep)
+    batch_size = batch_size or settings.MERGE_BATCH_SIZE
+    using = keep._state.db
+    through, column = recipe_links(model)
+    rows = model.objects.using(using)
+    duplicate_ids = list(
+        rows.filter(user_id=keep.user_id, id__in=duplicate_ids)
+        .exclude(id=keep.id).values_list('id', flat=True)
+    )
+    if not duplicate_ids:
+        return 0
+
+    links = through.objects.using(using)
+    moving = links.filter(**{f'{column}__in': duplicate_ids})
+    while True:
+        recipe_ids = list(
+            moving.order_by('recipe_id')
+            .values_list('recipe_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not recipe_ids:
+            break
+        with transaction.atomic(using=using):
+            batch = moving.filter(recipe_id__in=recipe_ids)
+            # a recipe links keep once: drop the links it already has
+            # to keep, then all but one of those to the duplicates
+            batch.filter(recipe_id__in=links.filter(
+                **{column: keep.id}
+            ).values('recipe_id')).delete()
+            batch.exclude(id__in=batch.values('recipe_id').annotate(
+                first=Min('id')
+            ).values('first')).delete()
+            batch.update(**{column: keep.id})
+
+    rows.filter(id__in=duplicate_ids).delete()
+    return len(duplicate_ids)
+
+
+def merge_duplicates(model, using='default', batch_size=None):
+    '''
+    Fill canonical_name of the rows saved before it existed, merging the
+    ones sharing a canonical name into the first of them. Returns the
+    rows merged.
+    '''
+    batch_size = batch_size or settings.MERGE_BATCH_SIZE
+    rows = model.objects.using(using)
+    merged = 0
+    failed_rounds = defaultdict(int)
+    while True:
+        legacy = list(
+            rows.filter(canonical_name__isnull=True).order_by('id')
+            [:batch_size]
+        )
+        if not legacy:
+            return merged
+
+        groups = defaultdict(list)
+        for row in legacy:
+            groups[row.user_id, canonical_name(row.name)].append(row)
+        keeps = {
+            (row.user_id, row.canonical_name): row
+            for row in rows.filter(
+                user_id__in={user_id for user_id, _ in groups},
+                canonical_name__in={name for _, name in groups},
+            )
+        }
+        for key, group in groups.items():
+            keep = keeps.get(key)
+            if keep is None:
+                keep = group.pop(0)
+                try:
+                    with transaction.atomic(using=using):
+                        keep.save(using=using)
+                except IntegrityError as exc:
+                    # saved meanwhile by a request, merged next round
+                    failed_rounds[key] += 1
+                    if failed_rounds[key] >= MAX_SAVE_ROUNDS:
+                        raise IntegrityError(
+                            f'{model.__name__} {keep.id} could not be saved '
+                            f'as {key[1]!r} in {MAX_SAVE_ROUNDS} rounds: '
+                            f'{exc}'
+                        ) from exc
+                    continue
+            merged += merge(keep, [row.id for row in group], batch_size)
@@ -1,10 +1,11 @@
 '''
 Recipe serializers
 '''
+from django.db.models import F, Q
 from django.template.base import tag_re
 from rest_framework import serializers
 
-from core.models import (Recipe, Tag, Ingredient)
+from core.models import (Recipe, Tag, Ingredient, canonical_name, clean_name)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -22,6 +23,35 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
 
+
+# ids taken by one merge or bulk request
+MAX_BULK_IDS = 1000
+
+
+class IdListSerializer(serializers.Serializer):
+    '''ids of the tags or ingredients a merge or bulk action works on'''
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=MAX_BULK_IDS,
+    )
+
+
+class RenameSerializer(serializers.Serializer):
+    '''new name of one tag or ingredient'''
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=255)
+
+
+class BulkRenameSerializer(serializers.Serializer):
+    '''new names of tags or ingredients, renamed together'''
+    items = serializers.ListField(
+        child=RenameSerializer(),
+        allow_empty=False,
+        max_length=MAX_BULK_IDS,
+    )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     '''Serializer for recipes'''
     tags = TagSerializer(many=True, required=False)
@@ -33,27 +63,41 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'link', 'tags', 'ingredients']
         read_only_fields = ['id']  # this way the user can't change the id
 
+    def _get_or_create_attr(self, model, fields):
+        '''
+        The tag or ingredient of the user with the canonical name of
+        fields['name'], else a row saved before canonical_name existed
+        (NULL until merge_duplicate_names fills it) with the same name,
+        else a new one.
+        '''
+        auth_user = self.context['request'].user
+        name = canonical_name(fields['name'])
+        obj = model.objects.filter(
+            Q(canonical_name=name) |
+            Q(canonical_name__isnull=True,
+              name__iexact=clean_name(fields['name'])),
+            user=auth_user,
+        ).order_by(F('canonical_name').asc(nulls_last=True), 'id').first()
+        if obj is None:
+            obj, created = model.objects.get_or_create(
+                user=auth_user, canonical_name=name, defaults=fields,
+            )
+        return obj
+
     def _get_or_create_tags(self,tags, recipe):
         '''Handle getting or creating tags as neeeded'''
-        auth_user = self.context['request'].user
         # get the tag from the db if it exists if not create a new one
         # with **tag we can make the code foolprof, if we add new variables to the tags
         # it won't break the code
+        # "Salt", "salt " and "SALT" are the same tag, see canonical_name
         for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
+            tag_obj = self._get_or_create_attr(Tag, tag)
             recipe.tags.add(tag_obj)
 
     def _get_or_create_ingredients(self,ingredients, recipe):
         '''Handle getting or creating a new ingredient as needed'''
-        auth_user = self.context['request'].user
         for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
+            ingredient_obj = self._get_or_create_attr(Ingredient, ingredient)
             recipe.ingredients.add(ingredient_obj)
 
     def create(self, validated_data):
@@ -14,10 +14,12 @@ from rest_framework.test import APIClient
 
 from core.models import (Ingredient, Recipe)
 
+from recipe import autocomplete
 from recipe.serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 def create_user(email='user@example.com', password='testpass123'):
     '''Create and return a user'''
@@ -139,11 +141,14 @@ class PrivateIngredientsAPITests(TestCase):
 
         self.assertEqual(len(res.data), 1)
 
+    def test_autocomplete_ingredients(self):
+        '''test autocomplete sees an ingredient created after caching'''
+        autocomplete._indexes.clear()
+        Ingredient.objects.create(user=self.user, name='Salt')
+        self.client.get(AUTOCOMPLETE_URL, {'q': 's'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(user=self.user, name='Sugar')
 
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 's'})
 
-
-
-
-
-
-
+        self.assertEqual([i['name'] for i in res.data], ['Salt', 'Sugar'])
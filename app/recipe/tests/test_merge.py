@@ -0,0 +1,76 @@
+'''
+Tests for merging duplicate tags and ingredients
+'''
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase
+
+from core.models import Recipe, Tag, Ingredient
+
+
+class MergeDuplicatesTests(TestCase):
+    '''Test the merge_duplicate_names command'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+
+    def _legacy(self, model, name):
+        '''a row saved before canonical_name existed'''
+        row = model.objects.create(user=self.user, name='placeholder')
+        model.objects.filter(id=row.id).update(
+            name=name, canonical_name=None
+        )
+        return model.objects.get(id=row.id)
+
+    def test_duplicates_merged(self):
+        salts = [
+            self._legacy(Ingredient, name)
+            for name in ['Salt', 'salt ', 'SALT', 'Pepper']
+        ]
+        self.recipe.ingredients.add(*salts[1:])
+
+        out = StringIO()
+        call_command('merge_duplicate_names', '--batch-size', '2',
+                     stdout=out)
+
+        self.assertIn('default: merged 2 ingredients', out.getvalue())
+        names = Ingredient.objects.order_by('id').values_list(
+            'name', 'canonical_name'
+        )
+        self.assertEqual(
+            list(names), [('Salt', 'salt'), ('Pepper', 'pepper')]
+        )
+        self.assertEqual(
+            sorted(self.recipe.ingredients.values_list('name', flat=True)),
+            ['Pepper', 'Salt'],
+        )
+
+    def test_merged_into_canonical_row(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        legacy = self._legacy(Tag, ' vegan')
+        self.recipe.tags.add(legacy)
+
+        call_command('merge_duplicate_names', stdout=StringIO())
+
+        self.assertEqual(list(Tag.objects.all()), [tag])
+        self.assertEqual(list(self.recipe.tags.all()), [tag])
+
+    def test_gives_up_on_a_name_never_saved(self):
+        self._legacy(Tag, 'Vegan')
+        self._legacy(Tag, 'vegan')
+
+        with patch.object(Tag, 'save', side_effect=IntegrityError('taken')):
+            with self.assertRaisesMessage(CommandError, 'in 3 rounds'):
+                call_command('merge_duplicate_names', stdout=StringIO())
@@ -9,7 +9,10 @@ import os
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -202,6 +205,21 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
 
+    def test_delete_recipe_statements_bounded(self):
+        '''the cascade of a recipe is its links, deleted by set'''
+        def delete_queries(links):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(*[
+                Tag.objects.create(user=self.user, name=f'Tag {links} {i}')
+                for i in range(links)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                self.client.delete(detail_url(recipe.id))
+            self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+            return len(queries)
+
+        self.assertEqual(delete_queries(1), delete_queries(50))
+
     def test_delete_recipe_other_users_recipe_error(self):
         '''test trying to detele another users recipe gives error'''
         new_user = create_user(email='user2@example.com', password='test@pass123')
@@ -259,6 +277,43 @@ class PrivateRecipeAPITests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_with_tag_spelled_differently(self):
+        '''test a tag differing by case and spaces is the existing one'''
+        tag = Tag.objects.create(user=self.user, name='Indian')
+        payload = {
+            'title': 'pongal',
+            'time_minutes': 80,
+            'price': Decimal('4.50'),
+            'tags': [{'name': ' INDIAN '}],
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(list(recipe.tags.all()), [tag])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_recipe_with_legacy_ingredient(self):
+        '''test an ingredient saved before canonical_name is reused'''
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.filter(id=ingredient.id).update(
+            canonical_name=None
+        )
+        payload = {
+            'title': 'pongal',
+            'time_minutes': 80,
+            'price': Decimal('4.50'),
+            'ingredients': [{'name': 'SALT'}],
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(list(recipe.ingredients.all()), [ingredient])
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 1
+        )
+
     def test_create_tag_on_update(self):
         '''test creating tag when updating a  recipe'''
         recipe = create_recipe(user=self.user)
@@ -434,6 +489,52 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_filter_by_time_and_price_range(self):
+        '''test filtering recipes by min/max time and price'''
+        quick = create_recipe(user=self.user, time_minutes=15,
+                              price=Decimal('8.00'))
+        slow = create_recipe(user=self.user, time_minutes=90,
+                             price=Decimal('8.00'))
+        pricey = create_recipe(user=self.user, time_minutes=20,
+                               price=Decimal('25.00'))
+
+        res = self.client.get(RECIPE_URL, {
+            'max_time_minutes': 30, 'max_price': '10',
+        })
+
+        ids = [recipe['id'] for recipe in res.data]
+        self.assertEqual(ids, [quick.id])
+
+        res = self.client.get(RECIPE_URL, {
+            'min_time_minutes': 20, 'min_price': '8.00',
+        })
+
+        ids = [recipe['id'] for recipe in res.data]
+        self.assertEqual(sorted(ids), sorted([slow.id, pricey.id]))
+
+    def test_ordering(self):
+        '''test ordering recipes by a whitelisted field'''
+        r1 = create_recipe(user=self.user, time_minutes=30)
+        r2 = create_recipe(user=self.user, time_minutes=10)
+        r3 = create_recipe(user=self.user, time_minutes=30)
+
+        res = self.client.get(RECIPE_URL, {'ordering': 'time_minutes'})
+        self.assertEqual([r['id'] for r in res.data], [r2.id, r1.id, r3.id])
+
+        res = self.client.get(RECIPE_URL, {'ordering': '-time_minutes'})
+        self.assertEqual([r['id'] for r in res.data], [r3.id, r1.id, r2.id])
+
+    def test_invalid_ordering_and_range_rejected(self):
+        '''test unknown orderings and bad numbers return 400'''
+        res = self.client.get(RECIPE_URL, {'ordering': 'description'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', res.data)
+
+        res = self.client.get(RECIPE_URL, {'min_price': 'cheap'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('min_price', res.data)
+
+
 class ImageUploadTest(TestCase):
 
     def setUp(self):
@@ -473,6 +574,59 @@ class ImageUploadTest(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def _upload_image(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file}, format='multipart',
+            )
+        self.recipe.refresh_from_db()
+        return self.recipe.image.url
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_URL='/protected-media/')
+    def test_image_sent_by_proxy(self):
+        '''the owner gets an internal redirect, cached forever'''
+        url = self._upload_image()
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            '/protected-media/' + self.recipe.image.name,
+        )
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Cache-Control'], settings.MEDIA_CACHE_CONTROL)
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_URL='')
+    def test_image_sent_by_django(self):
+        '''without the proxy the file comes from Django'''
+        url = self._upload_image()
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with self.recipe.image.open('rb') as image_file:
+            self.assertEqual(b''.join(res.streaming_content),
+                             image_file.read())
+
+    def test_image_of_other_user_not_found(self):
+        '''only the owner of the recipe gets its image'''
+        url = self._upload_image()
+        other = create_user(email='other@example.com', password='test123')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(None)
+        res = self.client.get(url, HTTP_ACCEPT='image/*')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 
 
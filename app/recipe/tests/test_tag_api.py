@@ -3,9 +3,10 @@ Tests for tag api
 """
 
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
@@ -13,9 +14,18 @@ from rest_framework.test import APIClient
 
 from core.models import (Tag, Recipe)
 
+from recipe import autocomplete
+from recipe.bulk import bulk_delete
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+BULK_DELETE_URL = reverse('recipe:tag-bulk-delete')
+BULK_RENAME_URL = reverse('recipe:tag-bulk-rename')
+
+def merge_url(tag_id):
+    return reverse('recipe:tag-merge', args=[tag_id])
+
 
 def detail_url(tag_id):
     '''create and return a tag detail url.'''
@@ -141,3 +151,247 @@ class PrivateTagsAPITest(TestCase):
 
 
 
+
+
+class TagAutocompleteApiTests(TestCase):
+    '''Test the tag autocomplete action'''
+
+    def setUp(self):
+        autocomplete._indexes.clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ['Vegan', 'Vegetarian', 'Dessert', 'Breakfast']:
+            Tag.objects.create(user=self.user, name=name)
+
+    def test_prefix_matches(self):
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'VEG'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Vegan', 'Vegetarian'])
+
+    def test_limit(self):
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 've', 'limit': 1})
+
+        self.assertEqual([tag['name'] for tag in res.data], ['Vegan'])
+
+    def test_fuzzy_matches(self):
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'ssert', 'fuzzy': 1})
+
+        self.assertEqual([tag['name'] for tag in res.data], ['Dessert'])
+
+    def test_limited_to_user(self):
+        other = create_user(email='other@example.com')
+        Tag.objects.create(user=other, name='Vegetables')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertNotIn('Vegetables', [tag['name'] for tag in res.data])
+
+    def test_cache_invalidated_on_rename(self):
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+        tag = Tag.objects.get(name='Dessert')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url(tag.id), {'name': 'Vegetable soup'})
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertIn('Vegetable soup', [tag['name'] for tag in res.data])
+
+    def test_cache_invalidated_on_commit(self):
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.filter(name='Dessert').get().delete()
+            # not committed, another worker could cache the old names again
+            self.assertIn(('core.tag', self.user.id), autocomplete._indexes)
+
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotIn(('core.tag', self.user.id), autocomplete._indexes)
+
+    @override_settings(AUTOCOMPLETE_CACHE_MAX_NAMES=2)
+    def test_too_many_names_queries_database(self):
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Vegan', 'Vegetarian'])
+        index = autocomplete._indexes[('core.tag', self.user.id)]
+        self.assertIsInstance(index, autocomplete.TooManyNames)
+
+    @override_settings(AUTOCOMPLETE_CACHE_MAX_NAMES=2)
+    def test_too_many_names_not_loaded_again(self):
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        # only the prefix query, the names are not counted again
+        with self.assertNumQueries(1):
+            res = self.client.get(AUTOCOMPLETE_URL, {'q': 'dess'})
+
+        self.assertEqual([tag['name'] for tag in res.data], ['Dessert'])
+
+
+class TagMergeApiTests(TestCase):
+    '''Test merging tags'''
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_merge_moves_recipes(self):
+        keep = Tag.objects.create(user=self.user, name='Vegan')
+        duplicate = Tag.objects.create(user=self.user, name='Plant based')
+        both = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+        both.tags.add(keep, duplicate)
+        only_duplicate = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+        only_duplicate.tags.add(duplicate)
+
+        res = self.client.post(
+            merge_url(keep.id), {'ids': [duplicate.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['name'], 'Vegan')
+        self.assertFalse(Tag.objects.filter(id=duplicate.id).exists())
+        self.assertEqual(list(both.tags.all()), [keep])
+        self.assertEqual(list(only_duplicate.tags.all()), [keep])
+
+    def test_merge_other_user_tag_rejected(self):
+        keep = Tag.objects.create(user=self.user, name='Vegan')
+        other = Tag.objects.create(
+            user=create_user(email='other@example.com'), name='Vegan'
+        )
+
+        res = self.client.post(
+            merge_url(keep.id), {'ids': [other.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Tag.objects.filter(id=other.id).exists())
+
+    def test_rename_to_existing_name_rejected(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'vegan '})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_concurrent_rename_to_same_name_rejected(self):
+        '''the name taken between the check and the save'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+
+        with patch('recipe.views.canonical_name', return_value='not yet'):
+            res = self.client.patch(detail_url(tag.id), {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dessert')
+
+
+class TagBulkApiTests(TestCase):
+    '''Test the bulk delete and rename of tags'''
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Vegan', 'Dessert', 'Breakfast']
+        ]
+        self.other_tag = Tag.objects.create(
+            user=create_user(email='other@example.com'), name='Vegan'
+        )
+
+    def test_bulk_delete(self):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+        recipe.tags.add(*self.tags)
+        ids = [self.tags[0].id, self.tags[1].id, self.other_tag.id]
+
+        res = self.client.post(BULK_DELETE_URL, {'ids': ids}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'deleted': 2})
+        self.assertEqual(list(recipe.tags.all()), [self.tags[2]])
+        self.assertTrue(Tag.objects.filter(id=self.other_tag.id).exists())
+
+    def test_bulk_delete_statements(self):
+        '''test the statements don't grow with the ids'''
+        # the ids, the two DELETEs, in a savepoint under TestCase
+        with self.assertNumQueries(5), \
+                self.captureOnCommitCallbacks() as callbacks:
+            bulk_delete(Tag, self.user, [tag.id for tag in self.tags])
+
+        # one autocomplete invalidation, not one per row
+        self.assertEqual(len(callbacks), 1)
+
+    def test_bulk_rename(self):
+        items = [
+            {'id': self.tags[0].id, 'name': 'Plant based'},
+            {'id': self.tags[1].id, 'name': ' Sweets '},
+        ]
+
+        res = self.client.post(BULK_RENAME_URL, {'items': items},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'renamed': 2})
+        names = Tag.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            list(names.values_list('name', 'canonical_name')),
+            [('Plant based', 'plant based'), ('Sweets', 'sweets'),
+             ('Breakfast', 'breakfast')],
+        )
+
+    def test_bulk_rename_conflict_rejected(self):
+        items = [{'id': self.tags[0].id, 'name': 'breakfast'}]
+
+        res = self.client.post(BULK_RENAME_URL, {'items': items},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.tags[0].refresh_from_db()
+        self.assertEqual(self.tags[0].name, 'Vegan')
+
+    def test_concurrent_bulk_rename_conflict_rejected(self):
+        '''the name taken between the check and the UPDATE'''
+        items = [
+            {'id': self.tags[0].id, 'name': 'Plant based'},
+            {'id': self.tags[1].id, 'name': 'breakfast'},
+        ]
+
+        with patch('recipe.views.rename_conflicts', return_value=[]):
+            res = self.client.post(BULK_RENAME_URL, {'items': items},
+                                   format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('merge instead', res.data['items'][0])
+        self.tags[0].refresh_from_db()
+        self.assertEqual(self.tags[0].name, 'Vegan')
+
+    def test_bulk_rename_unknown_id_renames_nothing(self):
+        items = [
+            {'id': self.tags[0].id, 'name': 'Plant based'},
+            {'id': self.other_tag.id, 'name': 'Mine now'},
+        ]
+
+        res = self.client.post(BULK_RENAME_URL, {'items': items},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.tags[0].refresh_from_db()
+        self.other_tag.refresh_from_db()
+        self.assertEqual(self.tags[0].name, 'Vegan')
+        self.assertEqual(self.other_tag.name, 'Vegan')
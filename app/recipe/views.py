@@ -1,6 +1,12 @@
 """
 Veies for recipe API
 """
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, Http404, HttpResponse
 
 from drf_spectacular.utils import (
     extend_schema_view,
@@ -10,15 +16,49 @@ from drf_spectacular.utils import (
 )
 from rest_framework import (viewsets,
                             mixins,
+                            fields,
                             status)
 
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-from core.models import (Recipe, Tag, Ingredient)
+from core.models import (Recipe, Tag, Ingredient, canonical_name)
 from recipe import serializers
+from recipe.autocomplete import autocomplete
+from recipe.bulk import bulk_delete, bulk_rename, rename_conflicts, user_rows
+from recipe.merge import merge
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+NAME_TAKEN = 'You already have this name, merge into it instead.'
+
+# ordering parameter -> order_by, each served by an index on
+# (user, field, id), the id keeps pages stable between equal values
+RECIPE_ORDERINGS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'time_minutes': ('time_minutes', 'id'),
+    '-time_minutes': ('-time_minutes', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+
+# range parameters -> (lookup, serializer field validating the value)
+RECIPE_RANGE_FILTERS = {
+    'min_time_minutes': ('time_minutes__gte', fields.IntegerField()),
+    'max_time_minutes': ('time_minutes__lte', fields.IntegerField()),
+    'min_price': (
+        'price__gte', fields.DecimalField(max_digits=5, decimal_places=2)
+    ),
+    'max_price': (
+        'price__lte', fields.DecimalField(max_digits=5, decimal_places=2)
+    ),
+}
 
 
 @extend_schema_view(
@@ -33,7 +73,33 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Coma separated list of Ingredients IDs to filter'
-            )
+            ),
+            OpenApiParameter(
+                'min_time_minutes',
+                OpenApiTypes.INT,
+                description='Recipes taking at least this many minutes'
+            ),
+            OpenApiParameter(
+                'max_time_minutes',
+                OpenApiTypes.INT,
+                description='Recipes taking at most this many minutes'
+            ),
+            OpenApiParameter(
+                'min_price',
+                OpenApiTypes.DECIMAL,
+                description='Recipes costing at least this price'
+            ),
+            OpenApiParameter(
+                'max_price',
+                OpenApiTypes.DECIMAL,
+                description='Recipes costing at most this price'
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR,
+                enum=list(RECIPE_ORDERINGS),
+                description='Order of the recipes, newest first by default'
+            ),
         ]
     )
 )
@@ -50,6 +116,9 @@ class RecipeViewSets(viewsets.ModelViewSet):
     # permissão para usar, precisa estar authenticado
     permission_classes = [IsAuthenticated]
 
+    # rates in DEFAULT_THROTTLE_RATES, core.throttling
+    throttle_scopes = {'upload_image': 'upload'}
+
     def _params_to_ints(self, qs):
         '''convert a list of strings to Integers'''
         return [int(str_id) for str_id in qs.split(',')]
@@ -59,16 +128,47 @@ class RecipeViewSets(viewsets.ModelViewSet):
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
         queryset = self.queryset
+        # subqueries instead of joins, no DISTINCT to sort the rows for
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.filter(
+                id__in=Recipe.tags.through.objects.filter(
+                    tag_id__in=tag_ids
+                ).values('recipe_id')
+            )
         if ingredients:
             ingredients_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
+            queryset = queryset.filter(
+                id__in=Recipe.ingredients.through.objects.filter(
+                    ingredient_id__in=ingredients_ids
+                ).values('recipe_id')
+            )
+        queryset = queryset.filter(**self._range_filters())
+
+        ordering = self.request.query_params.get('ordering', '-id')
+        if ordering not in RECIPE_ORDERINGS:
+            raise ValidationError({'ordering': [
+                f'Choose one of {", ".join(RECIPE_ORDERINGS)}.'
+            ]})
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by(*RECIPE_ORDERINGS[ordering])
+
+    def _range_filters(self):
+        '''lookups of the min/max parameters given, validated'''
+        lookups, errors = {}, {}
+        for param, (lookup, field) in RECIPE_RANGE_FILTERS.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                lookups[lookup] = field.run_validation(value)
+            except ValidationError as exc:
+                errors[param] = exc.detail
+        if errors:
+            raise ValidationError(errors)
+        return lookups
 
 
     def get_serializer_class(self):
@@ -112,7 +212,34 @@ class RecipeViewSets(viewsets.ModelViewSet):
                 description='Filter by items assigned to recipes.',
             )
         ]
-    )
+    ),
+    autocomplete=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'q', OpenApiTypes.STR,
+                description='Beginning of the name, case insensitive',
+            ),
+            OpenApiParameter(
+                'limit', OpenApiTypes.INT,
+                description=f'Matches returned, at most '
+                            f'{AUTOCOMPLETE_MAX_LIMIT}',
+            ),
+            OpenApiParameter(
+                'fuzzy', OpenApiTypes.INT, enum=[0, 1],
+                description='Complete with names containing q or close to '
+                            'it when the prefix matches are not enough',
+            ),
+        ]
+    ),
+    merge=extend_schema(request=serializers.IdListSerializer),
+    bulk_delete=extend_schema(
+        request=serializers.IdListSerializer,
+        responses={200: OpenApiTypes.OBJECT},
+    ),
+    bulk_rename=extend_schema(
+        request=serializers.BulkRenameSerializer,
+        responses={200: OpenApiTypes.OBJECT},
+    ),
 )
 class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
                   mixins.UpdateModelMixin,
@@ -124,6 +251,13 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    # rates in DEFAULT_THROTTLE_RATES, core.throttling
+    throttle_scopes = {
+        'merge': 'bulk',
+        'bulk_delete': 'bulk',
+        'bulk_rename': 'bulk',
+    }
+
     def get_queryset(self):
         '''Retrive data for authenticated user'''
 
@@ -136,6 +270,101 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
 
         return queryset.filter(user=self.request.user).order_by('-name').distinct()
 
+    # typeahead: served from a per user cache of the names (autocomplete)
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        '''Names of the user starting with q'''
+        try:
+            limit = int(request.query_params.get(
+                'limit', AUTOCOMPLETE_DEFAULT_LIMIT
+            ))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+        fuzzy = request.query_params.get('fuzzy') == '1'
+
+        matches = autocomplete(
+            self.queryset.filter(user=request.user),
+            request.user.id,
+            request.query_params.get('q', ''),
+            limit,
+            fuzzy=fuzzy,
+        )
+        return Response(matches)
+
+    def perform_update(self, serializer):
+        '''Rename, unless the user has the name already'''
+        name = serializer.validated_data.get('name')
+        if name is not None and self.queryset.filter(
+            user=self.request.user, canonical_name=canonical_name(name)
+        ).exclude(id=serializer.instance.id).exists():
+            raise ValidationError({'name': [NAME_TAKEN]})
+        try:
+            with transaction.atomic(using=serializer.instance._state.db):
+                serializer.save()
+        except IntegrityError:
+            # taken by a concurrent request since the check above
+            raise ValidationError({'name': [NAME_TAKEN]})
+
+    @action(methods=['POST'], detail=True, url_path='merge')
+    def merge(self, request, pk=None):
+        '''Move the recipes of ids to this one and delete them'''
+        keep = self.get_object()
+        serializer = serializers.IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids']) - {keep.id}
+        found = self.queryset.filter(user=request.user, id__in=ids).count()
+        if found != len(ids):
+            raise ValidationError({'ids': ['Unknown ids.']})
+
+        merge(keep, ids)
+        return Response(self.get_serializer(keep).data)
+
+    @action(methods=['POST'], detail=False, url_path='bulk_delete')
+    def bulk_delete(self, request):
+        '''Delete the ids of the user, unknown ones are ignored'''
+        serializer = serializers.IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        deleted = bulk_delete(
+            self.queryset.model, request.user,
+            serializer.validated_data['ids'],
+        )
+        return Response({'deleted': deleted})
+
+    @action(methods=['POST'], detail=False, url_path='bulk_rename')
+    def bulk_rename(self, request):
+        '''Rename items of the user, all of them or none'''
+        serializer = serializers.BulkRenameSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+        names = {item['id']: item['name'] for item in items}
+        if len(names) != len(items):
+            raise ValidationError({'items': ['Each id can appear once.']})
+
+        model = self.queryset.model
+        conflicts = rename_conflicts(model, request.user, names)
+        if conflicts:
+            raise self._rename_conflict(conflicts)
+        try:
+            with transaction.atomic(using=user_rows(model, request.user).db):
+                renamed = bulk_rename(model, request.user, names)
+                if renamed != len(names):
+                    raise ValidationError({'items': ['Unknown ids.']})
+        except IntegrityError:
+            # a name taken by a concurrent request since the check above
+            raise self._rename_conflict(
+                rename_conflicts(model, request.user, names) or
+                sorted(names.values())
+            )
+        return Response({'renamed': renamed})
+
+    def _rename_conflict(self, conflicts):
+        return ValidationError({'items': [
+            f'You already have {", ".join(conflicts)}, merge instead.'
+        ]})
+
+
 class TagViewsSet(BaseRecipeAttrViewSet):
     '''Manage Tags in the database'''
     serializer_class =  serializers.TagSerializer
@@ -147,3 +376,35 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
 
+
+class MediaView(APIView):
+    '''Recipe images, to the owner of the recipe only'''
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # browsers ask for image/*, the errors are still JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    @extend_schema(exclude=True)
+    def get(self, request, name):
+        if not Recipe.objects.filter(user=request.user, image=name).exists():
+            raise Http404
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+
+        if settings.MEDIA_ACCEL_REDIRECT_URL:
+            # nginx sends the file, see proxy/default.conf.tpl
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = \
+                settings.MEDIA_ACCEL_REDIRECT_URL + quote(name)
+        else:
+            storage = Recipe._meta.get_field('image').storage
+            try:
+                response = FileResponse(
+                    storage.open(name), content_type=content_type
+                )
+            except FileNotFoundError:
+                raise Http404
+        response['Cache-Control'] = settings.MEDIA_CACHE_CONTROL
+        return response
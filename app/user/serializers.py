@@ -10,10 +10,26 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+
+class CanonicalEmailField(serializers.EmailField):
+    """email in the canonical form the users are stored with"""
+
+    def to_internal_value(self, data):
+        email = super().to_internal_value(data)
+        return get_user_model().objects.normalize_email(email)
+
 
 class UserSerializer(serializers.ModelSerializer):
     '''serializer for the user object.'''
 
+    # normalized before the unique check, so it hits the email index
+    email = CanonicalEmailField(
+        max_length=255,
+        validators=[UniqueValidator(queryset=get_user_model().objects.all())],
+    )
+
     # here we create the validation of the model, we want to use
     # we ensure we're using the model by setting the get_user_model()
     # and in the kwargs, we define, how the data must be, if it comes otherwise, it'll fail
@@ -50,6 +50,19 @@ class PublicUserApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_user_with_email_in_other_case_exists_error(self):
+        '''test emails differing only by case are the same user'''
+        create_user(email='test@example.com', password='test@1234')
+        payload = {
+            'email': 'Test@Example.com',
+            'password': 'test@1234',
+            'name': 'TestUser'
+        }
+
+        res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_password_too_short(self):
         '''Test if password is too short'''
         payload = {
@@ -81,6 +94,16 @@ class PublicUserApiTests(TestCase):
         res = self.client.post(CREATE_TOKEN, payload)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_create_token_email_case_insensitive(self):
+        '''test the login email matches whatever its case'''
+        create_user(email='Cleber@Example.com', password='supercleber123')
+
+        payload = {'email': 'CLEBER@example.COM', 'password': 'supercleber123'}
+        res = self.client.post(CREATE_TOKEN, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+
     def test_create_token_bad_credentials(self):
         '''teste erro for invalid credentials'''
         create_user(email='test@example.com', password='goodpass123', name='Ricardo')
@@ -1,13 +1,33 @@
 server{
     listen ${LISTEN_PORT};
 
-    location /static{
-        alias /vol/static;
+    # collectstatic wrote a .gz next to the compressible files
+    # (core.storage.CompressedManifestStaticFilesStorage)
+    location /static {
+        root /vol;
+        gzip_static on;
+        gzip_vary on;
+
+        # hashed names never get other content
+        location ~ "\.[0-9a-f]{12}\.\w+$" {
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
+    }
+
+    # the recipe images are not public, the app serves them at /api/media
+    location /static/media {
+        return 404;
+    }
+
+    # the app checks the owner and sends the file transfer back here with
+    # X-Accel-Redirect (MEDIA_ACCEL_REDIRECT_URL), its Cache-Control kept
+    location /protected-media/ {
+        internal;
+        alias /vol/static/media/;
     }
 
     location / {
-        uwsgi_pass ${APP_HOST}:${APP_PORT};
-        include /etc/nginx/uwsgi_params;
+        include /etc/nginx/app_pass.conf;
         client_max_body_size 10M;
     }
 }
\ No newline at end of file
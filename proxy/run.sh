@@ -2,5 +2,9 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
-nginx -g 'daemon off;'
\ No newline at end of file
+# only our variables, the templates also use nginx ones ($host, ...)
+VARS='${LISTEN_PORT} ${APP_HOST} ${APP_PORT}'
+
+envsubst "$VARS" < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+envsubst "$VARS" < /etc/nginx/app_pass_${APP_SERVER}.conf.tpl > /etc/nginx/app_pass.conf
+nginx -g 'daemon off;'
@@ -0,0 +1,10 @@
+#!/bin/sh
+
+# docker healthcheck: is the app server of this container ready
+if [ "${APP_SERVER:-wsgi}" = "asgi" ]; then
+    PORT=9000
+else
+    PORT=9001
+fi
+
+wget -q -O /dev/null "http://127.0.0.1:${PORT}/health/ready"
@@ -2,11 +2,41 @@
 
 set -e
 
-python manage.py wait_for_db
-python manage.py collectstatic --noinput
+python manage.py wait_for_db --timeout "${WAIT_FOR_DB_TIMEOUT:-60}"
+
+# workers read the schema rendered here instead of generating it
+export SCHEMA_CACHE_DIR="${SCHEMA_CACHE_DIR:-/tmp/schema-cache}"
+
+# independent steps, run them side by side
+python manage.py collectstatic --noinput &
+COLLECTSTATIC_PID=$!
+python manage.py build_schema &
+BUILD_SCHEMA_PID=$!
 python manage.py migrate
+wait $COLLECTSTATIC_PID
+wait $BUILD_SCHEMA_PID
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+# APP_SERVER=asgi serves through uvicorn, the proxy must use the same mode.
+# uvicorn imports the app in each worker process, it can't preload it.
+# It reads the client address from X-Forwarded-For only for requests from
+# FORWARDED_ALLOW_IPS, the address of the proxy container: otherwise every
+# client is the proxy to the throttles and the replica pins. Not "*", it
+# would take the first address of the header, the one clients make up.
+# Port 9001 answers the health probes over http for uwsgi (healthcheck.sh).
+if [ "${APP_SERVER:-wsgi}" = "asgi" ]; then
+    uvicorn app.asgi:application --host 0.0.0.0 --port 9000 --workers 4 \
+        --proxy-headers --forwarded-allow-ips "${FORWARDED_ALLOW_IPS:-127.0.0.1}" \
+        --no-access-log
+else
+    # the master loads the app before forking so workers share its memory
+    # copy-on-write, PRELOAD_APP=0 loads it in each worker instead
+    LAZY_APPS=""
+    if [ "${PRELOAD_APP:-1}" = "0" ]; then
+        LAZY_APPS="--lazy-apps"
+    fi
+    uwsgi --socket :9000 --http-socket :9001 --workers 4 --master \
+        --enable-threads --need-app $LAZY_APPS --module app.wsgi
+fi
 
 
 